@@ -0,0 +1,14 @@
+"""
+Offline Benchmarks
+
+Runs the real handlers against an in-process fake Telegram (latency,
+file sizes, FloodWait) and an in-memory MongoDB, and reports throughput,
+p50/p99 latency, RPC counts and DB operation counts per scenario.
+
+    python -m benchmarks                       # every scenario
+    python -m benchmarks save_restricted batch --iterations 50 --rpc-latency 0.02
+    python -m benchmarks --json > before.json  # compare runs around a change
+
+Needs the bot's own requirements (pyrofork etc.) but no network, bot token
+or database.
+"""
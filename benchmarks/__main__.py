@@ -0,0 +1,349 @@
+"""
+Benchmark runner: python -m benchmarks [scenario ...] [options]
+
+Each scenario drives one real handler (save, batch_text_handler,
+broadcast_command, login_handler, ...) end to end. The fake backends are
+swapped in where the bot creates its clients and its Mongo connection;
+nothing else in the handlers is patched.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import datetime
+
+# Handlers read these at import time; the values only have to parse
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "bench")
+os.environ.setdefault("BOT_TOKEN", "1:bench")
+os.environ.setdefault("LOOP_LAG_THRESHOLD", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_mongo import FakeMongoClient
+from benchmarks.fake_telegram import FakeTelegram, FakeClient, FakeMessage, make_user
+
+USER_ID = 777
+PRIVATE_CHAT = -1001000
+PUBLIC_CHAT = -1002000
+PUBLIC_USERNAME = "benchpublic"
+PROTECTED_CHAT = -1003000
+PROTECTED_USERNAME = "benchprotected"
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+class Harness:
+    def __init__(self, args):
+        self.args = args
+        self.world = None
+        self.mongo = None
+        self.bot = None
+
+    async def setup(self, flood_rate=0.0):
+        from database.db import db
+        import cantarella.transfer as transfer
+        import cantarella.clients as clients
+        import cantarella.session as session
+        import cantarella.jobs as jobs
+
+        self.world = FakeTelegram(
+            rpc_latency=self.args.rpc_latency,
+            bandwidth=self.args.bandwidth * 1024 * 1024,
+            flood_rate=flood_rate,
+            flood_seconds=self.args.flood_seconds,
+        )
+        messages = {i: ("document", self.args.file_size * 1024 * 1024) for i in range(1, 501)}
+        messages.update({i: ("text", 0) for i in range(501, 601)})
+        messages.update({i: ("photo", 300 * 1024) for i in range(601, 701)})
+        self.world.add_chat(PRIVATE_CHAT, messages, restricted=True)
+        self.world.add_chat(PUBLIC_CHAT, messages, username=PUBLIC_USERNAME, restricted=False)
+        self.world.add_chat(PROTECTED_CHAT, messages, username=PROTECTED_USERNAME, restricted=True)
+
+        self.mongo = FakeMongoClient()
+        db.reset(self.mongo)
+        db.vault.cache.clear()
+        from cantarella.peers import PEERS
+        from cantarella.access import CHAT_ACCESS
+        from cantarella.flight import DOWNLOADS, UPLOADS
+        from cantarella.filecache import MEDIA_CACHE, MediaCache
+        PEERS._known.clear()
+        CHAT_ACCESS._modes.clear()
+        CHAT_ACCESS._denied.clear()
+        DOWNLOADS.__init__()
+        UPLOADS.__init__()
+        MediaCache.__init__(MEDIA_CACHE)
+
+        # Every client the handlers construct talks to the same fake Telegram
+        def user_client(*args, **kwargs):
+            return FakeClient(self.world, user_id=USER_ID, is_bot=False)
+        for module in (clients, session):
+            module.Client = user_client
+        # Raw multi-session uploads need a real MTProto connection
+        transfer.PARALLEL_UPLOAD = False
+
+        # Anti-flood pacing between messages is a policy choice, not work; scale it
+        if not hasattr(jobs.CancelToken, "_bench_sleep"):
+            jobs.CancelToken._bench_sleep = jobs.CancelToken.sleep
+        scale = self.args.pacing
+
+        async def scaled_sleep(token, delay):
+            return await jobs.CancelToken._bench_sleep(token, delay * scale)
+        jobs.CancelToken.sleep = scaled_sleep
+
+        self.bot = FakeClient(self.world, user_id=1, is_bot=True)
+        await db.add_user(USER_ID, "Bench")
+        await db.set_session(USER_ID, "bench-session")
+        await db.add_premium(USER_ID, datetime.datetime.now() + datetime.timedelta(days=1))
+        self.world.rpc.clear()
+        self.mongo.stats.clear()
+
+    def incoming(self, text, user_id=USER_ID):
+        return FakeMessage(self.bot, user_id, self.world.next_id(), text=text, from_user=make_user(user_id))
+
+
+# ==========================================
+# Scenarios: each returns (handler coroutine per iteration, messages per iteration)
+# ==========================================
+
+async def save_public(h, i):
+    from cantarella.start import save
+    await save(h.bot, h.incoming(f"https://t.me/{PUBLIC_USERNAME}/{i % 500 + 1}"))
+    return 1
+
+
+async def save_protected_range(h, i):
+    from cantarella.start import save
+    first = (i * 10) % 490 + 1
+    await save(h.bot, h.incoming(f"https://t.me/{PROTECTED_USERNAME}/{first}-{first + 9}"))
+    return 10
+
+
+async def save_restricted(h, i):
+    from cantarella.start import save
+    await save(h.bot, h.incoming(f"https://t.me/c/{str(PRIVATE_CHAT)[4:]}/{i % 500 + 1}"))
+    return 1
+
+
+async def save_repeat_thumb(h, i):
+    """A user with a custom thumbnail re-saving the same few posts; each one is re-uploaded."""
+    from database.db import db
+    from cantarella.start import save
+    if i == 0:
+        await db.set_thumbnail(USER_ID, "bench-thumb")
+    await save(h.bot, h.incoming(f"https://t.me/c/{str(PRIVATE_CHAT)[4:]}/{i % 5 + 1}"))
+    return 1
+
+
+async def save_popular(h, i):
+    """The same restricted post sent by many users at once."""
+    from database.db import db
+    from cantarella.start import save
+    users = range(3000, 3000 + h.args.concurrency)
+    if i == 0:
+        for uid in users:
+            await db.add_user(uid, f"user{uid}")
+            await db.set_session(uid, "bench-session")
+            await db.add_premium(uid, datetime.datetime.now() + datetime.timedelta(days=1))
+        h.mongo.stats.clear()
+    link = f"https://t.me/c/{str(PRIVATE_CHAT)[4:]}/{i % 500 + 1}"
+    await asyncio.gather(*(save(h.bot, h.incoming(link, uid)) for uid in users))
+    return len(users)
+
+
+async def save_text(h, i):
+    from cantarella.start import save
+    await save(h.bot, h.incoming(f"https://t.me/c/{str(PRIVATE_CHAT)[4:]}/{501 + i % 100}"))
+    return 1
+
+
+async def save_range(h, i):
+    from cantarella.start import save
+    first = (i * 10) % 490 + 1
+    await save(h.bot, h.incoming(f"https://t.me/c/{str(PRIVATE_CHAT)[4:]}/{first}-{first + 9}"))
+    return 10
+
+
+async def batch(h, i):
+    from cantarella.batch import batch_text_handler, BATCH_STATE
+    first = (i * 10) % 490 + 1
+    BATCH_STATE[USER_ID] = {"step": "WAITING_LINK"}
+    await batch_text_handler(h.bot, h.incoming(f"https://t.me/c/{str(PRIVATE_CHAT)[4:]}/{first}"))
+    await batch_text_handler(h.bot, h.incoming("10"))
+    return 10
+
+
+async def batch_photos(h, i):
+    """A photo-heavy channel: small files where per-file overhead dominates."""
+    from cantarella.batch import batch_text_handler, BATCH_STATE
+    first = 601 + (i * 10) % 90
+    BATCH_STATE[USER_ID] = {"step": "WAITING_LINK"}
+    await batch_text_handler(h.bot, h.incoming(f"https://t.me/c/{str(PRIVATE_CHAT)[4:]}/{first}"))
+    await batch_text_handler(h.bot, h.incoming("10"))
+    return 10
+
+
+async def batch_bundle(h, i):
+    """The photo batch delivered as one archive upload instead of ten messages."""
+    from cantarella.batch import batch_text_handler, BATCH_STATE
+    first = 601 + (i * 10) % 90
+    BATCH_STATE[USER_ID] = {"step": "WAITING_LINK"}
+    await batch_text_handler(h.bot, h.incoming(f"https://t.me/c/{str(PRIVATE_CHAT)[4:]}/{first} bundle"))
+    await batch_text_handler(h.bot, h.incoming("10"))
+    return 10
+
+
+async def sync(h, i):
+    """A user mirroring a channel daily: each run picks up the posts added since the last one."""
+    from database.db import db
+    from cantarella.sync import sync_cmd
+    if i == 0:
+        # Already in sync with everything posted before the benchmark
+        await db.save_sync(USER_ID, PRIVATE_CHAT, last_id=max(h.world.chats[PRIVATE_CHAT]))
+    for _ in range(10):
+        h.world.post(PRIVATE_CHAT, "document", h.args.file_size * 1024 * 1024)
+    link = f"https://t.me/c/{str(PRIVATE_CHAT)[4:]}"
+    command = h.incoming(f"/sync {link}")
+    command.command = ["sync", link]
+    await sync_cmd(h.bot, command)
+    return 10
+
+
+async def broadcast(h, i):
+    from database.db import db
+    from cantarella.broadcast import broadcast_command
+    if i == 0:
+        for uid in range(2000, 2000 + h.args.users):
+            await db.add_user(uid, f"user{uid}")
+        h.mongo.stats.clear()
+    command = h.incoming("/broadcast")
+    command.reply_to_message = h.incoming("announcement", user_id=1)
+    await broadcast_command(h.bot, command)
+    return h.args.users + 1
+
+
+async def login(h, i):
+    from cantarella.session import login_start, login_handler, logout
+    uid = 50_000 + i
+    await login_start(h.bot, h.incoming("/login", uid))
+    await login_handler(h.bot, h.incoming("+10000000000", uid))
+    await login_handler(h.bot, h.incoming("1 2 3 4 5", uid))
+    await logout(h.bot, h.incoming("/logout", uid))
+    return 1
+
+
+SCENARIOS = {
+    "save_public": (save_public, 0.0),
+    "save_restricted": (save_restricted, 0.0),
+    "save_restricted_flood": (save_restricted, 0.05),
+    "save_popular": (save_popular, 0.0),
+    "save_repeat_thumb": (save_repeat_thumb, 0.0),
+    "save_text": (save_text, 0.0),
+    "save_range": (save_range, 0.0),
+    "save_protected_range": (save_protected_range, 0.0),
+    "batch": (batch, 0.0),
+    "batch_photos": (batch_photos, 0.0),
+    "batch_bundle": (batch_bundle, 0.0),
+    "sync": (sync, 0.0),
+    "broadcast": (broadcast, 0.0),
+    "login": (login, 0.0),
+}
+
+
+async def run_scenario(args, name):
+    scenario, flood_rate = SCENARIOS[name]
+    h = Harness(args)
+    await h.setup(flood_rate)
+    iterations = 1 if name == "broadcast" else args.iterations
+    latencies = []
+    messages = 0
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        messages += await scenario(h, i)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+
+    # Status pollers and other fire-and-forget tasks must not leak into the next scenario
+    current = asyncio.current_task()
+    leftovers = [t for t in asyncio.all_tasks() if t is not current]
+    for task in leftovers:
+        task.cancel()
+    await asyncio.gather(*leftovers, return_exceptions=True)
+
+    return {
+        "scenario": name,
+        "iterations": iterations,
+        "messages": messages,
+        "seconds": round(elapsed, 4),
+        "msgs_per_sec": round(messages / elapsed, 2) if elapsed else 0,
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "rpc_total": sum(h.world.rpc.values()),
+        "rpc_per_msg": round(sum(h.world.rpc.values()) / max(messages, 1), 2),
+        "db_total": sum(h.mongo.stats.values()),
+        "db_per_msg": round(sum(h.mongo.stats.values()) / max(messages, 1), 2),
+        "rpc": dict(h.world.rpc.most_common()),
+        "db": dict(h.mongo.stats.most_common()),
+    }
+
+
+def print_table(results):
+    header = f"{'scenario':<24}{'msgs':>6}{'msg/s':>9}{'p50 ms':>10}{'p99 ms':>10}{'rpc/msg':>9}{'db/msg':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['scenario']:<24}{r['messages']:>6}{r['msgs_per_sec']:>9}{r['p50_ms']:>10}{r['p99_ms']:>10}"
+              f"{r['rpc_per_msg']:>9}{r['db_per_msg']:>8}")
+    print()
+    for r in results:
+        rpc = ", ".join(f"{k}={v}" for k, v in r["rpc"].items())
+        db = ", ".join(f"{k}={v}" for k, v in r["db"].items())
+        print(f"{r['scenario']}\n  rpc: {rpc}\n  db:  {db}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Offline handler benchmarks")
+    parser.add_argument("scenarios", nargs="*", help=f"default: all of {', '.join(SCENARIOS)}")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--rpc-latency", type=float, default=0.005, help="seconds per fake RPC")
+    parser.add_argument("--bandwidth", type=float, default=50, help="fake transfer speed in MiB/s")
+    parser.add_argument("--file-size", type=int, default=5, help="size of each fake document in MiB")
+    parser.add_argument("--flood-seconds", type=int, default=1)
+    parser.add_argument("--users", type=int, default=200, help="recipients for the broadcast scenario")
+    parser.add_argument("--concurrency", type=int, default=10, help="simultaneous requesters in save_popular")
+    parser.add_argument("--pacing", type=float, default=0.0,
+                        help="scale for the handlers' sleeps between messages (1 = production pacing)")
+    parser.add_argument("--json", action="store_true", help="print raw results as JSON")
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    return args
+
+
+async def main(args):
+    results = []
+    workdir = os.getcwd()
+    # Handlers write status files and downloads relative to the working directory
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        os.chdir(tmp)
+        try:
+            for name in args.scenarios or SCENARIOS:
+                results.append(await run_scenario(args, name))
+        finally:
+            os.chdir(workdir)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
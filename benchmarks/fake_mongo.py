@@ -0,0 +1,194 @@
+"""In-memory stand-in for the slice of Motor that database/db.py uses."""
+
+import copy
+from collections import Counter
+
+
+_COMPARE = {
+    "$gt": lambda a, b: a is not None and a > b,
+    "$gte": lambda a, b: a is not None and a >= b,
+    "$lt": lambda a, b: a is not None and a < b,
+    "$lte": lambda a, b: a is not None and a <= b,
+    "$ne": lambda a, b: a != b,
+    "$in": lambda a, b: a in b,
+}
+
+
+def _matches(doc, query):
+    for key, expected in query.items():
+        if key == "$or":
+            if not any(_matches(doc, sub) for sub in expected):
+                return False
+            continue
+        value = doc.get(key)
+        if isinstance(expected, dict) and expected and all(op in _COMPARE for op in expected):
+            if not all(_COMPARE[op](value, arg) for op, arg in expected.items()):
+                return False
+        elif isinstance(value, list) and not isinstance(expected, list):
+            if expected not in value:
+                return False
+        elif value != expected:
+            return False
+    return True
+
+
+def _project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    keep = {k for k, v in projection.items() if v}
+    return {k: copy.deepcopy(v) for k, v in doc.items() if k in keep or k == "_id"}
+
+
+def _apply(doc, update):
+    for op, fields in update.items():
+        for key, value in fields.items():
+            if op == "$set":
+                doc[key] = copy.deepcopy(value)
+            elif op == "$unset":
+                doc.pop(key, None)
+            elif op == "$inc":
+                doc[key] = doc.get(key, 0) + value
+            elif op == "$addToSet":
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                current = doc.setdefault(key, [])
+                current.extend(item for item in items if item not in current)
+            elif op == "$push":
+                doc.setdefault(key, []).append(copy.deepcopy(value))
+            elif op == "$pull":
+                drop = value["$in"] if isinstance(value, dict) and "$in" in value else [value]
+                doc[key] = [item for item in doc.get(key, []) if item not in drop]
+            else:
+                raise NotImplementedError(f"fake mongo: {op}")
+
+
+class _Result:
+    def __init__(self, matched=0, deleted=0, inserted_id=None):
+        self.matched_count = self.modified_count = matched
+        self.deleted_count = deleted
+        self.inserted_id = inserted_id
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, key, direction=1):
+        self._docs.sort(key=lambda d: (d.get(key) is None, d.get(key)), reverse=direction < 0)
+        return self
+
+    def limit(self, n):
+        self._docs = self._docs[:n]
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._docs:
+            yield doc
+
+    async def to_list(self, length=None):
+        return self._docs[:length] if length else list(self._docs)
+
+
+class FakeCollection:
+    def __init__(self, stats, name):
+        self.name = name
+        self.docs = []
+        self.stats = stats
+        self._ids = 0
+
+    def _count(self, op):
+        self.stats[f"{self.name}.{op}"] += 1
+
+    async def find_one(self, query=None, projection=None):
+        self._count("find_one")
+        for doc in self.docs:
+            if _matches(doc, query or {}):
+                return _project(doc, projection)
+        return None
+
+    def find(self, query=None, projection=None):
+        self._count("find")
+        return FakeCursor([_project(d, projection) for d in self.docs if _matches(d, query or {})])
+
+    async def insert_one(self, doc):
+        self._count("insert_one")
+        self._ids += 1
+        doc = copy.deepcopy(doc)
+        doc.setdefault("_id", self._ids)
+        self.docs.append(doc)
+        return _Result(inserted_id=doc["_id"])
+
+    async def update_one(self, query, update, upsert=False):
+        self._count("update_one")
+        for doc in self.docs:
+            if _matches(doc, query):
+                _apply(doc, update)
+                return _Result(matched=1)
+        if upsert:
+            doc = {k: v for k, v in query.items() if not isinstance(v, dict)}
+            _apply(doc, update)
+            await self.insert_one(doc)
+        return _Result()
+
+    async def update_many(self, query, update, upsert=False):
+        self._count("update_many")
+        matched = [doc for doc in self.docs if _matches(doc, query)]
+        for doc in matched:
+            _apply(doc, update)
+        return _Result(matched=len(matched))
+
+    async def delete_one(self, query):
+        self._count("delete_one")
+        for doc in self.docs:
+            if _matches(doc, query):
+                self.docs.remove(doc)
+                return _Result(deleted=1)
+        return _Result()
+
+    async def delete_many(self, query):
+        self._count("delete_many")
+        before = len(self.docs)
+        self.docs = [doc for doc in self.docs if not _matches(doc, query)]
+        return _Result(deleted=before - len(self.docs))
+
+    async def count_documents(self, query):
+        self._count("count_documents")
+        return sum(1 for doc in self.docs if _matches(doc, query))
+
+    async def create_index(self, *args, **kwargs):
+        self._count("create_index")
+
+
+class FakeDatabase:
+    def __init__(self, stats):
+        self.stats = stats
+        self._collections = {}
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(self.stats, name)
+        return self._collections[name]
+
+    async def command(self, name):
+        self.stats[f"command.{name}"] += 1
+        return {"ok": 1}
+
+
+class FakeMongoClient:
+    """Drop-in for AsyncIOMotorClient; every operation is counted in .stats."""
+
+    def __init__(self):
+        self.stats = Counter()
+        self._databases = {}
+
+    def __getitem__(self, name):
+        if name not in self._databases:
+            self._databases[name] = FakeDatabase(self.stats)
+        return self._databases[name]
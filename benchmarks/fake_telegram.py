@@ -0,0 +1,358 @@
+"""
+In-process fake of the Pyrogram surface the handlers touch.
+
+One FakeTelegram holds the chats and counts every RPC; FakeClient objects
+(the bot and any user clients the handlers create) talk to it with a
+configurable per-call latency, transfer bandwidth and FloodWait rate.
+"""
+
+import io
+import os
+import random
+import asyncio
+import itertools
+from types import SimpleNamespace
+from collections import Counter
+from pyrogram import StopTransmission, raw, utils
+from pyrogram.errors import FloodWait, ChatForwardsRestricted
+
+MEDIA_KINDS = ("document", "video", "audio", "photo", "voice", "video_note", "sticker", "animation")
+CHUNK_SIZE = 1024 * 1024
+
+
+def make_user(user_id, name="Bench"):
+    return SimpleNamespace(
+        id=user_id, first_name=name, username=f"user{user_id}",
+        mention=f"[{name}](tg://user?id={user_id})", is_bot=False
+    )
+
+
+class FakeMedia(SimpleNamespace):
+    def __init__(self, kind, size, msg_id):
+        ext = {"photo": ".jpg", "audio": ".mp3", "voice": ".ogg"}.get(kind, ".mp4" if "video" in kind else ".bin")
+        super().__init__(
+            file_size=size, file_name=f"{kind}_{msg_id}{ext}", mime_type=None,
+            file_id=f"{kind}-{msg_id}", file_unique_id=f"u{kind}{msg_id}",
+            thumbs=None, duration=10, width=1280, height=720, title=None, performer=None
+        )
+
+
+class FakeMessage:
+    def __init__(self, client, chat_id, msg_id, text=None, kind=None, size=0, caption=None, from_user=None):
+        self._client = client
+        self.id = msg_id
+        self.chat = SimpleNamespace(id=chat_id, type=None)
+        self.from_user = from_user
+        self.text = text
+        self.caption = caption
+        self.entities = None
+        self.caption_entities = None
+        self.reply_to_message = None
+        self.empty = text is None and kind is None
+        for name in MEDIA_KINDS:
+            setattr(self, name, FakeMedia(kind, size, msg_id) if name == kind else None)
+        self.media = kind
+
+    def clone(self, client):
+        kind = self.media
+        size = getattr(self, kind).file_size if kind else 0
+        return FakeMessage(client, self.chat.id, self.id, self.text, kind, size, self.caption, self.from_user)
+
+    async def reply(self, text, **kwargs):
+        return await self._client.send_message(self.chat.id, text)
+
+    reply_text = reply
+
+    async def reply_photo(self, photo, caption=None, **kwargs):
+        return await self._client.send_message(self.chat.id, caption or "")
+
+    async def edit(self, text, **kwargs):
+        await self._client.world.call("edit_message_text")
+        self.text = text
+        return self
+
+    edit_text = edit
+
+    async def delete(self):
+        await self._client.world.call("delete_messages")
+
+    async def react(self, *args, **kwargs):
+        await self._client.world.call("send_reaction")
+
+    async def copy(self, chat_id, **kwargs):
+        return await self._client.copy_message(chat_id, self.chat.id, self.id)
+
+    async def download(self, file_name="downloads/", in_memory=False, progress=None, progress_args=()):
+        return await self._client.download_media(self, file_name=file_name, in_memory=in_memory,
+                                                 progress=progress, progress_args=progress_args)
+
+
+class FakeStorage:
+    """The peer table part of Pyrogram's storage, so the shared peer cache can be measured."""
+
+    def __init__(self, user_id):
+        self._user_id = user_id
+        self.peers = {}
+        self.usernames = {}
+
+    async def user_id(self):
+        return self._user_id
+
+    async def update_peers(self, peers):
+        # Same rows as Pyrofork's SQLiteStorage: (id, access_hash, type, username, phone_number)
+        for peer_id, access_hash, peer_type, username, phone_number in peers:
+            self.peers[peer_id] = (access_hash, peer_type)
+            if username:
+                self.usernames[username.lower()] = peer_id
+
+    async def update_usernames(self, usernames):
+        # One (peer_id, username) row per username; sqlite rejects anything else
+        for peer_id, username in usernames:
+            if not isinstance(peer_id, int) or not isinstance(username, str):
+                raise TypeError(f"usernames rows are (int, str), got ({peer_id!r}, {username!r})")
+            self.usernames[username.lower()] = peer_id
+
+
+class FakeTelegram:
+    def __init__(self, rpc_latency=0.005, bandwidth=50 * 1024 * 1024, flood_rate=0.0, flood_seconds=1,
+                 flood_methods=("get_messages", "copy_message", "download_media"), seed=1):
+        self.rpc_latency = rpc_latency
+        self.bandwidth = bandwidth
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.flood_methods = set(flood_methods)
+        self.random = random.Random(seed)
+        self.rpc = Counter()
+        self.bytes = Counter()
+        self.chats = {}
+        self.usernames = {}
+        self.restricted = set()
+        self._ids = itertools.count(10_000)
+
+    def add_chat(self, chat_id, messages, username=None, restricted=True):
+        """messages: {msg_id: (kind, size)} with kind 'text' or one of MEDIA_KINDS."""
+        self.chats[chat_id] = {}
+        for msg_id, (kind, size) in messages.items():
+            text = f"text {msg_id}" if kind == "text" else None
+            self.chats[chat_id][msg_id] = FakeMessage(None, chat_id, msg_id, text, None if kind == "text" else kind, size)
+        if username:
+            self.usernames[username] = chat_id
+        if restricted:
+            self.restricted.add(chat_id)
+
+    def post(self, chat_id, kind, size):
+        """Append a new message to a chat and return its id."""
+        messages = self.chats[chat_id]
+        msg_id = max(messages, default=0) + 1
+        messages[msg_id] = FakeMessage(None, chat_id, msg_id, f"text {msg_id}" if kind == "text" else None,
+                                       None if kind == "text" else kind, size)
+        return msg_id
+
+    def next_id(self):
+        return next(self._ids)
+
+    def resolve(self, chat):
+        return self.usernames.get(chat, chat)
+
+    async def call(self, method, seconds=None):
+        self.rpc[method] += 1
+        if method in self.flood_methods and self.random.random() < self.flood_rate:
+            raise FloodWait(value=self.flood_seconds)
+        await asyncio.sleep(self.rpc_latency if seconds is None else seconds)
+
+
+class FakeClient:
+    """Stands in for both the bot and user clients; `user` decides what a user client can see."""
+
+    def __init__(self, world, user_id=1, is_bot=True):
+        self.world = world
+        self.me = make_user(user_id, "BenchBot" if is_bot else "BenchUser")
+        self.me.is_bot = is_bot
+        self.is_connected = False
+        self.max_concurrent_transmissions = 5
+        self.storage = FakeStorage(user_id)
+
+    # -- lifecycle -------------------------------------------------
+    async def connect(self):
+        await self.world.call("connect")
+        self.is_connected = True
+
+    start = connect
+
+    async def disconnect(self):
+        await self.world.call("disconnect")
+        self.is_connected = False
+
+    stop = disconnect
+
+    async def get_me(self):
+        await self.world.call("get_me")
+        return self.me
+
+    async def resolve_peer(self, peer_id):
+        """Local lookup first, like Pyrogram; unknown chats cost a resolve RPC."""
+        storage = self.storage
+        if isinstance(peer_id, str):
+            name = peer_id.lower().lstrip("@")
+            if name not in storage.usernames:
+                await self.world.call("contacts.ResolveUsername")
+                storage.usernames[name] = self.world.resolve(peer_id)
+            peer_id = storage.usernames[name]
+        if peer_id not in storage.peers:
+            await self.world.call("channels.GetChannels" if str(peer_id).startswith("-100") else "users.GetUsers")
+            storage.peers[peer_id] = (abs(peer_id) * 7 + self.me.id, "channel")
+        access_hash, _ = storage.peers[peer_id]
+        if str(peer_id).startswith("-100"):
+            return raw.types.InputPeerChannel(channel_id=utils.get_channel_id(peer_id), access_hash=access_hash)
+        return raw.types.InputPeerUser(user_id=peer_id, access_hash=access_hash)
+
+    # -- login -----------------------------------------------------
+    async def send_code(self, phone_number):
+        await self.world.call("send_code")
+        return SimpleNamespace(phone_code_hash=f"hash-{phone_number}")
+
+    async def sign_in(self, phone_number, phone_code_hash, phone_code):
+        await self.world.call("sign_in")
+        return self.me
+
+    async def check_password(self, password):
+        await self.world.call("check_password")
+        return self.me
+
+    async def export_session_string(self):
+        await self.world.call("export_session_string")
+        return f"bench-session-{self.me.id}"
+
+    # -- messages --------------------------------------------------
+    def _new_message(self, chat_id, text=None, kind=None, size=0, caption=None):
+        return FakeMessage(self, chat_id, self.world.next_id(), text, kind, size, caption, self.me)
+
+    async def get_messages(self, chat_id, message_ids):
+        await self.resolve_peer(chat_id)
+        await self.world.call("get_messages")
+        chat = self.world.chats.get(self.world.resolve(chat_id), {})
+
+        def one(msg_id):
+            stored = chat.get(msg_id)
+            return FakeMessage(self, chat_id, msg_id) if stored is None else stored.clone(self)
+        if isinstance(message_ids, (list, tuple, range)):
+            return [one(msg_id) for msg_id in message_ids]
+        return one(message_ids)
+
+    async def get_chat(self, chat_id):
+        await self.resolve_peer(chat_id)
+        await self.world.call("get_chat")
+        resolved = self.world.resolve(chat_id)
+        username = next((name for name, peer in self.world.usernames.items() if peer == resolved), None)
+        return SimpleNamespace(id=resolved, title=f"Chat {resolved}", username=username)
+
+    async def get_chat_history(self, chat_id, limit=0):
+        await self.world.call("get_history")
+        chat = self.world.chats.get(self.world.resolve(chat_id), {})
+        for msg_id in sorted(chat, reverse=True)[:limit or None]:
+            yield chat[msg_id].clone(self)
+
+    async def get_discussion_message(self, chat_id, message_id):
+        await self.world.call("get_discussion_message")
+        return SimpleNamespace(chat=SimpleNamespace(id=self.world.resolve(chat_id)))
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        await self.resolve_peer(from_chat_id)
+        await self.world.call("copy_message")
+        source = self.world.resolve(from_chat_id)
+        if source in self.world.restricted:
+            raise ChatForwardsRestricted()
+        stored = self.world.chats.get(source, {}).get(message_id)
+        if stored is None:
+            return self._new_message(chat_id, text="")
+        copied = stored.clone(self)
+        copied.chat.id, copied.id = chat_id, self.world.next_id()
+        return copied
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self.world.call("send_message")
+        return self._new_message(chat_id, text=text)
+
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        await self.world.call("edit_message_text")
+
+    async def delete_messages(self, chat_id, message_ids, **kwargs):
+        await self.world.call("delete_messages")
+
+    # -- transfers -------------------------------------------------
+    async def _transfer(self, method, size, progress, progress_args):
+        await self.world.call(method, seconds=self.world.rpc_latency + size / self.world.bandwidth)
+        self.world.bytes[method] += size
+        if progress:
+            progress(size, size, *progress_args)
+
+    async def download_media(self, message, file_name="downloads/", progress=None, progress_args=(), in_memory=False, **kwargs):
+        if isinstance(message, str):
+            await self.world.call("download_media")
+            return None
+        media = getattr(message, message.media)
+        directory, name = os.path.split(file_name)
+        path = os.path.join(directory or "downloads", name or media.file_name)
+        try:
+            await self._transfer("download_media", media.file_size, progress, progress_args)
+        except StopTransmission:
+            return None
+        if in_memory:
+            buffer = io.BytesIO(bytes(media.file_size))
+            buffer.name = os.path.basename(path)
+            return buffer
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Sparse file: disk cost is not what we are measuring
+        with open(path, "wb") as f:
+            f.truncate(media.file_size)
+        return path
+
+    async def stream_media(self, message, offset=0, limit=0):
+        media = getattr(message, message.media)
+        total = -(-media.file_size // CHUNK_SIZE)
+        end = total if not limit else min(total, offset + limit)
+        for index in range(offset, end):
+            await self.world.call("get_file", seconds=self.world.rpc_latency + CHUNK_SIZE / self.world.bandwidth)
+            size = min(CHUNK_SIZE, media.file_size - index * CHUNK_SIZE)
+            self.world.bytes["get_file"] += size
+            yield bytes(size)
+
+    async def _send_media(self, method, kind, chat_id, path, caption=None, progress=None, progress_args=(), **kwargs):
+        if isinstance(path, io.BytesIO):
+            size = path.getbuffer().nbytes
+        else:
+            size = os.path.getsize(path) if isinstance(path, str) and os.path.exists(path) else 0
+        try:
+            await self._transfer(method, size, progress, progress_args)
+        except StopTransmission:
+            return None
+        return self._new_message(chat_id, kind=kind, size=size, caption=caption)
+
+    async def send_document(self, chat_id, document, **kwargs):
+        return await self._send_media("send_document", "document", chat_id, document, **kwargs)
+
+    async def send_video(self, chat_id, video, **kwargs):
+        return await self._send_media("send_video", "video", chat_id, video, **kwargs)
+
+    async def send_audio(self, chat_id, audio, **kwargs):
+        return await self._send_media("send_audio", "audio", chat_id, audio, **kwargs)
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        return await self._send_media("send_photo", "photo", chat_id, photo, **kwargs)
+
+    async def send_voice(self, chat_id, voice, **kwargs):
+        return await self._send_media("send_voice", "voice", chat_id, voice, **kwargs)
+
+    async def send_video_note(self, chat_id, video_note, **kwargs):
+        return await self._send_media("send_video_note", "video_note", chat_id, video_note, **kwargs)
+
+    async def send_animation(self, chat_id, animation, **kwargs):
+        return await self._send_media("send_animation", "animation", chat_id, animation, **kwargs)
+
+    async def send_sticker(self, chat_id, sticker, **kwargs):
+        await self.world.call("send_sticker")
+        return self._new_message(chat_id, kind="sticker")
+
+    async def send_cached_media(self, chat_id, file_id, caption=None, **kwargs):
+        await self.world.call("send_cached_media")
+        return self._new_message(chat_id, kind="document", caption=caption)
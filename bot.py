@@ -2,17 +2,21 @@ import asyncio
 import datetime
 import sys
 import os
+import time
+import pkgutil
+import importlib
 from datetime import timezone, timedelta
 from pyrogram import Client, filters, enums, __version__ as pyrogram_version
 from pyrogram.types import Message, BotCommand
 from pyrogram.errors import FloodWait, RPCError
-from config import API_ID, API_HASH, BOT_TOKEN, LOG_CHANNEL, ADMINS
+from config import API_ID, API_HASH, BOT_TOKEN, LOG_CHANNEL, ADMINS, PROFILE_STARTUP, LOOP_LAG_THRESHOLD
 from database.db import db
 from logger import LOGGER
+from metrics import RPC_SECONDS
 
-# Keep-alive server (Render / Heroku)
+# Keep-alive / health server (Render / Heroku)
 try:
-    from keep_alive import keep_alive
+    from keep_alive import keep_alive, mark_ready
 except ImportError:
     keep_alive = None
 
@@ -32,6 +36,45 @@ LOGO = r"""
 """
 
 
+def profile_plugin_imports(root="cantarella"):
+    """
+    Import every plugin module up front and log how long each one took.
+    A module's time includes whatever it imported first, so the slowest
+    entries point at the heavy dependencies. bot.py imports no plugin at
+    module level, so none of them is already loaded when this runs.
+    Pyrogram reuses the loaded modules afterwards, so nothing is imported twice.
+    """
+    package = importlib.import_module(root)
+    timings = []
+    for module in pkgutil.iter_modules(package.__path__):
+        name = f"{root}.{module.name}"
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logger.error(f"Startup profile: importing {name} failed: {e}")
+            continue
+        timings.append((time.perf_counter() - start, name))
+    for seconds, name in sorted(timings, reverse=True):
+        logger.info(f"Startup profile: import {name} {seconds * 1000:.1f} ms")
+    logger.info(f"Startup profile: plugins imported in {sum(t for t, _ in timings) * 1000:.1f} ms")
+
+
+class _StartupTimer:
+    """Logs the duration of each startup step when PROFILE_STARTUP is on."""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.last = self.origin
+
+    def step(self, name):
+        if not PROFILE_STARTUP:
+            return
+        now = time.perf_counter()
+        logger.info(f"Startup profile: {name} {(now - self.last) * 1000:.1f} ms (total {(now - self.origin) * 1000:.1f} ms)")
+        self.last = now
+
+
 class Bot(Client):
     def __init__(self):
         super().__init__(
@@ -46,23 +89,32 @@ class Bot(Client):
             ipv6=False,
             in_memory=False,
         )
-        self._keep_alive_started = False
+        self._health_runner = None
+        self._post_start_task = None
 
     async def start(self):
         print(LOGO)
+        timer = _StartupTimer()
 
-        # 1. Start keep-alive BEFORE attempting Telegram login
-        if keep_alive and not self._keep_alive_started:
+        # 1. Start keep-alive BEFORE attempting Telegram login (binds the port, /readyz stays 503)
+        if keep_alive and not self._health_runner:
             try:
-                loop = asyncio.get_running_loop()
-                try:
-                    keep_alive(loop)
-                except TypeError:
-                    keep_alive()
-                self._keep_alive_started = True
+                self._health_runner = await keep_alive(self)
                 logger.info("Keep-alive server started.")
             except Exception as e:
                 logger.warning(f"Keep-alive failed: {e}")
+        timer.step("keep-alive server")
+
+        # Plugins are imported by super().start(); doing it here first lets us time each one.
+        # bot.py imports no plugin module itself, so every import is paid and measured here
+        if PROFILE_STARTUP:
+            profile_plugin_imports()
+            timer.step("plugin imports")
+
+        # Event-loop lag monitor; logs the loop's stack whenever a handler blocks it
+        if LOOP_LAG_THRESHOLD > 0:
+            from cantarella.loopwatch import WATCHDOG
+            WATCHDOG.start()
 
         # 2. FIX FOR FLOOD WAIT: Resilient Login Loop
         while True:
@@ -76,6 +128,37 @@ class Bot(Client):
             except Exception as e:
                 logger.error(f"Critical Startup Error: {e}")
                 await asyncio.sleep(15)
+        timer.step("telegram login")
+
+        # Updates are dispatched from here on; the rest is housekeeping and must not delay them
+        if keep_alive:
+            mark_ready()
+        self._post_start_task = asyncio.create_task(self._post_start(timer))
+
+    async def _post_start(self, timer):
+        from cantarella.peers import PEERS
+        from cantarella.filecache import MEDIA_CACHE
+        from cantarella.watch import WATCHES
+
+        # The bot's session file does not survive a redeploy; restore the chats it had resolved
+        try:
+            await db.ensure_peer_indexes()
+            await db.ensure_sync_indexes()
+        except Exception as e:
+            logger.warning(f"Peer cache / sync indexes: {e}")
+        await PEERS.inject(self)
+
+        # Files cached by the previous run are reused; whatever is over budget goes
+        try:
+            await MEDIA_CACHE.reconcile()
+        except Exception as e:
+            logger.warning(f"Media cache reconciliation failed: {e}")
+
+        # Watches outlive restarts; each user's session is reconnected once
+        try:
+            await WATCHES.restore(self)
+        except Exception as e:
+            logger.warning(f"Restoring watches failed: {e}")
 
         me = await self.get_me()
 
@@ -86,6 +169,7 @@ class Bot(Client):
         except Exception as e:
             logger.error(f"DB stats failed: {e}")
             user_count = "Unknown"
+        timer.step("database")
 
         # 4. Startup notification
         now = datetime.datetime.now(IST)
@@ -102,14 +186,30 @@ class Bot(Client):
         except Exception as e:
             logger.error(f"Failed to send startup log: {e}")
 
-        await self.set_bot_commands_list()
+        try:
+            await self.set_bot_commands_list()
+        except Exception as e:
+            logger.error(f"Failed to set bot commands: {e}")
+        timer.step("startup log and commands")
+
+    async def invoke(self, query, *args, **kwargs):
+        # Every bot-side RPC goes through here, so this is the Telegram latency histogram
+        with RPC_SECONDS.time(method=type(query).__name__):
+            return await super().invoke(query, *args, **kwargs)
 
     async def stop(self, *args):
         try:
             await self.send_message(LOG_CHANNEL, "**_Bot is going Offline_**")
         except:
             pass
+        # Loaded by now: plugins are imported by start()
+        from cantarella.watch import WATCHES
+        from cantarella.loopwatch import WATCHDOG
+        await WATCHES.stop_all()
         await asyncio.shield(super().stop())
+        await WATCHDOG.stop()
+        if self._health_runner:
+            await self._health_runner.cleanup()
         logger.info("Bot stopped cleanly")
 
     async def set_bot_commands_list(self):
@@ -119,8 +219,12 @@ class Bot(Client):
             BotCommand("login", "Login"),
             BotCommand("logout", "Logout"),
             BotCommand("cancel", "Cancel current action"),
+            BotCommand("jobs", "List running tasks"),
             BotCommand("batch", "Batch download"),
             BotCommand("single", "Single download"),
+            BotCommand("sync", "Deliver new posts of a chat"),
+            BotCommand("watch", "Forward new posts as they appear"),
+            BotCommand("unwatch", "Stop watching a chat"),
             BotCommand("myplan", "Check your plan"),
             BotCommand("premium", "Premium info"),
             BotCommand("setchat", "Set target chat"),
@@ -0,0 +1,85 @@
+from database.cache import TTLCache
+from metrics import CACHE_EVENTS
+
+# What works for a chat, learned from the first failure in a range
+COPYABLE = "copyable"
+USER_ONLY = "user_session"
+INACCESSIBLE = "inaccessible"
+
+# Chat-level refusals: every other id in the same chat fails the same way.
+# Per-message errors (MESSAGE_ID_INVALID, FloodWait, timeouts) are not learned.
+BOT_REFUSED_IDS = {
+    "CHAT_FORWARDS_RESTRICTED", "CHANNEL_PRIVATE", "CHANNEL_INVALID", "CHAT_ADMIN_REQUIRED",
+    "USERNAME_INVALID", "USERNAME_NOT_OCCUPIED", "USER_BANNED_IN_CHANNEL", "BOT_METHOD_INVALID",
+}
+USER_REFUSED_IDS = {
+    "CHANNEL_PRIVATE", "CHANNEL_INVALID", "USERNAME_INVALID", "USERNAME_NOT_OCCUPIED",
+    "USER_BANNED_IN_CHANNEL", "CHAT_ADMIN_REQUIRED",
+}
+
+# Chats change (protection toggled, user joins), so a verdict only lasts this long
+ACCESS_TTL = 60 * 60
+# Shorter, so a user who joins the chat afterwards is not locked out for long
+INACCESSIBLE_TTL = 10 * 60
+
+
+def _key(chat):
+    return chat.lower().lstrip("@") if isinstance(chat, str) else int(chat)
+
+
+class ChatAccess:
+    """
+    Negative cache of chat access. Once the bot is refused on a chat, every
+    range of it goes straight to user sessions. Once a user's session is
+    refused too, the rest of that user's ranges is skipped; other accounts
+    may well be members, so that verdict is kept per (account, chat).
+    """
+
+    def __init__(self, ttl=ACCESS_TTL, maxsize=2048):
+        self._modes = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._denied = TTLCache(maxsize=maxsize, ttl=INACCESSIBLE_TTL)
+
+    def get(self, chat):
+        """The bot's verdict for `chat`: COPYABLE, USER_ONLY or None."""
+        return self._modes.get(_key(chat))
+
+    def bot_allowed(self, chat):
+        if self.get(chat) == USER_ONLY:
+            CACHE_EVENTS.inc(cache="chat_access", result="hit")
+            return False
+        return True
+
+    def inaccessible(self, account, chat):
+        """True if the session of `account` (a user id) was refused on `chat`."""
+        if self._denied.get((account, _key(chat))) == INACCESSIBLE:
+            CACHE_EVENTS.inc(cache="chat_access", result="hit")
+            return True
+        return False
+
+    def bot_ok(self, chat):
+        if self.get(chat) is None:
+            self._modes.set(_key(chat), COPYABLE)
+
+    def bot_failed(self, chat, error):
+        """Record a bot-side failure; returns True if it was a chat-level refusal."""
+        if getattr(error, "ID", None) not in BOT_REFUSED_IDS:
+            return False
+        if self.get(chat) != USER_ONLY:
+            CACHE_EVENTS.inc(cache="chat_access", result="miss")
+            self._modes.set(_key(chat), USER_ONLY)
+        return True
+
+    def user_failed(self, account, chat, error):
+        """Record a failure of the session of `account`; returns True if it was a chat-level refusal."""
+        if getattr(error, "ID", None) not in USER_REFUSED_IDS:
+            return False
+        self._denied.set((account, _key(chat)), INACCESSIBLE)
+        return True
+
+    def forget(self, chat, account=None):
+        self._modes.pop(_key(chat))
+        if account is not None:
+            self._denied.pop((account, _key(chat)))
+
+
+CHAT_ACCESS = ChatAccess()
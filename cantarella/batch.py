@@ -1,24 +1,34 @@
-import os
-import re
-import asyncio
+import time
+from collections import Counter
 from pyrogram import Client, filters
 from pyrogram.types import Message
-from config import API_ID, API_HASH, ADMINS
+from config import ADMINS
 from database.db import db
+from cantarella.links import extract_jobs, parse_filter, parse_bundle
+from cantarella.search import find_messages
+from cantarella.bundle import Bundle
+from cantarella.delivery import fan_out
+from cantarella.transfer import codec_of, transfer
+from cantarella.retry import DEFAULT_POLICY, reason_of, format_breakdown
+from cantarella.jobs import JOBS, CancelToken, Cancelled
+from cantarella.clients import user_client
+from cantarella.peers import PEERS
+from cantarella.access import CHAT_ACCESS
+from metrics import STAGE_SECONDS, ERRORS
+from logger import LOGGER
+
+logger = LOGGER(__name__)
 
 BATCH_STATE = {}
-CANCEL_FLAG = {}
 
 
 def parse_link(link):
-    link = link.strip()
-    m = re.match(r'https?://t\.me/c/(\d+)/(\d+)', link)
-    if m:
-        return f'-100{m.group(1)}', int(m.group(2)), 'private'
-    m = re.match(r'https?://t\.me/([^/]+)/(\d+)', link)
-    if m:
-        return m.group(1), int(m.group(2)), 'public'
-    return None, None, None
+    jobs = extract_jobs(link)
+    if not jobs:
+        return None, None, None
+    job = jobs[0]
+    link_type = 'public' if job.kind == 'public' else 'private'
+    return job.target, job.start, link_type
 
 
 async def get_user_client(uid):
@@ -26,126 +36,119 @@ async def get_user_client(uid):
     if not session_string:
         return None
     try:
-        uc = Client(
-            name=f'usersession_{uid}',
-            api_id=API_ID,
-            api_hash=API_HASH,
-            session_string=session_string,
-            in_memory=True,
-        )
-        await uc.start()
-        return uc
+        return await user_client(session_string, name=f'usersession_{uid}', start=True)
     except Exception as e:
-        print(f'User client error {uid}: {e}')
+        logger.warning(f'User client error: {e}', extra={'user_id': uid})
         return None
 
 
-async def send_message_to_user(bot, dest_id, msg, caption=None):
+async def deliver_message(bot, dest_id, msg, caption=None, extra_dests=(), source=None, refetch=None, token=None):
     """
-    Re-send a downloaded file/text to dest_id using the bot.
-    msg is a Pyrogram Message object already fetched by user client.
+    Re-send a fetched text or media message to dest_id using the bot, then
+    copy the sent message to extra_dests (dump chats) without re-uploading.
+    Media is downloaded through `source`, the client that fetched msg;
+    refetch() returns a fresh copy when its file reference expires.
+    Returns the kind delivered and raises on failure.
     """
-    try:
-        if msg.text:
-            await bot.send_message(dest_id, msg.text)
-            return True, 'text'
-
-        if msg.photo:
-            path = await msg.download()
-            await bot.send_photo(dest_id, path, caption=caption or msg.caption)
-            os.remove(path)
-            return True, 'photo'
-
-        if msg.video:
-            path = await msg.download()
-            await bot.send_video(
-                dest_id, path,
-                caption=caption or msg.caption,
-                duration=msg.video.duration,
-                width=msg.video.width,
-                height=msg.video.height,
-            )
-            os.remove(path)
-            return True, 'video'
-
-        if msg.document:
-            path = await msg.download()
-            await bot.send_document(
-                dest_id, path,
-                caption=caption or msg.caption,
-                file_name=msg.document.file_name,
-            )
-            os.remove(path)
-            return True, 'document'
-
-        if msg.audio:
-            path = await msg.download()
-            await bot.send_audio(
-                dest_id, path,
-                caption=caption or msg.caption,
-                duration=msg.audio.duration,
-                title=msg.audio.title,
-                performer=msg.audio.performer,
-            )
-            os.remove(path)
-            return True, 'audio'
-
-        if msg.voice:
-            path = await msg.download()
-            await bot.send_voice(dest_id, path)
-            os.remove(path)
-            return True, 'voice'
-
-        if msg.video_note:
-            path = await msg.download()
-            await bot.send_video_note(dest_id, path)
-            os.remove(path)
-            return True, 'video_note'
-
-        if msg.sticker:
-            await bot.send_sticker(dest_id, msg.sticker.file_id)
-            return True, 'sticker'
-
-        if msg.animation:
-            path = await msg.download()
-            await bot.send_animation(
-                dest_id, path,
-                caption=caption or msg.caption,
-            )
-            os.remove(path)
-            return True, 'animation'
-
+    token = token or CancelToken()
+    if msg.text:
+        sent = await DEFAULT_POLICY.run(lambda: bot.send_message(dest_id, msg.text), token=token)
+        await fan_out(bot, sent, extra_dests, token)
+        return 'text'
+    codec = codec_of(msg)
+    await transfer(bot, source or bot, msg, dest_id, caption=caption or msg.caption,
+                   destinations=extra_dests, refetch=refetch, token=token)
+    token.raise_if_cancelled()
+    return codec.kind
+
+
+async def send_message_to_user(bot, dest_id, msg, caption=None, extra_dests=(), source=None, refetch=None, token=None):
+    """deliver_message() reporting instead of raising: (True, kind) or (False, reason key)."""
+    token = token or CancelToken()
+    if not msg.text and not codec_of(msg):
         return False, 'unsupported media type'
-
+    try:
+        return True, await deliver_message(bot, dest_id, msg, caption, extra_dests, source, refetch, token)
+    except Cancelled:
+        return False, 'cancelled'
     except Exception as e:
-        return False, str(e)[:80]
+        return False, 'cancelled' if token.cancelled else reason_of(e)
 
 
-async def process_one(bot, uc, chat_id, msg_id, dest_id, link_type):
-    try:
-        if link_type == 'private':
+async def process_one(bot, uc, chat_id, msg_id, dest_id, link_type, extra_dests=(), token=None, found=None, bundle=None):
+    """
+    Returns (ok, reason); on failure reason is a short key from retry.reason_of.
+    `found` is the message when uc already fetched it, e.g. by find_messages().
+    With a `bundle` the message goes into its archive instead of being sent.
+    """
+    with STAGE_SECONDS.time(stage="process_one"):
+        ok, reason = await _process_one(bot, uc, chat_id, msg_id, dest_id, link_type, extra_dests, token, found, bundle)
+    if not ok:
+        ERRORS.inc(stage="process_one", reason=reason)
+    return ok, reason
+
+
+async def _process_one(bot, uc, chat_id, msg_id, dest_id, link_type, extra_dests, token, found, bundle):
+    if link_type == 'private' and not uc:
+        return False, 'no session'
+    # Batches deliver to the requester's private chat, whose id is the account's user id
+    account = int(dest_id)
+    if CHAT_ACCESS.inaccessible(account, chat_id):
+        return False, 'inaccessible'
+
+    source = None
+    # The client whose call failed is the one whose peer row may be stale
+    caller = None
+
+    async def fetch_from(client):
+        nonlocal source, caller
+        caller = client
+        msg = await client.get_messages(chat_id, msg_id)
+        await PEERS.remember(client, chat_id)
+        # Media is downloaded by whichever account could read the message
+        source = client
+        return msg
+
+    async def fetch():
+        # Skip the bot once the chat has refused it; the verdict is per chat, not per message
+        if link_type == 'private' or (uc and not CHAT_ACCESS.bot_allowed(chat_id)):
+            return await fetch_from(uc)
+        try:
+            msg = await fetch_from(bot)
+            CHAT_ACCESS.bot_ok(chat_id)
+            return msg
+        except Exception as e:
+            CHAT_ACCESS.bot_failed(chat_id, e)
             if not uc:
-                return False, 'no session'
-            msg = await uc.get_messages(int(chat_id), msg_id)
-        else:
-            try:
-                msg = await bot.get_messages(chat_id, msg_id)
-            except Exception:
-                if uc:
-                    msg = await uc.get_messages(chat_id, msg_id)
-                else:
-                    return False, 'cannot fetch'
+                raise
+            await PEERS.check(bot, chat_id, e)
+            return await fetch_from(uc)
 
+    try:
+        if found:
+            msg, source = found, uc
+            refetch = lambda: fetch_from(uc)
+        else:
+            msg = await DEFAULT_POLICY.run(fetch, token=token)
+            refetch = fetch
         if not msg or getattr(msg, 'empty', False):
             return False, 'empty'
+        if bundle and bundle.fits(msg):
+            return await bundle.add(source, msg, refetch)
 
         # Get user caption if set
         user_caption = await db.get_caption(dest_id)
-        ok, reason = await send_message_to_user(bot, int(dest_id), msg, caption=user_caption)
-        return ok, reason
+        return await send_message_to_user(bot, int(dest_id), msg, caption=user_caption, extra_dests=extra_dests,
+                                          source=source, refetch=refetch, token=token)
 
+    except Cancelled:
+        return False, 'cancelled'
     except Exception as e:
-        return False, str(e)[:80]
+        if caller:
+            await PEERS.check(caller, chat_id, e)
+        if caller is uc and uc:
+            CHAT_ACCESS.user_failed(account, chat_id, e)
+        return False, reason_of(e)
 
 
 # ── /batch ────────────────────────────────────────────────
@@ -153,7 +156,6 @@ async def process_one(bot, uc, chat_id, msg_id, dest_id, link_type):
 async def batch_cmd(client: Client, message: Message):
     uid = message.from_user.id
     BATCH_STATE[uid] = {'step': 'WAITING_LINK'}
-    CANCEL_FLAG.pop(uid, None)
     await message.reply(
         '**Batch Mode**\n\n'
         'Send the **starting link** (first message).\n'
@@ -167,7 +169,6 @@ async def batch_cmd(client: Client, message: Message):
 async def single_cmd(client: Client, message: Message):
     uid = message.from_user.id
     BATCH_STATE[uid] = {'step': 'WAITING_SINGLE_LINK'}
-    CANCEL_FLAG.pop(uid, None)
     await message.reply(
         '**Single Download**\n\n'
         'Send the **link** of the message to save.\n'
@@ -175,24 +176,12 @@ async def single_cmd(client: Client, message: Message):
     )
 
 
-# ── /cancel ───────────────────────────────────────────────
-@Client.on_message(filters.private & filters.command('cancel') & filters.user(ADMINS))
-async def cancel_cmd(client: Client, message: Message):
-    uid = message.from_user.id
-    if uid in BATCH_STATE or uid in CANCEL_FLAG:
-        CANCEL_FLAG[uid] = True
-        BATCH_STATE.pop(uid, None)
-        await message.reply('Cancellation requested.')
-    else:
-        await message.reply('No active batch.')
-
-
 # ── Text handler ──────────────────────────────────────────
 @Client.on_message(
     filters.private
     & filters.text
     & filters.user(ADMINS)
-    & ~filters.command(['batch', 'single', 'cancel', 'start', 'help',
+    & ~filters.command(['batch', 'single', 'sync', 'watch', 'unwatch', 'cancel', 'jobs', 'start', 'help',
                         'login', 'logout', 'myplan', 'premium', 'setchat',
                         'set_thumb', 'view_thumb', 'del_thumb',
                         'set_caption', 'see_caption', 'del_caption',
@@ -215,13 +204,19 @@ async def batch_text_handler(client: Client, message: Message):
             return await message.reply('Invalid link. Try again or /cancel.')
         BATCH_STATE.pop(uid, None)
         status = await message.reply('Fetching...')
+        job = JOBS.start(uid, 'single', link)
         uc = await get_user_client(uid) if link_type == 'private' else None
-        ok, reason = await process_one(client, uc, chat_id, msg_id, message.chat.id, link_type)
-        if uc:
-            try:
-                await uc.stop()
-            except Exception:
-                pass
+        destinations = await db.get_dump_chats(uid)
+        try:
+            ok, reason = await process_one(client, uc, chat_id, msg_id, message.chat.id, link_type,
+                                           destinations, job.token)
+        finally:
+            JOBS.finish(job)
+            if uc:
+                try:
+                    await uc.stop()
+                except Exception:
+                    pass
         await status.edit('Done.' if ok else f'Failed: {reason}')
         return
 
@@ -231,9 +226,16 @@ async def batch_text_handler(client: Client, message: Message):
         chat_id, msg_id, link_type = parse_link(link)
         if not chat_id:
             return await message.reply('Invalid link. Try again or /cancel.')
-        state.update({'step': 'WAITING_COUNT', 'chat_id': chat_id,
-                      'msg_id': msg_id, 'link_type': link_type})
-        await message.reply('How many messages to download from this link? (max 200)')
+        try:
+            flt = parse_filter(link)
+        except ValueError as e:
+            return await message.reply(f'{e}. Try again or /cancel.')
+        state.update({'step': 'WAITING_COUNT', 'chat_id': chat_id, 'msg_id': msg_id,
+                      'link_type': link_type, 'filter': flt, 'bundle': parse_bundle(link)})
+        if flt:
+            await message.reply('How many matching messages to download from this link on? (max 200)')
+        else:
+            await message.reply('How many messages to download from this link? (max 200)')
         return
 
     # ── BATCH step 2: get count + run ──────────────────────
@@ -252,50 +254,149 @@ async def batch_text_handler(client: Client, message: Message):
         chat_id = state['chat_id']
         start_id = state['msg_id']
         link_type = state['link_type']
+        flt = state.get('filter')
+        fmt = state.get('bundle')
         BATCH_STATE.pop(uid, None)
 
         status = await message.reply(f'Starting batch: 0/{count} | Success: 0 | Failed: 0')
 
         uc = None
-        if link_type == 'private':
+        if link_type == 'private' or flt:
             uc = await get_user_client(uid)
             if not uc:
+                if flt:
+                    return await status.edit('Login required for filtered batches, they search with your account. Use /login first.')
                 return await status.edit('Login required for private links. Use /login first.')
 
+        async def targets():
+            # Filtered batches let Telegram skip deleted ids and unwanted messages
+            if flt:
+                async for msg in find_messages(uc, chat_id, flt, start_id, limit=count, token=job.token):
+                    yield msg.id, msg
+            else:
+                for i in range(count):
+                    yield start_id + i, None
+
         success = 0
         failed = 0
-        CANCEL_FLAG.pop(uid, None)
-
+        failures = Counter()
+        destinations = await db.get_dump_chats(uid)
+        job = JOBS.start(uid, 'batch', f'{count} messages')
+        # Hundreds of small files travel as a few archive uploads instead of one message each
+        bundle = Bundle(client, message.chat.id, f'{str(chat_id).lstrip("-")}_{start_id}', fmt,
+                        destinations, job.token) if fmt else None
+
+        charged = 0
+        lost = Counter()
+
+        async def account():
+            # Bundled items count, and are charged, once their volume is sent; they fail with it
+            nonlocal success, failed, charged, lost
+            new = bundle.delivered - charged
+            charged += new
+            success += new
+            if new:
+                await db.add_traffic(uid, new)
+            dropped = bundle.lost - lost
+            lost = bundle.lost.copy()
+            failed += sum(dropped.values())
+            failures.update({f'archive upload: {reason}': n for reason, n in dropped.items()})
+
+        async def deliver_bundle():
+            await bundle.close()
+            await account()
+
+        async def drop_bundle():
+            # Nothing can be uploaded once the job is cancelled; say what is left behind
+            await bundle.discard()
+            await account()
+            return f'\n{bundle.pending} archived item(s) were not sent.' if bundle.pending else ''
+
+        def tally():
+            text = f'Success: {success} | Failed: {failed}'
+            return text + f' | Archived: {bundle.pending}' if bundle else text
+
+        i = -1
         try:
-            for i in range(count):
-                if CANCEL_FLAG.get(uid):
-                    await status.edit(f'Cancelled at {i}/{count} | Success: {success} | Failed: {failed}')
+            async for mid, found in targets():
+                i += 1
+                if job.token.cancelled:
+                    note = await drop_bundle() if bundle else ''
+                    await status.edit(f'Cancelled at {i}/{count} | Success: {success} | Failed: {failed}{note}')
                     break
-                mid = start_id + i
+                job.set_pending(count - i)
+                started = time.perf_counter()
+                archived = bundle.items if bundle else 0
                 ok, reason = await process_one(client, uc, chat_id, mid,
-                                               message.chat.id, link_type)
+                                               message.chat.id, link_type, destinations, job.token, found, bundle)
+                context = {'user_id': uid, 'job_id': job.id, 'stage': 'process_one',
+                           'duration': time.perf_counter() - started}
                 if ok:
-                    success += 1
-                    await db.add_traffic(uid)
+                    if not bundle or bundle.items == archived:
+                        success += 1
+                        await db.add_traffic(uid)
+                    logger.info(f'Batch message {mid} done', extra={**context, 'sample': 20})
                 else:
                     failed += 1
-                    print(f'[batch] msg {mid} failed: {reason}')
+                    failures[reason] += 1
+                    logger.warning(f'Batch message {mid} failed: {reason}', extra=context)
+                    if CHAT_ACCESS.inaccessible(uid, chat_id):
+                        if bundle:
+                            await deliver_bundle()
+                        await status.edit(f'Stopped at {i+1}/{count}: this chat is not accessible from your account. | {tally()}')
+                        break
 
                 if (i + 1) % 5 == 0 or (i + 1) == count:
+                    if bundle:
+                        await account()
                     try:
                         await status.edit(
-                            f'Progress: {i+1}/{count} | Success: {success} | Failed: {failed}'
+                            f'Progress: {i+1}/{count} | {tally()}'
                         )
                     except Exception:
                         pass
 
-                await asyncio.sleep(2)
+                try:
+                    # Bundled items are not sent one by one, so there is nothing to pace
+                    await job.token.sleep(0 if bundle else 2)
+                except Cancelled:
+                    pass
             else:
-                await status.edit(f'Batch done. Success: {success}/{count} | Failed: {failed}')
+                total = i + 1 if flt else count
+                if bundle:
+                    await status.edit(f'Uploading archive... | {tally()}')
+                    await deliver_bundle()
+                report = f'Batch done. Success: {success}/{total} | Failed: {failed}'
+                if flt and not total:
+                    report = 'No messages from this link on match the filter.'
+                if bundle:
+                    report += f'\nArchives sent: {bundle.sent}'
+                    if bundle.failed:
+                        report += f' | Failed to upload: {bundle.failed}'
+                if failures:
+                    report += '\n\nFailure reasons:\n' + format_breakdown(failures)
+                await status.edit(report)
+        except Cancelled:
+            note = await drop_bundle() if bundle else ''
+            await status.edit(f'Cancelled at {i + 1}/{count} | Success: {success} | Failed: {failed}{note}')
+        except Exception as e:
+            # The search or the archive failed; process_one reports its own errors
+            if flt:
+                await PEERS.check(uc, chat_id, e)
+            note = ''
+            if bundle:
+                try:
+                    await deliver_bundle()
+                except Exception as err:
+                    logger.error(f'Uploading the rest of the bundle failed: {reason_of(err)}')
+                    note = await drop_bundle()
+            await status.edit(f'Batch stopped after {i + 1} message(s): {reason_of(e)} | Success: {success} | Failed: {failed}{note}')
         finally:
+            if bundle:
+                await bundle.discard()
+            JOBS.finish(job)
             if uc:
                 try:
                     await uc.stop()
                 except Exception:
                     pass
-            CANCEL_FLAG.pop(uid, None)
@@ -15,6 +15,7 @@ from pyrogram.types import Message
 import json
 import os
 from logger import LOGGER
+from metrics import STAGE_SECONDS, FLOOD_WAIT_SECONDS
 
 logger = LOGGER(__name__)
 
@@ -23,9 +24,11 @@ logger = LOGGER(__name__)
 # ---------------------------------------------------
 async def broadcast_messages(user_id, message):
     try:
-        await message.copy(chat_id=user_id)
+        with STAGE_SECONDS.time(stage="broadcast"):
+            await message.copy(chat_id=user_id)
         return True, "Success"
     except FloodWait as e:
+        FLOOD_WAIT_SECONDS.inc(e.value)
         await asyncio.sleep(e.value)
         return await broadcast_messages(user_id, message)
     except InputUserDeactivated:
@@ -146,8 +149,10 @@ async def users_count(bot: Client, message: Message):
             })
 
         tmp_path = "SaveRestricted.json"
-        with open(tmp_path, "w", encoding="utf-8") as f:
-            json.dump(users_list, f, indent=2, ensure_ascii=False)
+        def write_export():
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(users_list, f, indent=2, ensure_ascii=False)
+        await asyncio.to_thread(write_export)
 
         caption = f"📄 **Recorded {len(users_list)} Users**"
         await message.reply_document(
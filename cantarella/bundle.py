@@ -0,0 +1,205 @@
+import io
+import os
+import html
+import time
+import shutil
+import asyncio
+import tarfile
+import zipfile
+from collections import Counter
+from config import BUNDLE_VOLUME_MB
+from cantarella.transfer import codec_of, download, release, upload_document
+from cantarella.downloader import media_file_name
+from cantarella.delivery import fan_out
+from cantarella.retry import reason_of
+from cantarella.jobs import CancelToken, Cancelled
+from logger import LOGGER
+
+logger = LOGGER(__name__)
+
+# Volumes being written, one directory per bundle
+BUNDLE_ROOT = "downloads/bundles"
+# Room kept in every volume for entry headers and the zip central directory
+HEADROOM = 1024 * 1024
+# Telegram's caption limit
+CAPTION_LIMIT = 1024
+
+
+def _size(size):
+    if size < 1024 * 1024:
+        return f"{size / 1024:.0f} KiB"
+    return f"{size / 1024 / 1024:.1f} MiB"
+
+
+class Volume:
+    """One archive file of a bundle. Entries are stored, never compressed: media is compressed already."""
+
+    def __init__(self, path, fmt, number):
+        self.path = path
+        self.fmt = fmt
+        self.number = number
+        self.entries = []
+        self.size = 0
+        if fmt == "zip":
+            self._archive = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED, allowZip64=True)
+        else:
+            self._archive = tarfile.open(path, "w")
+
+    def add(self, name, file):
+        """Append a path, BytesIO or bytes as `name`. Blocking; run it in a thread."""
+        if isinstance(file, str):
+            size = os.path.getsize(file)
+            if self.fmt == "zip":
+                self._archive.write(file, name)
+            else:
+                self._archive.add(file, arcname=name)
+        else:
+            data = file.getvalue() if isinstance(file, io.BytesIO) else file
+            size = len(data)
+            if self.fmt == "zip":
+                self._archive.writestr(name, data)
+            else:
+                info = tarfile.TarInfo(name)
+                info.size = size
+                info.mtime = int(time.time())
+                self._archive.addfile(info, io.BytesIO(data))
+        self.entries.append((name, size))
+        self.size += size
+
+    def close(self):
+        self._archive.close()
+
+    def caption(self, title):
+        """Index of the volume's contents, cut to fit a caption."""
+        text = f"<b>📦 {html.escape(title)} — part {self.number}</b>\n{len(self.entries)} files, {_size(self.size)}\n"
+        for i, (name, size) in enumerate(self.entries):
+            line = f"\n{html.escape(name)} ({_size(size)})"
+            rest = f"\n…and {len(self.entries) - i} more"
+            last = i == len(self.entries) - 1
+            if len(text) + len(line) + (0 if last else len(rest)) > CAPTION_LIMIT:
+                return text + rest
+            text += line
+        return text
+
+
+class Bundle:
+    """
+    A /batch delivered as archive volumes instead of one message per file.
+    Items are written into the current volume as they are downloaded; a
+    full volume is uploaded as one document while the next one fills.
+    Files that do not fit in a volume are left to the caller to send.
+    """
+
+    def __init__(self, client, chat_id, title, fmt="zip", destinations=(), token=None,
+                 limit=BUNDLE_VOLUME_MB * 1024 * 1024):
+        self.client = client
+        self.chat_id = chat_id
+        self.title = title
+        self.fmt = fmt
+        self.destinations = destinations
+        self.token = token or CancelToken()
+        self.limit = limit
+        self.directory = os.path.join(BUNDLE_ROOT, f"{chat_id}_{time.time_ns()}")
+        self.volume = None
+        self.volumes = 0
+        self.sent = 0
+        self.failed = 0
+        # Items written into volumes, those whose volume has been sent, and those
+        # whose volume failed to upload, by reason
+        self.items = 0
+        self.delivered = 0
+        self.lost = Counter()
+        self._upload = None
+
+    @property
+    def pending(self):
+        """Items written but neither sent nor lost yet."""
+        return self.items - self.delivered - sum(self.lost.values())
+
+    def fits(self, msg):
+        codec = None if msg.text else codec_of(msg)
+        return codec is None or codec.size(msg) <= self.limit - HEADROOM
+
+    async def add(self, source, msg, refetch=None):
+        """Download `msg` through `source` into the bundle; returns (ok, reason) like send_message_to_user."""
+        try:
+            if msg.text:
+                data = msg.text.encode()
+                await self._write(f"{msg.id}.txt", data, len(data))
+                return True, 'text'
+            codec = codec_of(msg)
+            if not codec:
+                return False, 'unsupported media type'
+            name = os.path.basename(media_file_name(msg))
+            if getattr(codec.media(msg), "file_name", None):
+                # Senders reuse file names; the id keeps entries apart and in order
+                name = f"{msg.id}_{name}"
+            file = await download(source, msg, refetch, token=self.token)
+            try:
+                await self._write(name, file, codec.size(msg))
+            finally:
+                release(msg)
+            return True, codec.kind
+        except Cancelled:
+            return False, 'cancelled'
+        except Exception as e:
+            return False, 'cancelled' if self.token.cancelled else reason_of(e)
+
+    async def _write(self, name, file, size):
+        if self.volume and self.volume.entries and self.volume.size + size > self.limit - HEADROOM:
+            await self._seal()
+        if self.volume is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.volumes += 1
+            path = os.path.join(self.directory, f"{self.title}.part{self.volumes:02d}.{self.fmt}")
+            self.volume = await asyncio.to_thread(Volume, path, self.fmt, self.volumes)
+        await asyncio.to_thread(self.volume.add, name, file)
+        self.items += 1
+
+    async def _seal(self):
+        """Finish the current volume and start uploading it; one upload runs at a time."""
+        volume, self.volume = self.volume, None
+        await asyncio.to_thread(volume.close)
+        await self._wait()
+        self._upload = asyncio.create_task(self._send(volume))
+
+    async def _wait(self):
+        if self._upload:
+            task, self._upload = self._upload, None
+            await task
+
+    async def _send(self, volume):
+        try:
+            sent = await upload_document(self.client, self.chat_id, volume.path, caption=volume.caption(self.title), token=self.token)
+            await fan_out(self.client, sent, self.destinations, self.token)
+            self.sent += 1
+            self.delivered += len(volume.entries)
+        except Cancelled:
+            raise
+        except Exception as e:
+            self.failed += 1
+            self.lost[reason_of(e)] += len(volume.entries)
+            logger.error(f"Uploading {os.path.basename(volume.path)} failed: {reason_of(e)}")
+        finally:
+            try:
+                os.remove(volume.path)
+            except OSError:
+                pass
+
+    async def close(self):
+        """Upload what is left and wait for it; returns the number of volumes sent."""
+        if self.volume and self.volume.entries:
+            await self._seal()
+        await self._wait()
+        return self.sent
+
+    async def discard(self):
+        """Stop any upload and delete the volumes on disk; safe after close()."""
+        if self._upload:
+            self._upload.cancel()
+            await asyncio.gather(self._upload, return_exceptions=True)
+            self._upload = None
+        if self.volume:
+            await asyncio.to_thread(self.volume.close)
+            self.volume = None
+        await asyncio.to_thread(shutil.rmtree, self.directory, True)
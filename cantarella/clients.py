@@ -0,0 +1,76 @@
+import asyncio
+from collections import Counter
+from pyrogram import Client
+from config import API_ID, API_HASH
+from database.db import db
+from cantarella.peers import PEERS
+from logger import LOGGER
+
+logger = LOGGER(__name__)
+
+
+async def user_client(session_string, name="saverestricted", start=False, **kwargs):
+    """
+    Connect an in-memory client for a logged-in user and preload the peers
+    that account resolved before, so the first get_messages needs no resolve.
+    start=True also starts the update dispatcher (Client.start vs connect).
+    """
+    client = Client(
+        name,
+        session_string=session_string,
+        api_id=API_ID,
+        api_hash=API_HASH,
+        in_memory=True,
+        **kwargs
+    )
+    if start:
+        await client.start()
+    else:
+        await client.connect()
+    await PEERS.inject(client)
+    return client
+
+
+class ClientPool:
+    """
+    One started client per account, shared by everything that holds it.
+    Long-lived users (watches) acquire it instead of opening their own
+    connection; the last release() stops it.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._refs = Counter()
+        self._locks = {}
+
+    def get(self, user_id):
+        return self._clients.get(user_id)
+
+    async def acquire(self, user_id):
+        """The account's started client, or None if the user is not logged in."""
+        async with self._locks.setdefault(user_id, asyncio.Lock()):
+            client = self._clients.get(user_id)
+            if client is None:
+                session_string = await db.get_session(user_id)
+                if not session_string:
+                    return None
+                client = await user_client(session_string, name=f"pool_{user_id}", start=True)
+                self._clients[user_id] = client
+            self._refs[user_id] += 1
+            return client
+
+    async def release(self, user_id):
+        async with self._locks.setdefault(user_id, asyncio.Lock()):
+            self._refs[user_id] -= 1
+            if self._refs[user_id] > 0:
+                return
+            del self._refs[user_id]
+            client = self._clients.pop(user_id, None)
+        if client:
+            try:
+                await client.stop()
+            except Exception as e:
+                logger.warning(f"Stopping pooled client of {user_id}: {e}")
+
+
+POOL = ClientPool()
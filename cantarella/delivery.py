@@ -0,0 +1,34 @@
+import asyncio
+from pyrogram.errors import FloodWait
+from cantarella.jobs import CancelToken
+from logger import LOGGER
+from metrics import FLOOD_WAIT_SECONDS, STAGE_SECONDS
+
+logger = LOGGER(__name__)
+
+
+async def _copy(client, sent, dest, token):
+    for _ in range(3):
+        try:
+            return await client.copy_message(dest, sent.chat.id, sent.id)
+        except FloodWait as e:
+            FLOOD_WAIT_SECONDS.inc(e.value)
+            await token.sleep(e.value)
+        except Exception as e:
+            logger.warning(f"Copy to dump chat {dest} failed: {e}")
+            return None
+    return None
+
+
+async def fan_out(client, sent, destinations, token=None):
+    """
+    Deliver an already uploaded message to extra chats.
+    copy_message is a server-side copy, so N destinations cost one upload.
+    FloodWaits are slept through `token`, so /cancel cuts them short.
+    """
+    if not sent or not destinations:
+        return []
+    token = token or CancelToken()
+    targets = [d for d in dict.fromkeys(destinations) if d != sent.chat.id]
+    with STAGE_SECONDS.time(stage="deliver"):
+        return await asyncio.gather(*(_copy(client, sent, dest, token) for dest in targets))
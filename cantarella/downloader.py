@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import shutil
+import asyncio
+import hashlib
+import mimetypes
+from config import PARALLEL_DOWNLOAD_WORKERS, PARALLEL_PART_SIZE_MB, IN_MEMORY_MAX_SIZE
+from cantarella.retry import classify, RETRYABLE, FLOOD
+from logger import LOGGER
+
+logger = LOGGER(__name__)
+
+# Telegram serves files in 1 MiB chunks; stream_media offsets count chunks
+CHUNK_SIZE = 1024 * 1024
+PART_RETRIES = 5
+# Unfinished downloads live here, keyed by file_unique_id, until they complete
+PARTIAL_ROOT = "downloads/partial"
+PARTIAL_TTL = 24 * 60 * 60
+
+
+def media_of(msg):
+    for attr in ("document", "video", "audio", "animation", "voice", "video_note", "photo"):
+        media = getattr(msg, attr, None)
+        if media:
+            return attr, media
+    return None, None
+
+
+def media_file_name(msg):
+    """Same naming download_media uses when the sender gave no file name."""
+    kind, media = media_of(msg)
+    name = getattr(media, "file_name", None)
+    if name:
+        return name
+    ext = mimetypes.guess_extension(getattr(media, "mime_type", None) or "") or ".bin"
+    if kind == "photo":
+        ext = ".jpg"
+    return f"{kind}_{msg.id}{ext}"
+
+
+def fits_in_memory(msg):
+    """Small media is downloaded with in_memory=True; disk I/O would cost more than the transfer."""
+    _, media = media_of(msg)
+    size = getattr(media, "file_size", None) or 0
+    return 0 < size <= IN_MEMORY_MAX_SIZE
+
+
+def partial_dir(msg):
+    _, media = media_of(msg)
+    return os.path.join(PARTIAL_ROOT, media.file_unique_id)
+
+
+def sweep_partials(max_age=PARTIAL_TTL, keep=None):
+    """Drop unfinished downloads nobody has resumed for a while."""
+    if not os.path.isdir(PARTIAL_ROOT):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(PARTIAL_ROOT):
+        path = os.path.join(PARTIAL_ROOT, name)
+        if keep and os.path.abspath(path) == os.path.abspath(keep):
+            continue
+        try:
+            if os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+def _preallocate(path, size):
+    if os.path.exists(path) and os.path.getsize(path) == size:
+        return
+    with open(path, "wb") as f:
+        f.truncate(size)
+
+
+def _hash_range(path, offset, length):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while length > 0:
+            data = f.read(min(CHUNK_SIZE, length))
+            if not data:
+                break
+            digest.update(data)
+            length -= len(data)
+    return digest.hexdigest()
+
+
+def _load_manifest(path, manifest_path, fuid, file_size, part_chunks):
+    """Return {part_start: sha256} for parts whose bytes on disk still match."""
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if (manifest.get("file_unique_id"), manifest.get("size"), manifest.get("part_chunks")) != (fuid, file_size, part_chunks):
+        return {}
+    if not os.path.exists(path) or os.path.getsize(path) != file_size:
+        return {}
+    verified = {}
+    for start, digest in manifest.get("done", {}).items():
+        start = int(start)
+        length = min(part_chunks * CHUNK_SIZE, file_size - start * CHUNK_SIZE)
+        if _hash_range(path, start * CHUNK_SIZE, length) == digest:
+            verified[start] = digest
+    return verified
+
+
+def _save_manifest(manifest_path, manifest):
+    tmp = manifest_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, manifest_path)
+
+
+async def parallel_download(client, msg, directory, file_size, progress=None, progress_args=(),
+                            workers=PARALLEL_DOWNLOAD_WORKERS, part_size_mb=PARALLEL_PART_SIZE_MB, token=None):
+    """
+    Download `msg` by splitting it into fixed-size parts that are streamed
+    concurrently and written at their offsets into a preallocated file.
+    Each part is retried on its own, resuming from its last written chunk.
+
+    Finished parts are recorded with their sha256 in a sidecar manifest, so
+    a later call for the same file skips every part that still verifies.
+    The manifest is removed once the whole file is on disk.
+
+    Parts go through client.stream_media: Pyrofork opens a media session
+    for each call, but at most max_concurrent_transmissions of them at a
+    time per client, shared with every other transfer of that client.
+    That limit, not `workers`, is the real ceiling on parallel connections.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, media_file_name(msg))
+    manifest_path = path + ".parts.json"
+    _, media = media_of(msg)
+    total_chunks = -(-file_size // CHUNK_SIZE)
+    parts = [(start, min(part_size_mb, total_chunks - start))
+             for start in range(0, total_chunks, part_size_mb)]
+
+    verified = await asyncio.to_thread(_load_manifest, path, manifest_path, media.file_unique_id, file_size, part_size_mb)
+    if verified:
+        logger.info(f"Resuming {path}: {len(verified)}/{len(parts)} parts already on disk")
+    else:
+        await asyncio.to_thread(sweep_partials, PARTIAL_TTL, directory)
+    manifest = {
+        "file_unique_id": media.file_unique_id,
+        "size": file_size,
+        "part_chunks": part_size_mb,
+        "done": {str(k): v for k, v in verified.items()}
+    }
+    manifest_lock = asyncio.Lock()
+
+    queue = asyncio.Queue()
+    done = 0
+    for start, count in parts:
+        if start in verified:
+            done += min(count * CHUNK_SIZE, file_size - start * CHUNK_SIZE)
+        else:
+            queue.put_nowait((start, count))
+
+    await asyncio.to_thread(_preallocate, path, file_size)
+    fd = os.open(path, os.O_RDWR)
+
+    async def fetch(start, count):
+        nonlocal done
+        written = 0
+        digest = hashlib.sha256()
+        for attempt in range(PART_RETRIES):
+            try:
+                async for chunk in client.stream_media(msg, offset=start + written, limit=count - written):
+                    if token:
+                        token.raise_if_cancelled()
+                    await asyncio.to_thread(os.pwrite, fd, chunk, (start + written) * CHUNK_SIZE)
+                    digest.update(chunk)
+                    written += 1
+                    done += len(chunk)
+                    if progress:
+                        progress(min(done, file_size), file_size, *progress_args)
+                if written >= count:
+                    async with manifest_lock:
+                        manifest["done"][str(start)] = digest.hexdigest()
+                        await asyncio.to_thread(_save_manifest, manifest_path, dict(manifest, done=dict(manifest["done"])))
+                    return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Expired references and permanent errors are handled by the caller's policy
+                kind = classify(e)
+                if kind not in (RETRYABLE, FLOOD) or attempt == PART_RETRIES - 1:
+                    raise
+                logger.warning(f"Part {start} of {msg.id} failed ({e}), retrying")
+                delay = e.value if kind == FLOOD else 2 ** attempt
+                await (token.sleep(delay) if token else asyncio.sleep(delay))
+        # A connection-level error, so the caller's retry policy resumes the download
+        raise ConnectionError(f"Part {start} of {msg.id} ended early")
+
+    async def worker():
+        while not queue.empty():
+            start, count = queue.get_nowait()
+            await fetch(start, count)
+
+    tasks = [asyncio.create_task(worker()) for _ in range(max(1, min(workers, queue.qsize())))]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    finally:
+        os.close(fd)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    return path
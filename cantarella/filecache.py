@@ -0,0 +1,151 @@
+import os
+import shutil
+import asyncio
+from collections import Counter, OrderedDict
+from config import MEDIA_CACHE_MB
+from metrics import CACHE_EVENTS, MEDIA_CACHE_BYTES
+from logger import LOGGER
+
+logger = LOGGER(__name__)
+
+# Finished source files, one directory per file_unique_id
+CACHE_ROOT = "downloads/cache"
+
+
+def _scan(root):
+    """Return [(key, path, size, mtime)] for complete entries, deleting anything else."""
+    entries = []
+    if not os.path.isdir(root):
+        return entries
+    for key in os.listdir(root):
+        directory = os.path.join(root, key)
+        try:
+            files = os.listdir(directory) if os.path.isdir(directory) else None
+        except OSError:
+            files = None
+        if not files or len(files) != 1:
+            # Stray file, empty directory or an interrupted admit
+            if os.path.isdir(directory):
+                shutil.rmtree(directory, ignore_errors=True)
+            else:
+                try:
+                    os.remove(directory)
+                except OSError:
+                    pass
+            continue
+        path = os.path.join(directory, files[0])
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((key, path, stat.st_size, stat.st_mtime))
+    return entries
+
+
+class MediaCache:
+    """
+    Source files kept on disk after a transfer, keyed by file_unique_id and
+    bounded by bytes. Least recently used entries are evicted first; entries
+    pinned by a running transfer are never evicted.
+    """
+
+    def __init__(self, root=CACHE_ROOT, budget=MEDIA_CACHE_MB * 1024 * 1024):
+        self.root = root
+        self.budget = budget
+        self._entries = OrderedDict()
+        self._pins = Counter()
+        self._size = 0
+
+    @property
+    def enabled(self):
+        return self.budget > 0
+
+    def pin(self, key):
+        """Keep `key` on disk until unpin(); works before the entry exists."""
+        self._pins[key] += 1
+
+    def unpin(self, key):
+        self._pins[key] -= 1
+        if self._pins[key] <= 0:
+            del self._pins[key]
+        self._evict()
+
+    def get(self, key):
+        """Path of the cached file for `key`, or None."""
+        entry = self._entries.get(key)
+        if entry and not os.path.exists(entry[0]):
+            self._drop(key)
+            entry = None
+        if entry is None:
+            CACHE_EVENTS.inc(cache="media", result="miss")
+            return None
+        CACHE_EVENTS.inc(cache="media", result="hit")
+        self._entries.move_to_end(key)
+        try:
+            # The mtime carries the LRU order across restarts
+            os.utime(entry[0])
+        except OSError:
+            pass
+        return entry[0]
+
+    async def admit(self, key, path):
+        """
+        Move a finished download into the cache and return its new path.
+        Files larger than the whole budget stay where they are.
+        """
+        size = os.path.getsize(path)
+        if not self.enabled or size > self.budget or key in self._entries:
+            return path
+        target = os.path.join(self.root, key, os.path.basename(path))
+        try:
+            await asyncio.to_thread(self._move, path, target)
+        except OSError as e:
+            logger.warning(f"Could not cache {path}: {e}")
+            return path
+        self._add(key, target, size)
+        self._evict()
+        return target
+
+    @staticmethod
+    def _move(path, target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+
+    async def reconcile(self):
+        """Index what a previous run left on disk, oldest first, and trim to the budget."""
+        if not self.enabled:
+            await asyncio.to_thread(shutil.rmtree, self.root, True)
+            return
+        entries = await asyncio.to_thread(_scan, self.root)
+        for key, path, size, _ in sorted(entries, key=lambda e: e[3], reverse=True):
+            if key not in self._entries:
+                self._add(key, path, size)
+                # Older than anything admitted since startup
+                self._entries.move_to_end(key, last=False)
+        self._evict()
+        logger.info(f"Media cache: {len(self._entries)} files, {self._size / 1024 / 1024:.1f} MiB")
+
+    def _add(self, key, path, size):
+        self._entries[key] = (path, size)
+        self._size += size
+        MEDIA_CACHE_BYTES.set(self._size)
+
+    def _drop(self, key):
+        path, size = self._entries.pop(key)
+        self._size -= size
+        MEDIA_CACHE_BYTES.set(self._size)
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+    def _evict(self):
+        if self._size <= self.budget:
+            return
+        for key in list(self._entries):
+            if self._size <= self.budget:
+                break
+            if self._pins[key] > 0:
+                continue
+            self._drop(key)
+            CACHE_EVENTS.inc(cache="media", result="evict")
+
+
+MEDIA_CACHE = MediaCache()
@@ -0,0 +1,123 @@
+import os
+import shutil
+import asyncio
+from collections import Counter
+from database.cache import TTLCache
+from cantarella.jobs import Cancelled
+from metrics import CACHE_EVENTS
+
+# How long the bot's file_id for an uploaded file is reused
+UPLOAD_TTL = 6 * 60 * 60
+
+
+def _leader_gave_up(flight):
+    return flight.cancelled() or isinstance(flight.exception(), Cancelled)
+
+
+async def _follow(flight, token):
+    # A follower stays cancellable and alive for /healthz while another job transfers
+    if token:
+        await token.wait_for(flight)
+    else:
+        await asyncio.wait({flight})
+
+
+class SharedDownloads:
+    """
+    Single-flight downloads keyed by file_unique_id. Concurrent requests for
+    the same media await one transfer and share the file, which is deleted
+    when the last holder releases it.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._refs = Counter()
+
+    def holders(self, key):
+        return self._refs[key]
+
+    async def acquire(self, key, download, token=None):
+        """Return the local path for `key`, running `download()` only if nobody else is."""
+        self._refs[key] += 1
+        try:
+            while True:
+                flight = self._flights.get(key)
+                if flight is None:
+                    return await self._lead(key, download)
+                CACHE_EVENTS.inc(cache="single_flight", result="hit")
+                await _follow(flight, token)
+                if _leader_gave_up(flight):
+                    # The first requester cancelled; whoever is still waiting takes over
+                    continue
+                return flight.result()
+        except BaseException:
+            self._refs[key] -= 1
+            raise
+
+    async def _lead(self, key, download):
+        flight = self._flights[key] = asyncio.get_running_loop().create_future()
+        try:
+            path = await download()
+        except asyncio.CancelledError:
+            self._flights.pop(key, None)
+            flight.cancel()
+            raise
+        except BaseException as e:
+            self._flights.pop(key, None)
+            flight.set_exception(e)
+            # Followers read it; this only silences "exception never retrieved"
+            flight.exception()
+            raise
+        flight.set_result(path)
+        return path
+
+    def release(self, key, directory=None):
+        self._refs[key] -= 1
+        if self._refs[key] > 0:
+            return
+        del self._refs[key]
+        self._flights.pop(key, None)
+        if directory and os.path.exists(directory):
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+class SharedUploads:
+    """
+    Bot-side file_ids of finished uploads, plus the uploads in flight. A
+    request for media the bot already sent (or is sending) is answered with
+    send_cached_media instead of another upload.
+    """
+
+    def __init__(self, ttl=UPLOAD_TTL, maxsize=2048):
+        self._done = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._flights = {}
+
+    async def acquire(self, key, token=None):
+        """
+        Returns (file_id, leader). With a file_id, re-send it. Without one the
+        caller uploads and, if leader is True, must call release() afterwards.
+        """
+        while True:
+            file_id = self._done.get(key)
+            if file_id:
+                CACHE_EVENTS.inc(cache="file_id", result="hit")
+                return file_id, False
+            flight = self._flights.get(key)
+            if flight is None:
+                CACHE_EVENTS.inc(cache="file_id", result="miss")
+                self._flights[key] = asyncio.get_running_loop().create_future()
+                return None, True
+            CACHE_EVENTS.inc(cache="single_flight", result="hit")
+            await _follow(flight, token)
+            # Either the file_id is cached now, or the leader failed and this caller leads next
+
+    def release(self, key, file_id=None):
+        flight = self._flights.pop(key, None)
+        if file_id:
+            self._done.set(key, file_id)
+        if flight and not flight.done():
+            flight.set_result(file_id)
+
+
+DOWNLOADS = SharedDownloads()
+UPLOADS = SharedUploads()
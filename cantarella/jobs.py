@@ -0,0 +1,124 @@
+import time
+import asyncio
+import itertools
+from pyrogram import StopTransmission
+from metrics import ACTIVE_JOBS, QUEUE_DEPTH
+
+
+class Cancelled(StopTransmission):
+    """
+    Raised inside a job once its token is cancelled. Subclassing
+    StopTransmission makes Pyrogram abort a transfer from a progress callback.
+    """
+
+
+class CancelToken:
+    """Cooperative cancellation flag passed through fetch, download, upload and retry."""
+
+    def __init__(self):
+        self._event = asyncio.Event()
+        self.last_activity = time.monotonic()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        self._event.set()
+
+    def raise_if_cancelled(self):
+        # Called once per chunk, so it doubles as the job's liveness heartbeat
+        self.last_activity = time.monotonic()
+        if self.cancelled:
+            raise Cancelled()
+
+    async def sleep(self, delay):
+        """Sleep that wakes up early and raises Cancelled when the job is cancelled."""
+        try:
+            await asyncio.wait_for(self._event.wait(), delay)
+        except asyncio.TimeoutError:
+            return
+        raise Cancelled()
+
+    async def wait_for(self, future, heartbeat=30):
+        """
+        Wait for a future this job does not own, such as another job's
+        transfer. Raises Cancelled as soon as this job is cancelled, and
+        keeps the job's heartbeat fresh while it waits.
+        """
+        event = asyncio.ensure_future(self._event.wait())
+        try:
+            while True:
+                self.raise_if_cancelled()
+                if future.done():
+                    return
+                await asyncio.wait({future, event}, timeout=heartbeat, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            event.cancel()
+
+
+def guard(current, total, token):
+    """Progress callback for transfers that show no progress but must stay cancellable."""
+    token.raise_if_cancelled()
+
+
+class Job:
+    def __init__(self, job_id, user_id, kind, description=""):
+        self.id = job_id
+        self.user_id = user_id
+        self.kind = kind
+        self.description = description
+        self.started = time.time()
+        self.token = CancelToken()
+        self.pending = 0
+        self.registry = None
+
+    def set_pending(self, pending):
+        """Messages this job still has to process; feeds the queue depth gauge."""
+        self.pending = pending
+        self.token.last_activity = time.monotonic()
+        if self.registry:
+            self.registry.publish()
+
+
+class JobRegistry:
+    """Active jobs per user, so /cancel can stop one job or all of them."""
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._jobs = {}
+
+    def start(self, user_id, kind, description=""):
+        job = Job(next(self._ids), user_id, kind, description)
+        job.registry = self
+        self._jobs[job.id] = job
+        self.publish()
+        return job
+
+    def finish(self, job):
+        self._jobs.pop(job.id, None)
+        self.publish()
+
+    def publish(self):
+        ACTIVE_JOBS.set(len(self._jobs))
+        QUEUE_DEPTH.set(sum(j.pending for j in self._jobs.values()))
+
+    def for_user(self, user_id, kind=None):
+        return [j for j in self._jobs.values()
+                if j.user_id == user_id and (kind is None or j.kind == kind)]
+
+    def cancel(self, user_id, job_id=None):
+        """Cancel one job (if job_id is given) or every job of the user; returns the cancelled jobs."""
+        jobs = [j for j in self.for_user(user_id) if job_id is None or j.id == job_id]
+        for job in jobs:
+            job.token.cancel()
+        return jobs
+
+    def all(self):
+        return list(self._jobs.values())
+
+    def __len__(self):
+        return len(self._jobs)
+
+
+JOBS = JobRegistry()
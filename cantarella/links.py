@@ -0,0 +1,252 @@
+import re
+import datetime
+from dataclasses import dataclass, replace
+from typing import List, Optional
+
+# One pattern finds every t.me link in a message, a second splits its path
+LINK_RE = re.compile(
+    r'(?:https?://)?(?:www\.)?(?:t|telegram)\.me/(?P<path>[^\s?#]+)(?:\?(?P<query>[^\s#]*))?',
+    re.IGNORECASE
+)
+PATH_RE = re.compile(
+    r'^(?:(?P<kind>c|b)/)?(?P<chat>[A-Za-z0-9_]+)(?:/(?P<topic>\d+))?/(?P<start>\d+)(?:-(?P<end>\d+))?/?$'
+)
+# A whole chat for /sync: t.me/c/<id> or t.me/<name>, optionally with a message id to start from
+CHAT_PATH_RE = re.compile(r'^(?:(?P<kind>c)/)?(?P<chat>[A-Za-z0-9_]+)(?:/(?P<start>\d+))?/?$')
+# Punctuation that ends a sentence around a link rather than belonging to it: "see t.me/chan/5)."
+TRAILING = '.,;:!)]}>\'"'
+QUERY_RE = re.compile(r'(?:^|&)(?P<key>comment|thread|single)(?:=(?P<value>\d+))?')
+
+# Batch options written after the links: type:video min:50MB max:2GB after:2024-01-01 before:2024-06-30 q:"some words" #tag
+OPTION_RE = re.compile(r'(?<!\S)(?:(?P<key>type|min|max|after|before|q):(?P<value>"[^"]*"|\S+)|(?P<tag>#\w+))', re.IGNORECASE)
+# Deliver a /batch as archive volumes: bundle (zip), bundle:zip or bundle:tar
+BUNDLE_RE = re.compile(r'(?<!\S)bundle(?::(?P<format>zip|tar))?(?!\S)', re.IGNORECASE)
+SIZE_RE = re.compile(r'^(?P<number>\d+(?:\.\d+)?)(?P<unit>[KMG]?)B?$', re.IGNORECASE)
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+# Media kinds as named by transfer.CODECS, plus the names users tend to type
+MEDIA_TYPES = {
+    'video': 'video', 'document': 'document', 'doc': 'document', 'file': 'document',
+    'photo': 'photo', 'audio': 'audio', 'music': 'audio', 'voice': 'voice',
+    'animation': 'animation', 'gif': 'animation', 'video_note': 'video_note', 'round': 'video_note',
+}
+
+# Most messages one link can address; t.me/chan/1-1000000 is cut to its first MAX_RANGE ids
+MAX_RANGE = 200
+
+# Paths on t.me that look like usernames but are not chats
+RESERVED = {'joinchat', 'addstickers', 'addemoji', 'share', 'proxy', 'socks', 'iv', 's', 'login'}
+
+
+@dataclass
+class LinkJob:
+    """
+    A normalized save request: messages `start`..`end` (inclusive) of one chat.
+    kind is 'private' (t.me/c/), 'bot' (t.me/b/) or 'public' (t.me/username).
+    For ?comment= links the ids are comments under post `comment_of`.
+    """
+    kind: str
+    chat: str
+    start: int
+    end: int
+    topic: Optional[int] = None
+    comment_of: Optional[int] = None
+
+    @property
+    def target(self):
+        """Chat identifier accepted by get_messages / copy_message."""
+        if self.kind == 'private':
+            return int(f'-100{self.chat}')
+        return self.chat
+
+    @property
+    def count(self):
+        return self.end - self.start + 1
+
+    def ids(self):
+        return range(self.start, self.end + 1)
+
+
+@dataclass
+class ChatRef:
+    """A whole chat, kind 'private' or 'public', with an optional first message id."""
+    kind: str
+    chat: str
+    start: Optional[int] = None
+
+    @property
+    def target(self):
+        if self.kind == 'private':
+            return int(f'-100{self.chat}')
+        return self.chat
+
+
+@dataclass
+class MessageFilter:
+    """
+    Which messages of a range a batch delivers. The kind, text query and
+    dates are applied by Telegram's search; sizes are checked on the
+    results, before anything is downloaded.
+    """
+    kind: Optional[str] = None
+    min_size: int = 0
+    max_size: Optional[int] = None
+    # Naive local datetimes, like Message.date
+    after: Optional[datetime.datetime] = None
+    before: Optional[datetime.datetime] = None
+    query: str = ''
+
+
+def _parse_size(value):
+    m = SIZE_RE.match(value)
+    if not m:
+        raise ValueError(f'Invalid size: {value} (use e.g. 500KB, 50MB, 2GB)')
+    return int(float(m.group('number')) * SIZE_UNITS[m.group('unit').upper()])
+
+
+def _parse_date(value):
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f'Invalid date: {value} (use YYYY-MM-DD)') from None
+
+
+def parse_filter(text: str) -> Optional[MessageFilter]:
+    """
+    Parse the batch options in `text`, ignoring its links; None if there
+    are none. Raises ValueError with a message for the user on a bad value.
+    """
+    flt = MessageFilter()
+    words = []
+    found = False
+    for m in OPTION_RE.finditer(LINK_RE.sub(' ', text or '')):
+        found = True
+        if m.group('tag'):
+            words.append(m.group('tag'))
+            continue
+        key, value = m.group('key').lower(), m.group('value').strip('"')
+        if key == 'type':
+            if value.lower() not in MEDIA_TYPES:
+                raise ValueError(f'Unknown type: {value} (one of {", ".join(sorted(set(MEDIA_TYPES.values())))})')
+            flt.kind = MEDIA_TYPES[value.lower()]
+        elif key == 'min':
+            flt.min_size = _parse_size(value)
+        elif key == 'max':
+            flt.max_size = _parse_size(value)
+        elif key == 'after':
+            flt.after = _parse_date(value)
+        elif key == 'before':
+            # The whole day is included
+            flt.before = _parse_date(value) + datetime.timedelta(days=1)
+        elif value:
+            words.append(value)
+    if not found:
+        return None
+    flt.query = ' '.join(words)
+    return flt
+
+
+def parse_bundle(text: str) -> Optional[str]:
+    """Archive format asked for in `text`, 'zip' or 'tar', or None."""
+    m = BUNDLE_RE.search(LINK_RE.sub(' ', text or ''))
+    if not m:
+        return None
+    return (m.group('format') or 'zip').lower()
+
+
+def parse_chat(text: str) -> Optional[ChatRef]:
+    """Parse a chat link, @username or -100<id>; None if `text` is none of those."""
+    text = (text or '').strip()
+    if re.fullmatch(r'-100\d+', text):
+        return ChatRef('private', text[4:])
+    if re.fullmatch(r'@[A-Za-z][A-Za-z0-9_]{3,}', text):
+        return ChatRef('public', text[1:])
+    m = LINK_RE.fullmatch(text)
+    path = CHAT_PATH_RE.match(m.group('path').rstrip(TRAILING)) if m else None
+    if not path:
+        return None
+    kind = 'private' if path.group('kind') else 'public'
+    chat = path.group('chat')
+    if kind == 'private' and not chat.isdigit():
+        return None
+    if kind == 'public' and (chat.isdigit() or chat.lower() in RESERVED):
+        return None
+    start = int(path.group('start')) if path.group('start') else None
+    return ChatRef(kind, chat, start)
+
+
+def _parse_match(m):
+    path = PATH_RE.match(m.group('path').rstrip(TRAILING))
+    if not path:
+        return None
+    kind = {'c': 'private', 'b': 'bot', None: 'public'}[path.group('kind')]
+    chat = path.group('chat')
+    if kind == 'private' and not chat.isdigit():
+        return None
+    if kind != 'private' and (chat.isdigit() or chat.lower() in RESERVED):
+        return None
+
+    start = int(path.group('start'))
+    end = int(path.group('end') or start)
+    topic = int(path.group('topic')) if path.group('topic') else None
+    comment_of = None
+    for q in QUERY_RE.finditer(m.group('query') or ''):
+        key, value = q.group('key'), q.group('value')
+        if key == 'single':
+            end = start
+        elif key == 'thread' and value:
+            topic = int(value)
+        elif key == 'comment' and value:
+            # t.me/chan/POST?comment=ID addresses a comment in the discussion group
+            comment_of = start
+            start = end = int(value)
+    if end < start:
+        start, end = end, start
+    end = min(end, start + MAX_RANGE - 1)
+    return LinkJob(kind, chat, start, end, topic, comment_of)
+
+
+def _split(job):
+    # A merged range stays within MAX_RANGE ids per job
+    for start in range(job.start, job.end + 1, MAX_RANGE):
+        yield replace(job, start=start, end=min(job.end, start + MAX_RANGE - 1))
+
+
+def coalesce(jobs: List[LinkJob]) -> List[LinkJob]:
+    """
+    Merge duplicate, overlapping and adjacent ranges of the same chat, keeping
+    first-seen order. Returns new jobs of at most MAX_RANGE ids each; the
+    given ones are left as they are.
+    """
+    groups = {}
+    for job in jobs:
+        key = (job.kind, job.chat.lower(), job.comment_of)
+        groups.setdefault(key, []).append(job)
+
+    merged = []
+    for group in groups.values():
+        group.sort(key=lambda j: j.start)
+        current = replace(group[0])
+        for job in group[1:]:
+            if job.start <= current.end + 1:
+                current.end = max(current.end, job.end)
+            else:
+                merged.extend(_split(current))
+                current = replace(job)
+        merged.extend(_split(current))
+    return merged
+
+
+def extract_jobs(text: str) -> List[LinkJob]:
+    """Find every message link in `text` and return deduplicated jobs."""
+    if not text:
+        return []
+    jobs = [job for job in map(_parse_match, LINK_RE.finditer(text)) if job]
+    return coalesce(jobs)
+
+
+async def resolve_target(client, job: LinkJob):
+    """Chat to fetch ids from; comment links live in the linked discussion group."""
+    if job.comment_of is None:
+        return job.target
+    post = await client.get_discussion_message(job.target, job.comment_of)
+    return post.chat.id
@@ -0,0 +1,113 @@
+"""
+Event-Loop Watchdog
+
+A heartbeat task measures how late the event loop wakes it up (loop lag).
+A separate thread watches that heartbeat; when the loop has not come back
+for longer than the threshold, it samples the loop thread's stack so the
+blocking call shows up in the logs while it is still blocking.
+"""
+
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from collections import deque
+from config import LOOP_LAG_THRESHOLD
+from metrics import LOOP_LAG_SECONDS, LOOP_LAG_QUANTILES, LOOP_STALLS
+from logger import LOGGER
+
+logger = LOGGER(__name__)
+
+# How often the heartbeat wakes up
+INTERVAL = 0.25
+# Recent lag samples used for the percentile gauges (~5 minutes)
+WINDOW = 1200
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LoopWatchdog:
+    def __init__(self, threshold=LOOP_LAG_THRESHOLD, interval=INTERVAL):
+        self.threshold = threshold
+        self.interval = interval
+        self.samples = deque(maxlen=WINDOW)
+        self._beat = time.monotonic()
+        self._loop_thread = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Must be called from the event loop thread."""
+        if self._task:
+            return
+        if self._thread:
+            # The old watcher must see the stop flag before it is cleared, or two would run
+            self._thread.join()
+            self._thread = None
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread:
+            # It wakes up within threshold / 4; wait for it off the loop
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+
+    async def _heartbeat(self):
+        beats = 0
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat = now
+            lag = max(0.0, now - expected)
+            self.samples.append(lag)
+            LOOP_LAG_SECONDS.observe(lag)
+            beats += 1
+            if beats % 20 == 0:
+                self.publish()
+
+    def publish(self):
+        samples = list(self.samples)
+        for q in QUANTILES:
+            LOOP_LAG_QUANTILES.set(percentile(samples, q), quantile=q)
+
+    def _watch(self):
+        reported = None
+        while not self._stop.wait(self.threshold / 4):
+            beat = self._beat
+            stalled = time.monotonic() - beat - self.interval
+            if stalled < self.threshold or reported == beat:
+                continue
+            # Report each stall once, with the stack as it is right now
+            reported = beat
+            LOOP_STALLS.inc()
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<no frame>"
+            logger.warning(
+                f"Event loop blocked for {stalled:.2f}s, loop thread stack:\n{stack}",
+                extra={"stage": "loop", "duration": stalled}
+            )
+
+
+WATCHDOG = LoopWatchdog()
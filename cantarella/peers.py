@@ -0,0 +1,118 @@
+import time
+from pyrogram import raw, utils
+from config import PEER_CACHE_TTL, PEER_CACHE_LIMIT
+from database.db import db
+from database.cache import TTLCache
+from logger import LOGGER
+
+logger = LOGGER(__name__)
+
+# Errors meaning the stored access_hash or username no longer points at the chat
+STALE_PEER_IDS = {"CHANNEL_INVALID", "PEER_ID_INVALID"}
+
+
+def is_stale_peer(e):
+    return getattr(e, "ID", None) in STALE_PEER_IDS
+
+
+def _key(chat):
+    return chat.lower().lstrip("@") if isinstance(chat, str) else int(chat)
+
+
+def _describe(input_peer):
+    """(storage id, access_hash, storage type) for an InputPeer; None for self/empty peers."""
+    if isinstance(input_peer, raw.types.InputPeerChannel):
+        return utils.get_channel_id(input_peer.channel_id), input_peer.access_hash, "channel"
+    if isinstance(input_peer, raw.types.InputPeerUser):
+        return input_peer.user_id, input_peer.access_hash, "user"
+    if isinstance(input_peer, raw.types.InputPeerChat):
+        return -input_peer.chat_id, 0, "group"
+    return None
+
+
+async def _owner(client):
+    # The account behind the session; access hashes are only valid for it
+    return await client.storage.user_id()
+
+
+class PeerCache:
+    """
+    Resolved peers shared by every client of the same account, persisted in
+    Mongo so new in-memory user clients (and the bot after a redeploy) can
+    skip ResolveUsername/GetChannels for chats they have already seen.
+    """
+
+    def __init__(self, ttl=PEER_CACHE_TTL, limit=PEER_CACHE_LIMIT):
+        self.ttl = ttl
+        self.limit = limit
+        # (owner, key) pairs already persisted, so hot chats are written once
+        self._known = TTLCache(maxsize=4096, ttl=ttl)
+
+    async def inject(self, client):
+        """Load the account's known peers into a freshly connected client's storage."""
+        try:
+            owner = await _owner(client)
+            docs = await db.get_peers(owner, time.time() - self.ttl, self.limit)
+        except Exception as e:
+            logger.warning(f"Peer cache load failed: {e}")
+            return 0
+        if not docs:
+            return 0
+        storage = client.storage
+        try:
+            # Rows are (id, access_hash, type, username, phone_number)
+            await storage.update_peers([(d["peer_id"], d["access_hash"], d["type"], d.get("username"), None) for d in docs])
+            if hasattr(storage, "update_usernames"):
+                # Pyrofork also resolves usernames through their own table of (peer_id, username) rows
+                await storage.update_usernames([(d["peer_id"], d["username"]) for d in docs if d.get("username")])
+        except Exception as e:
+            logger.warning(f"Peer cache inject failed for {owner}: {e}")
+            return 0
+        for d in docs:
+            self._known.set((owner, d["key"]), True)
+        return len(docs)
+
+    async def remember(self, client, chat):
+        """Persist how `client` resolved `chat`; call after an RPC on it succeeded."""
+        key = _key(chat)
+        try:
+            owner = await _owner(client)
+            if self._known.get((owner, key)):
+                return
+            # Served from the client's storage, which the successful call just filled
+            described = _describe(await client.resolve_peer(chat))
+        except Exception:
+            return
+        if not described:
+            return
+        peer_id, access_hash, peer_type = described
+        try:
+            await db.save_peer(owner, key, {
+                "peer_id": peer_id,
+                "access_hash": access_hash,
+                "type": peer_type,
+                "username": key if isinstance(key, str) else None,
+                "updated": time.time(),
+            })
+            self._known.set((owner, key), True)
+        except Exception as e:
+            logger.warning(f"Peer cache save failed for {owner}/{key}: {e}")
+
+    async def forget(self, client, chat):
+        key = _key(chat)
+        try:
+            owner = await _owner(client)
+            self._known.pop((owner, key))
+            await db.delete_peer(owner, key)
+        except Exception as e:
+            logger.warning(f"Peer cache invalidation failed for {key}: {e}")
+
+    async def check(self, client, chat, error):
+        """Drop the cached peer if `error` says it went stale; returns True when it did."""
+        if not is_stale_peer(error):
+            return False
+        await self.forget(client, chat)
+        return True
+
+
+PEERS = PeerCache()
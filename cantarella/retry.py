@@ -0,0 +1,110 @@
+import asyncio
+import random
+from collections import Counter
+from pyrogram.errors import FloodWait, RPCError
+from logger import LOGGER
+from metrics import FLOOD_WAIT_SECONDS
+
+logger = LOGGER(__name__)
+
+# How a failure should be handled
+RETRYABLE = "retryable"
+PERMANENT = "permanent"
+REFRESH = "refresh_reference"
+FLOOD = "flood_wait"
+
+# Transient RPC errors that Telegram documents as "try again"
+TRANSIENT_IDS = {
+    "RPC_CALL_FAIL", "RPC_MCGET_FAIL", "TIMEOUT", "MSG_WAIT_FAILED", "MSG_WAIT_TIMEOUT",
+    "PERSISTENT_TIMESTAMP_OUTDATED", "WORKER_BUSY_TOO_LONG_RETRY", "INTERDC_X_CALL_ERROR",
+    "INTERDC_X_CALL_RICH_ERROR", "FILE_WRITE_FAILED",
+}
+
+
+def _rpc_id(e):
+    return str(getattr(e, "ID", None) or "")
+
+
+def classify(e):
+    if isinstance(e, FloodWait):
+        return FLOOD
+    if isinstance(e, RPCError):
+        rpc_id = _rpc_id(e)
+        if rpc_id.startswith("FILE_REFERENCE_"):
+            return REFRESH
+        # 5xx and -503 are server side hiccups. A 303 migration that gets this far was not
+        # followed by Pyrogram, and the same call would only fail again
+        if getattr(e, "CODE", None) in (500, 503, -503) or rpc_id in TRANSIENT_IDS:
+            return RETRYABLE
+        return PERMANENT
+    # Only transport failures; other OSErrors (disk full, missing file) repeat on retry
+    if isinstance(e, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return RETRYABLE
+    return PERMANENT
+
+
+def reason_of(e):
+    """
+    Short stable key used to group failures in batch reports and label
+    error metrics: an RPC error ID or an exception class name, never the
+    message, so the set of values stays bounded.
+    """
+    if isinstance(e, FloodWait):
+        return "flood_wait"
+    if isinstance(e, RPCError):
+        return _rpc_id(e).lower() or type(e).__name__.lower()
+    if isinstance(e, (asyncio.TimeoutError, TimeoutError)):
+        return "timeout"
+    if isinstance(e, ConnectionError):
+        return "network"
+    return type(e).__name__
+
+
+class RetryPolicy:
+    """
+    Retries an awaitable factory with jittered exponential backoff.
+    FloodWaits sleep for the requested time, expired file references call
+    `refresh` (which should re-fetch the message) and permanent errors raise.
+    An optional CancelToken stops retries and cuts backoff sleeps short.
+    """
+
+    def __init__(self, attempts=4, base=1.0, cap=30.0, max_flood=300):
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.max_flood = max_flood
+
+    def backoff(self, attempt):
+        return random.uniform(self.base, min(self.cap, self.base * 2 ** attempt))
+
+    async def run(self, op, refresh=None, token=None):
+        sleep = token.sleep if token else asyncio.sleep
+        for attempt in range(self.attempts):
+            if token:
+                token.raise_if_cancelled()
+            try:
+                return await op()
+            except Exception as e:
+                kind = classify(e)
+                last = attempt == self.attempts - 1
+                if kind == PERMANENT or last or (kind == REFRESH and refresh is None):
+                    raise
+                if kind == FLOOD:
+                    if e.value > self.max_flood:
+                        raise
+                    FLOOD_WAIT_SECONDS.inc(e.value)
+                    await sleep(e.value + 1)
+                elif kind == REFRESH:
+                    await refresh()
+                else:
+                    await sleep(self.backoff(attempt))
+                logger.info(f"Retrying after {reason_of(e)} ({kind}), attempt {attempt + 2}/{self.attempts}")
+
+
+def format_breakdown(failures: Counter):
+    if not failures:
+        return ""
+    return "\n".join(f"• {reason}: {count}" for reason, count in failures.most_common())
+
+
+DEFAULT_POLICY = RetryPolicy()
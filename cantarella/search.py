@@ -0,0 +1,80 @@
+from pyrogram import raw, utils, enums
+from cantarella.transfer import codec_of
+from cantarella.retry import DEFAULT_POLICY
+
+# messages.search returns at most this many messages per call
+PAGE_SIZE = 100
+
+# Telegram-side filter for each media kind of links.MEDIA_TYPES
+SEARCH_FILTERS = {
+    None: enums.MessagesFilter.EMPTY,
+    'video': enums.MessagesFilter.VIDEO,
+    'document': enums.MessagesFilter.DOCUMENT,
+    'photo': enums.MessagesFilter.PHOTO,
+    'audio': enums.MessagesFilter.AUDIO,
+    'voice': enums.MessagesFilter.VOICE_NOTE,
+    'animation': enums.MessagesFilter.ANIMATION,
+    'video_note': enums.MessagesFilter.VIDEO_NOTE,
+}
+
+
+def matches(flt, msg):
+    """The checks Telegram's search cannot do: exact kind and file size."""
+    if not msg or getattr(msg, 'empty', False) or getattr(msg, 'service', None):
+        return False
+    codec = codec_of(msg)
+    if flt.kind and (codec is None or codec.kind != flt.kind):
+        return False
+    size = codec.size(msg) if codec else 0
+    if size < flt.min_size or (flt.max_size is not None and size > flt.max_size):
+        return False
+    return True
+
+
+async def _page(client, chat_id, flt, offset_id, min_id, max_id):
+    # offset_id with add_offset=-limit pages forward: ids from offset_id up
+    r = await client.invoke(
+        raw.functions.messages.Search(
+            peer=await client.resolve_peer(chat_id),
+            q=flt.query,
+            filter=SEARCH_FILTERS[flt.kind].value(),
+            min_date=int(flt.after.timestamp()) if flt.after else 0,
+            max_date=int(flt.before.timestamp()) if flt.before else 0,
+            offset_id=offset_id,
+            add_offset=-PAGE_SIZE,
+            limit=PAGE_SIZE,
+            max_id=max_id,
+            min_id=min_id,
+            hash=0
+        ),
+        sleep_threshold=60
+    )
+    return await utils.parse_messages(client, r, replies=0)
+
+
+async def find_messages(client, chat_id, flt, start=1, end=None, limit=0, token=None):
+    """
+    Yield the messages of chat_id between ids `start` and `end` (inclusive,
+    None for no end) that match `flt`, oldest first, at most `limit` of them.
+    Telegram skips deleted ids, service messages and other kinds, so a sparse
+    range costs one request per hundred matches instead of one per id.
+    Search runs on user accounts only.
+    """
+    offset_id = max(start, 1)
+    found = 0
+    while True:
+        page = await DEFAULT_POLICY.run(
+            lambda: _page(client, chat_id, flt, offset_id, max(start - 1, 0), end + 1 if end else 0), token=token)
+        full = len(page) == PAGE_SIZE
+        page = sorted((m for m in page if m.id >= offset_id), key=lambda m: m.id)
+        for msg in page:
+            if end and msg.id > end:
+                return
+            if matches(flt, msg):
+                yield msg
+                found += 1
+                if limit and found >= limit:
+                    return
+        if not full or not page:
+            return
+        offset_id = page[-1].id + 1
@@ -2,6 +2,7 @@
 # Telegram: @cantarellabots | @THEUPDATEDGUYS
 
 import asyncio
+import time
 from pyrogram import Client, filters
 from pyrogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 from pyrogram.errors import (
@@ -13,10 +14,15 @@ from pyrogram.errors import (
     PasswordHashInvalid
 )
 from pyrogram import enums
-from config import API_ID, API_HASH
+from config import API_ID, API_HASH, LOGIN_TIMEOUT, LOGIN_RPC_TIMEOUT, MAX_PENDING_LOGINS
 from database.db import db
+from cantarella.watch import WATCHES
+from logger import LOGGER
+
+logger = LOGGER(__name__)
 
 LOGIN_STATE = {}
+_REAPER = None
 cancel_keyboard = ReplyKeyboardMarkup(
     [[KeyboardButton("❌ Cancel")]],
     resize_keyboard=True
@@ -29,23 +35,62 @@ PROGRESS_STEPS = {
     "WAITING_PASSWORD": "✅ Phone Number → ✅ Code → 🟢 Password"
 }
 
-LOADING_FRAMES = [
-    "🔄 Connecting •••",
-    "🔄 Connecting ••○",
-    "🔄 Connecting •○○",
-    "🔄 Connecting ○○○",
-    "🔄 Connecting ○○•",
-    "🔄 Connecting ○••",
-    "🔄 Connecting •••"
-]
-async def animate_loading(message: Message, duration: int = 5):
-    for _ in range(duration):
-        for frame in LOADING_FRAMES:
-            try:
-                await message.edit_text(f"<b>{frame}</b>", parse_mode=enums.ParseMode.HTML)
-                await asyncio.sleep(0.5)
-            except:
-                return
+async def delayed_status(message: Message, text: str, delay: float = 3):
+    """
+    Edit the status message once, and only if the step is still running
+    after `delay` seconds. Cancel the task when the step finishes.
+    """
+    try:
+        await asyncio.sleep(delay)
+        await message.edit_text(f"<b>{text}</b>", parse_mode=enums.ParseMode.HTML)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        pass
+
+def touch_login(user_id):
+    state = LOGIN_STATE.get(user_id)
+    if state:
+        state["deadline"] = time.monotonic() + LOGIN_TIMEOUT
+
+async def discard_login(user_id):
+    """Forget a pending login and close its temporary client."""
+    state = LOGIN_STATE.pop(user_id, None)
+    if not state:
+        return False
+    temp_client = state.get("data", {}).get("client")
+    if temp_client:
+        try:
+            await temp_client.disconnect()
+        except Exception:
+            pass
+    return True
+
+async def _reap_logins():
+    while LOGIN_STATE:
+        await asyncio.sleep(min(30, LOGIN_TIMEOUT))
+        now = time.monotonic()
+        for user_id, state in list(LOGIN_STATE.items()):
+            if state.get("deadline", now) > now:
+                continue
+            bot = state.get("bot")
+            await discard_login(user_id)
+            logger.info(f"Reaped abandoned login for {user_id}")
+            if bot:
+                try:
+                    await bot.send_message(
+                        user_id,
+                        "<b>⏰ Login timed out.</b>\n\nSend /login to start again.",
+                        parse_mode=enums.ParseMode.HTML,
+                        reply_markup=remove_keyboard
+                    )
+                except Exception:
+                    pass
+
+def ensure_reaper():
+    global _REAPER
+    if _REAPER is None or _REAPER.done():
+        _REAPER = asyncio.create_task(_reap_logins())
 
 @Client.on_message(filters.private & filters.command("login"))
 async def login_start(client: Client, message: Message):
@@ -59,7 +104,17 @@ async def login_start(client: Client, message: Message):
             parse_mode=enums.ParseMode.HTML
         )
    
-    LOGIN_STATE[user_id] = {"step": "WAITING_PHONE", "data": {}}
+    if user_id not in LOGIN_STATE and len(LOGIN_STATE) >= MAX_PENDING_LOGINS:
+        return await message.reply(
+            "<b>⏳ Too many logins in progress right now.</b>\n\n"
+            "Please try again in a few minutes.",
+            parse_mode=enums.ParseMode.HTML
+        )
+
+    await discard_login(user_id)
+    LOGIN_STATE[user_id] = {"step": "WAITING_PHONE", "data": {}, "bot": client}
+    touch_login(user_id)
+    ensure_reaper()
    
     progress = PROGRESS_STEPS["WAITING_PHONE"]
     await message.reply(
@@ -77,8 +132,10 @@ async def login_start(client: Client, message: Message):
 async def logout(client: Client, message: Message):
     user_id = message.from_user.id
    
-    if user_id in LOGIN_STATE:
-        del LOGIN_STATE[user_id]
+    await discard_login(user_id)
+    # Watches run on this session; they cannot outlive it
+    await WATCHES.stop_user(user_id)
+    await db.delete_watch(user_id)
    
     await db.set_session(user_id, session=None)
     await message.reply(
@@ -87,20 +144,12 @@ async def logout(client: Client, message: Message):
         parse_mode=enums.ParseMode.HTML
     )
 
-@Client.on_message(filters.private & filters.command(["cancel", "cancellogin"]))
+# Plain /cancel is handled in start.py and also ends a pending login
+@Client.on_message(filters.private & filters.command("cancellogin"))
 async def cancel_login(client: Client, message: Message):
     user_id = message.from_user.id
    
-    if user_id in LOGIN_STATE:
-        state = LOGIN_STATE[user_id]
-       
-        if "data" in state and "client" in state["data"]:
-            try:
-                await state["data"]["client"].disconnect()
-            except:
-                pass
-       
-        del LOGIN_STATE[user_id]
+    if await discard_login(user_id):
         await message.reply(
             "<b>❌ Login process cancelled. 😌</b>",
             parse_mode=enums.ParseMode.HTML,
@@ -117,17 +166,15 @@ login_state_filter = filters.create(check_login_state)
 async def login_handler(bot: Client, message: Message):
     user_id = message.from_user.id
     text = message.text
-    state = LOGIN_STATE[user_id]
+    state = LOGIN_STATE.get(user_id)
+    if not state:
+        return
     step = state["step"]
     progress = PROGRESS_STEPS.get(step, "")
+    touch_login(user_id)
    
     if text.strip().lower() == "❌ cancel":
-        if "data" in state and "client" in state["data"]:
-            try:
-                await state["data"]["client"].disconnect()
-            except:
-                pass
-        del LOGIN_STATE[user_id]
+        await discard_login(user_id)
         await message.reply(
             "<b>❌ Login process cancelled. 😌</b>",
             parse_mode=enums.ParseMode.HTML,
@@ -138,27 +185,29 @@ async def login_handler(bot: Client, message: Message):
     if step == "WAITING_PHONE":
         phone_number = text.replace(" ", "")
        
-        temp_client = Client(
-            name=f"session_{user_id}",
-            api_id=API_ID,
-            api_hash=API_HASH,
-            in_memory=True
-        )
-       
         status_msg = await message.reply(
             f"<b>🔄 Connecting to Telegram... 🌐</b>\n\n<i>Progress: {progress}</i>",
             parse_mode=enums.ParseMode.HTML
         )
        
-        animation_task = asyncio.create_task(animate_loading(status_msg))
-       
-        await temp_client.connect()
-        animation_task.cancel() 
+        status_task = asyncio.create_task(delayed_status(status_msg, "🔄 Still connecting, please wait..."))
        
         try:
-            code = await temp_client.send_code(phone_number)
+            # Reuse the connection if the user is retrying after a bad number
+            temp_client = state["data"].get("client")
+            if temp_client is None:
+                temp_client = Client(
+                    name=f"session_{user_id}",
+                    api_id=API_ID,
+                    api_hash=API_HASH,
+                    in_memory=True
+                )
+                state["data"]["client"] = temp_client
+                await asyncio.wait_for(temp_client.connect(), LOGIN_RPC_TIMEOUT)
+           
+            code = await asyncio.wait_for(temp_client.send_code(phone_number), LOGIN_RPC_TIMEOUT)
+            status_task.cancel()
            
-            state["data"]["client"] = temp_client
             state["data"]["phone"] = phone_number
             state["data"]["hash"] = code.phone_code_hash
             state["step"] = "WAITING_CODE"
@@ -174,22 +223,29 @@ async def login_handler(bot: Client, message: Message):
             )
            
         except PhoneNumberInvalid:
+            status_task.cancel()
             await status_msg.edit(
                 "<b>❌ Oops! Invalid phone number format. 😅</b>\n\n"
                 f"<i>Progress: {progress}</i>\n\n"
-                "Please try again (e.g., +919876543210).",
+                "Please send it again (e.g., +919876543210).",
                 parse_mode=enums.ParseMode.HTML
             )
-            await temp_client.disconnect()
-            del LOGIN_STATE[user_id]
+        except asyncio.TimeoutError:
+            status_task.cancel()
+            await status_msg.edit(
+                "<b>⌛ Telegram did not respond in time.</b>\n\n"
+                f"<i>Progress: {progress}</i>\n\nPlease try /login again.",
+                parse_mode=enums.ParseMode.HTML
+            )
+            await discard_login(user_id)
         except Exception as e:
+            status_task.cancel()
             await status_msg.edit(
                 f"<b>❌ Something went wrong: {e} 🤔</b>\n\n"
                 f"<i>Progress: {progress}</i>\n\nPlease try /login again.",
                 parse_mode=enums.ParseMode.HTML
             )
-            await temp_client.disconnect()
-            del LOGIN_STATE[user_id]
+            await discard_login(user_id)
    
     elif step == "WAITING_CODE":
         phone_code = text.replace(" ", "")
@@ -203,31 +259,30 @@ async def login_handler(bot: Client, message: Message):
             parse_mode=enums.ParseMode.HTML
         )
        
-        animation_task = asyncio.create_task(animate_loading(status_msg, duration=3))
+        status_task = asyncio.create_task(delayed_status(status_msg, "🔍 Still verifying, please wait..."))
        
         try:
-            await temp_client.sign_in(phone_number, phone_hash, phone_code)
-            animation_task.cancel()
+            await asyncio.wait_for(temp_client.sign_in(phone_number, phone_hash, phone_code), LOGIN_RPC_TIMEOUT)
+            status_task.cancel()
            
             await finalize_login(status_msg, temp_client, user_id)
         except PhoneCodeInvalid:
-            animation_task.cancel()
+            status_task.cancel()
             await status_msg.edit(
                 "<b>❌ Hmm, that code doesn't look right. 🔍</b>\n\n"
                 f"<i>Progress: {progress}</i>\n\nPlease check your Telegram app and try again.",
                 parse_mode=enums.ParseMode.HTML
             )
         except PhoneCodeExpired:
-            animation_task.cancel()
+            status_task.cancel()
             await status_msg.edit(
                 "<b>⏰ Code has expired. ⏳</b>\n\n"
                 f"<i>Progress: {progress}</i>\n\nPlease start over with /login.",
                 parse_mode=enums.ParseMode.HTML
             )
-            await temp_client.disconnect()
-            del LOGIN_STATE[user_id]
+            await discard_login(user_id)
         except SessionPasswordNeeded:
-            animation_task.cancel()
+            status_task.cancel()
            
             state["step"] = "WAITING_PASSWORD"
             progress = PROGRESS_STEPS["WAITING_PASSWORD"]
@@ -239,13 +294,12 @@ async def login_handler(bot: Client, message: Message):
                 parse_mode=enums.ParseMode.HTML
             )
         except Exception as e:
-            animation_task.cancel()
+            status_task.cancel()
             await status_msg.edit(
                 f"<b>❌ Something went wrong: {e} 🤔</b>\n\n<i>Progress: {progress}</i>",
                 parse_mode=enums.ParseMode.HTML
             )
-            await temp_client.disconnect()
-            del LOGIN_STATE[user_id]
+            await discard_login(user_id)
    
     elif step == "WAITING_PASSWORD":
         password = text
@@ -256,37 +310,33 @@ async def login_handler(bot: Client, message: Message):
             parse_mode=enums.ParseMode.HTML
         )
        
-        animation_task = asyncio.create_task(animate_loading(status_msg, duration=3))
+        status_task = asyncio.create_task(delayed_status(status_msg, "🔑 Still checking, please wait..."))
        
         try:
-            await temp_client.check_password(password=password)
-            animation_task.cancel()
+            await asyncio.wait_for(temp_client.check_password(password=password), LOGIN_RPC_TIMEOUT)
+            status_task.cancel()
             await finalize_login(status_msg, temp_client, user_id)
         except PasswordHashInvalid:
-            animation_task.cancel()
+            status_task.cancel()
             await status_msg.edit(
                 "<b>❌ Incorrect password. 🔑</b>\n\n"
                 f"<i>Progress: {progress}</i>\n\nPlease try again.",
                 parse_mode=enums.ParseMode.HTML
             )
         except Exception as e:
-            animation_task.cancel()
+            status_task.cancel()
             await status_msg.edit(
                 f"<b>❌ Something went wrong: {e} 🤔</b>\n\n<i>Progress: {progress}</i>",
                 parse_mode=enums.ParseMode.HTML
             )
-            await temp_client.disconnect()
-            del LOGIN_STATE[user_id]
+            await discard_login(user_id)
 
 async def finalize_login(status_msg: Message, temp_client, user_id):
     try:
         session_string = await temp_client.export_session_string()
-        await temp_client.disconnect()
+        await discard_login(user_id)
        
         await db.set_session(user_id, session=session_string)
-       
-        if user_id in LOGIN_STATE:
-            del LOGIN_STATE[user_id]
            
         await status_msg.edit(
             "<b>🎉 Login Successful! 🌟</b>\n\n"
@@ -302,5 +352,4 @@ async def finalize_login(status_msg: Message, temp_client, user_id):
             parse_mode=enums.ParseMode.HTML,
             reply_markup=remove_keyboard
         )
-        if user_id in LOGIN_STATE:
-            del LOGIN_STATE[user_id]
\ No newline at end of file
+        await discard_login(user_id)
\ No newline at end of file
@@ -60,7 +60,9 @@ async def set_dump_chat(client: Client, message: Message):
             "<b>🗑 Set Dump Chat</b>\n\n"
             "<b>Usage:</b>\n"
             "<code>/setchat &lt;chat_id&gt;</code> → Set forward destination\n"
-            "<code>/setchat clear</code> → Remove dump chat\n\n"
+            "<code>/setchat add &lt;chat_id&gt;</code> → Add another destination\n"
+            "<code>/setchat remove &lt;chat_id&gt;</code> → Remove one destination\n"
+            "<code>/setchat clear</code> → Remove all dump chats\n\n"
             "<i>Example: /setchat -1001234567890</i>",
             parse_mode=enums.ParseMode.HTML
         )
@@ -68,16 +70,27 @@ async def set_dump_chat(client: Client, message: Message):
     if arg == "clear":
         await db.set_dump_chat(user_id, None)
         return await message.reply_text("✅ <b>Dump Chat Cleared Successfully</b>", parse_mode=enums.ParseMode.HTML)
+    action = "set"
+    if arg in ("add", "remove"):
+        if len(message.command) < 3:
+            return await message.reply_text(f"<b>Usage:</b> <code>/setchat {arg} &lt;chat_id&gt;</code>", parse_mode=enums.ParseMode.HTML)
+        action, arg = arg, message.command[2].strip()
     try:
         chat_id = int(arg)
+        if action == "remove":
+            await db.remove_dump_chat(user_id, chat_id)
+            return await message.reply_text(f"✅ <b>Removed</b> <code>{chat_id}</code> <b>from your dump chats</b>", parse_mode=enums.ParseMode.HTML)
         try:
             chat = await client.get_chat(chat_id)
             chat_title = chat.title or "Private Chat"
         except:
             chat_title = "Unknown Chat"
-        await db.set_dump_chat(user_id, chat_id)
+        if action == "add":
+            await db.add_dump_chat(user_id, chat_id)
+        else:
+            await db.set_dump_chat(user_id, chat_id)
         await message.reply_text(
-            f"✅ <b>Dump Chat Set Successfully</b>\n\n"
+            f"✅ <b>Dump Chat {'Added' if action == 'add' else 'Set'} Successfully</b>\n\n"
             f"<b>Forward To:</b> <code>{chat_id}</code>\n"
             f"<b>Title:</b> {chat_title}",
             parse_mode=enums.ParseMode.HTML
@@ -104,19 +117,21 @@ async def settings_callbacks(client: Client, callback_query: CallbackQuery):
             disable_web_page_preview=True
         )
     elif data == "dump_chat_btn":
-        current = await db.get_dump_chat(user_id)
-        if current:
-            try:
-                chat = await client.get_chat(current)
-                title = chat.title or "Private Chat"
-            except:
-                title = "Unknown (Inaccessible)"
+        chats = await db.get_dump_chats(user_id)
+        if chats:
+            lines = []
+            for chat_id in chats:
+                try:
+                    chat = await client.get_chat(chat_id)
+                    title = chat.title or "Private Chat"
+                except:
+                    title = "Unknown (Inaccessible)"
+                lines.append(f"• <code>{chat_id}</code> — {title}")
             text = (
-                f"<b>🗑 Current Dump Chat</b>\n\n"
-                f"<b>Chat ID:</b> <code>{current}</code>\n"
-                f"<b>Title:</b> {title}\n\n"
-                "<i>All saved files are forwarded here.</i>\n"
-                "<i>Use /setchat to change or clear.</i>"
+                "<b>🗑 Current Dump Chats</b>\n\n"
+                + "\n".join(lines) +
+                "\n\n<i>All saved files are forwarded here.</i>\n"
+                "<i>Use /setchat to add, remove or clear.</i>"
             )
         else:
             text = (
@@ -6,21 +6,33 @@ import random
 import time
 import shutil
 import pyrogram
-import requests
+import aiohttp
 import hashlib 
 from pyrogram import Client, filters, enums
 from pyrogram.errors import (
     FloodWait, UserIsBlocked, InputUserDeactivated, UserAlreadyParticipant,
     InviteHashExpired, UsernameNotOccupied, AuthKeyUnregistered, UserDeactivated, UserDeactivatedBan
 )
-from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Message, CallbackQuery, InputMediaPhoto
-from config import API_ID, API_HASH, ERROR_MESSAGE
+from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Message, CallbackQuery, InputMediaPhoto, ReplyKeyboardRemove
+from config import ERROR_MESSAGE, FREE_LIMIT_SIZE
 from database.db import db
+from cantarella.links import extract_jobs, resolve_target, parse_filter
+from cantarella.search import find_messages
+from cantarella.delivery import fan_out
+from cantarella.downloader import media_file_name
+from cantarella.retry import DEFAULT_POLICY, reason_of
+from cantarella.jobs import JOBS, CancelToken, Cancelled
+from cantarella.clients import user_client
+from cantarella.peers import PEERS
+from cantarella.access import CHAT_ACCESS
+from cantarella.transfer import codec_of, is_resumable, download, release, upload, fetch_thumb, send_cached, finish_upload, transfer
+from cantarella.session import discard_login
+from cantarella.batch import BATCH_STATE
+from metrics import STAGE_SECONDS, ERRORS
 import math
 from logger import LOGGER
 logger = LOGGER(__name__)
 SUBSCRIPTION = os.environ.get('SUBSCRIPTION', 'https://graph.org/file/242b7f1b52743938d81f1.jpg')
-FREE_LIMIT_SIZE = 2 * 1024 * 1024 * 1024
 FREE_LIMIT_DAILY = 10
 UPI_ID = os.environ.get("UPI_ID", "your_upi@oksbi")
 QR_CODE = os.environ.get("QR_CODE", "https://graph.org/file/242b7f1b52743938d81f1.jpg")
@@ -147,22 +159,15 @@ def TimeFormatter(milliseconds: int) -> str:
         ((str(minutes) + "m, ") if minutes else "") + \
         ((str(seconds) + "s, ") if seconds else "")
     return tmp[:-2] if tmp else "0s"
-class batch_temp(object):
-    IS_BATCH = {}
-def get_message_type(msg):
-    if getattr(msg, 'document', None): return "Document"
-    if getattr(msg, 'video', None): return "Video"
-    if getattr(msg, 'photo', None): return "Photo"
-    if getattr(msg, 'audio', None): return "Audio"
-    if getattr(msg, 'text', None): return "Text"
-    return None
+def read_status(statusfile):
+    with open(statusfile, "r", encoding='utf-8') as status:
+        return status.read()
 async def downstatus(client, statusfile, message, chat):
     while not os.path.exists(statusfile):
         await asyncio.sleep(3)
     while os.path.exists(statusfile):
         try:
-            with open(statusfile, "r", encoding='utf-8') as downread:
-                txt = downread.read()
+            txt = await asyncio.to_thread(read_status, statusfile)
             await client.edit_message_text(chat, message.id, f"{txt}")
             await asyncio.sleep(5)
         except:
@@ -172,15 +177,14 @@ async def upstatus(client, statusfile, message, chat):
         await asyncio.sleep(3)
     while os.path.exists(statusfile):
         try:
-            with open(statusfile, "r", encoding='utf-8') as upread:
-                txt = upread.read()
+            txt = await asyncio.to_thread(read_status, statusfile)
             await client.edit_message_text(chat, message.id, f"{txt}")
             await asyncio.sleep(5)
         except:
             await asyncio.sleep(5)
-def progress(current, total, message, type):
-    if batch_temp.IS_BATCH.get(message.from_user.id):
-        raise Exception("Cancelled")
+def progress(current, total, message, type, token=None):
+    if token:
+        token.raise_if_cancelled()
     if not hasattr(progress, "cache"):
         progress.cache = {}
    
@@ -223,6 +227,17 @@ def progress(current, total, message, type):
                 progress.cache.pop(task_id, None)
         except:
             pass
+async def fetch_start_photo(fallback):
+    """Random /start image, fetched without blocking the event loop."""
+    apis = ["https://api.waifu.pics/sfw/waifu", "https://nekos.life/api/v2/img/waifu"]
+    try:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5)) as session:
+            async with session.get(random.choice(apis)) as response:
+                response.raise_for_status()
+                return (await response.json(content_type=None))["url"]
+    except Exception as e:
+        logger.error(f"Failed to fetch image from API: {e}")
+        return fallback
 @Client.on_message(filters.command(["start"]))
 async def send_start(client: Client, message: Message):
     if not await db.is_user_exist(message.from_user.id):
@@ -231,15 +246,7 @@ async def send_start(client: Client, message: Message):
         await message.react(emoji=random.choice(REACTIONS), big=True)
     except:
         pass
-    apis = ["https://api.waifu.pics/sfw/waifu", "https://nekos.life/api/v2/img/waifu"]
-    api_url = random.choice(apis)
-    try:
-        response = requests.get(api_url)
-        response.raise_for_status()
-        photo_url = response.json()["url"]
-    except Exception as e:
-        logger.error(f"Failed to fetch image from API: {e}")
-        photo_url = "https://i.postimg.cc/kX9tjGXP/16.png"
+    photo_url = await fetch_start_photo("https://i.postimg.cc/kX9tjGXP/16.png")
     buttons = [
         [
             InlineKeyboardButton("💎 Buy Premium", callback_data="buy_premium"),
@@ -288,8 +295,35 @@ async def send_plan(client: Client, message: Message):
     )
 @Client.on_message(filters.command(["cancel"]))
 async def send_cancel(client: Client, message: Message):
-    batch_temp.IS_BATCH[message.from_user.id] = True
-    await message.reply_text("❌ Batch Process Cancelled Successfully.")
+    user_id = message.from_user.id
+    job_id = None
+    if len(message.command) > 1 and message.command[1].isdigit():
+        job_id = int(message.command[1])
+    stopped = [f"{job.kind} <code>{job.id}</code>" for job in JOBS.cancel(user_id, job_id)]
+    if job_id is None:
+        # /cancel also aborts a pending login or a half-configured /batch
+        if await discard_login(user_id):
+            stopped.append("login")
+        if BATCH_STATE.pop(user_id, None):
+            stopped.append("batch setup")
+    if stopped:
+        await message.reply_text(
+            f"<b>❌ Cancelled {len(stopped)} task(s):</b> {', '.join(stopped)}",
+            reply_markup=ReplyKeyboardRemove(),
+            parse_mode=enums.ParseMode.HTML
+        )
+    else:
+        await message.reply_text("<b>ℹ️ Nothing to cancel.</b>", parse_mode=enums.ParseMode.HTML)
+@Client.on_message(filters.command(["jobs"]) & filters.private)
+async def list_jobs(client: Client, message: Message):
+    jobs = JOBS.for_user(message.from_user.id)
+    if not jobs:
+        return await message.reply_text("<b>ℹ️ No active tasks.</b>", parse_mode=enums.ParseMode.HTML)
+    lines = [f"• <code>{job.id}</code> — {job.kind} {job.description} ({TimeFormatter((time.time() - job.started) * 1000)})" for job in jobs]
+    await message.reply_text(
+        "<b>⚙️ Active Tasks</b>\n\n" + "\n".join(lines) + "\n\n<i>Use /cancel &lt;id&gt; to stop one task or /cancel to stop all.</i>",
+        parse_mode=enums.ParseMode.HTML
+    )
 async def settings_panel(client, callback_query):
     """
     Renders the Settings Menu with professional layout.
@@ -316,7 +350,12 @@ async def settings_panel(client, callback_query):
     )
 @Client.on_message(filters.text & filters.private & ~filters.regex("^/"))
 async def save(client: Client, message: Message):
-    if "https://t.me/" in message.text:
+    links = extract_jobs(message.text)
+    if links:
+        try:
+            flt = parse_filter(message.text)
+        except ValueError as e:
+            return await message.reply_text(f"<b>❌ {e}</b>", parse_mode=enums.ParseMode.HTML)
        
         is_limit_reached = await db.check_limit(message.from_user.id)
         if is_limit_reached:
@@ -328,88 +367,142 @@ async def save(client: Client, message: Message):
                 parse_mode=enums.ParseMode.HTML
             )
        
-        if batch_temp.IS_BATCH.get(message.from_user.id) == False:
+        if JOBS.for_user(message.from_user.id, "save"):
             return await message.reply_text("<b>⚠️ A Task is Currently Processing.</b>\n<i>Please wait for completion or use /cancel to stop.</i>", parse_mode=enums.ParseMode.HTML)
-        datas = message.text.split("/")
-        temp = datas[-1].replace("?single", "").split("-")
-        fromID = int(temp[0].strip())
-        try:
-            toID = int(temp[1].strip())
-        except:
-            toID = fromID
-        batch_temp.IS_BATCH[message.from_user.id] = False
-        is_private_link = "https://t.me/c/" in message.text
-        is_batch = "https://t.me/b/" in message.text
-        is_public_link = not is_private_link and not is_batch
-        for msgid in range(fromID, toID + 1):
-           
-            if batch_temp.IS_BATCH.get(message.from_user.id):
-                break
-           
-            if is_public_link:
-                username = datas[3]
-                try:
-                    await client.copy_message(
-                        chat_id=message.chat.id,
-                        from_chat_id=username,
-                        message_id=msgid,
-                        reply_to_message_id=message.id
-                    )
-                    await db.add_traffic(message.from_user.id)
-                    await asyncio.sleep(1)
-                    continue
-                except Exception as e:
-                    pass
-            user_data = await db.get_session(message.from_user.id)
-            if user_data is None:
-                await message.reply(
-                    "<b>🔒 Authentication Required</b>\n\n"
-                    "<i>Access to this content requires login.</i>\n"
-                    "<i>Use /login to securely authorize your account.</i>",
-                    parse_mode=enums.ParseMode.HTML
-                )
-                batch_temp.IS_BATCH[message.from_user.id] = True
+        pending = sum(link.count for link in links)
+        job = JOBS.start(message.from_user.id, "save", f"{pending} message(s)")
+        destinations = await db.get_dump_chats(message.from_user.id)
+        acc = None
+
+        async def messages_of(link):
+            # With options, Telegram's search yields only the matching messages of the range
+            nonlocal pending
+            if flt is None:
+                for msgid in link.ids():
+                    yield msgid, None
                 return
+            found = 0
             try:
-                acc = Client(
-                    "saverestricted",
-                    session_string=user_data,
-                    api_hash=API_HASH,
-                    api_id=API_ID,
-                    in_memory=True,
-                    max_concurrent_transmissions=10
-                )
-                await acc.connect()
+                async for msg in find_messages(acc, target, flt, link.start, link.end, token=job.token):
+                    found += 1
+                    yield msg.id, msg
+            except Cancelled:
+                raise
             except Exception as e:
-                batch_temp.IS_BATCH[message.from_user.id] = True
-                return await message.reply(f"<b>❌ Authentication Failed</b>\n\n<i>Your session may have expired. Please /logout and /login again.</i>\n<code>{e}</code>", parse_mode=enums.ParseMode.HTML)
-            if is_private_link:
-                chatid = int("-100" + datas[4])
-                await handle_restricted_content(client, acc, message, chatid, msgid)
-            elif is_batch:
-                username = datas[4]
-                await handle_restricted_content(client, acc, message, username, msgid)
-            else:
-                username = datas[3]
-                await handle_restricted_content(client, acc, message, username, msgid)
-            await asyncio.sleep(2)
-        batch_temp.IS_BATCH[message.from_user.id] = True
-async def handle_restricted_content(client: Client, acc, message: Message, chat_target, msgid):
+                logger.error(f"Searching {link} failed: {reason_of(e)}")
+                await PEERS.check(acc, target, e)
+            pending -= link.count - found
+
+        try:
+            for link in links:
+                target = None
+                if flt:
+                    # Search runs on the user's account; the bot cannot search chats
+                    acc = acc or await open_account(message)
+                    if acc is None:
+                        return
+                    try:
+                        target = await resolve_target(acc, link)
+                    except Exception as e:
+                        logger.error(f"Error resolving {link}: {e}")
+                        await PEERS.check(acc, link.target, e)
+                        continue
+                async for msgid, found in messages_of(link):
+                   
+                    if job.token.cancelled:
+                        return
+                    job.set_pending(pending)
+                    pending -= 1
+                   
+                    # A chat that refused the bot once goes straight to the user session
+                    if found is None and link.kind == 'public' and link.comment_of is None and CHAT_ACCESS.bot_allowed(link.target):
+                        try:
+                            copied = await client.copy_message(
+                                chat_id=message.chat.id,
+                                from_chat_id=link.target,
+                                message_id=msgid,
+                                reply_to_message_id=message.id
+                            )
+                            await PEERS.remember(client, link.target)
+                            CHAT_ACCESS.bot_ok(link.target)
+                            await fan_out(client, copied, destinations, job.token)
+                            await db.add_traffic(message.from_user.id)
+                        except Cancelled:
+                            raise
+                        except Exception as e:
+                            await PEERS.check(client, link.target, e)
+                            CHAT_ACCESS.bot_failed(link.target, e)
+                        else:
+                            # Outside the try: a /cancel here is not the bot failing to copy
+                            await job.token.sleep(1)
+                            continue
+                    if acc is None:
+                        acc = await open_account(message)
+                        if acc is None:
+                            return
+                    if target is None:
+                        try:
+                            target = await resolve_target(acc, link)
+                        except Exception as e:
+                            logger.error(f"Error resolving {link}: {e}")
+                            await PEERS.check(acc, link.target, e)
+                            break
+                    if CHAT_ACCESS.inaccessible(message.from_user.id, target):
+                        await message.reply(
+                            "<b>❌ Cannot Access This Chat</b>\n\n"
+                            "<i>Your account is not a member of it, or it no longer exists. Skipping the rest of this link.</i>",
+                            parse_mode=enums.ParseMode.HTML
+                        )
+                        break
+                    await handle_restricted_content(client, acc, message, target, msgid, destinations, job.token, found)
+                    await job.token.sleep(2)
+        except Cancelled:
+            pass
+        finally:
+            JOBS.finish(job)
+            if acc is not None:
+                try:
+                    await acc.disconnect()
+                except Exception:
+                    pass
+async def open_account(message: Message):
+    """The user's account client for save(), or None after telling them why not."""
+    user_data = await db.get_session(message.from_user.id)
+    if user_data is None:
+        await message.reply(
+            "<b>🔒 Authentication Required</b>\n\n"
+            "<i>Access to this content requires login.</i>\n"
+            "<i>Use /login to securely authorize your account.</i>",
+            parse_mode=enums.ParseMode.HTML
+        )
+        return None
+    try:
+        return await user_client(user_data, max_concurrent_transmissions=10)
+    except Exception as e:
+        await message.reply(f"<b>❌ Authentication Failed</b>\n\n<i>Your session may have expired. Please /logout and /login again.</i>\n<code>{e}</code>", parse_mode=enums.ParseMode.HTML)
+        return None
+
+
+async def handle_restricted_content(client: Client, acc, message: Message, chat_target, msgid, destinations=(), token=None, found=None):
+    token = token or CancelToken()
     try:
-        msg: Message = await acc.get_messages(chat_target, msgid)
+        with STAGE_SECONDS.time(stage="fetch"):
+            # Batches filtered by search already hold the message
+            msg: Message = found or await DEFAULT_POLICY.run(lambda: acc.get_messages(chat_target, msgid), token=token)
     except Exception as e:
-        logger.error(f"Error fetching message: {e}")
+        ERRORS.inc(stage="fetch", reason=reason_of(e))
+        logger.error(f"Error fetching message {msgid}: {reason_of(e)}")
+        await PEERS.check(acc, chat_target, e)
+        CHAT_ACCESS.user_failed(message.from_user.id, chat_target, e)
         return
+    await PEERS.remember(acc, chat_target)
     if msg.empty:
         return
    
-    msg_type = get_message_type(msg)
-    if not msg_type:
+    codec = None if msg.text else codec_of(msg)
+    if not msg.text and not codec:
         return
-    file_size = 0
-    if msg_type == "Document": file_size = msg.document.file_size
-    elif msg_type == "Video": file_size = msg.video.file_size
-    elif msg_type == "Audio": file_size = msg.audio.file_size
+    file_size = codec.size(msg) if codec else 0
    
     if file_size > FREE_LIMIT_SIZE:
         if not await db.check_premium(message.from_user.id):
@@ -421,73 +514,89 @@ async def handle_restricted_content(client: Client, acc, message: Message, chat_
                 parse_mode=enums.ParseMode.HTML
             )
             return
-    if msg_type == "Text":
+    if msg.text:
         try:
-            await client.send_message(message.chat.id, msg.text, entities=msg.entities, parse_mode=enums.ParseMode.HTML)
+            sent = await client.send_message(message.chat.id, msg.text, entities=msg.entities, parse_mode=enums.ParseMode.HTML)
+            await fan_out(client, sent, destinations, token)
             return
         except:
             return
     await db.add_traffic(message.from_user.id)
+    if not codec.reupload:
+        # Stickers are re-sent by file_id; there is no transfer to show progress for
+        try:
+            await transfer(client, acc, msg, message.chat.id, destinations=destinations, token=token)
+        except Exception as e:
+            ERRORS.inc(stage="upload", reason=reason_of(e))
+        return
+    thumb_id = await db.get_thumbnail(message.from_user.id)
+    custom_caption = await db.get_caption(message.from_user.id)
+    file_name = media_file_name(msg)
+    if custom_caption:
+        caption = custom_caption.format(filename=file_name, size=humanbytes(file_size))
+    else:
+        caption = script.CAPTION.format(file_name=file_name)
+        if msg.caption:
+            caption += f"\n\n{msg.caption}"
+    # A custom thumbnail is baked into the upload, so only requests without one share the bot's upload
+    sent, upload_leader = (None, False) if thumb_id else await send_cached(client, message.chat.id, msg, caption, token)
+    if sent:
+        await fan_out(client, sent, destinations, token)
+        return
+    try:
+        sent = await transfer_restricted(client, acc, message, msg, chat_target, msgid, thumb_id, caption, destinations, token)
+    finally:
+        if upload_leader:
+            finish_upload(msg, sent)
+async def transfer_restricted(client, acc, message, msg, chat_target, msgid, thumb_id, caption, destinations, token):
+    """Download and upload through the transfer engine with status messages; returns the sent message."""
     smsg = await client.send_message(message.chat.id, '<b>⬇️ Starting Download...</b>', reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
    
+    # Only thumbnails go here; download_media creates it when one is fetched
     temp_dir = f"downloads/{message.id}"
-    if not os.path.exists(temp_dir): os.makedirs(temp_dir)
+    status_tasks = [asyncio.create_task(downstatus(client, f'{message.id}downstatus.txt', smsg, message.chat.id))]
     try:
-        asyncio.create_task(downstatus(client, f'{message.id}downstatus.txt', smsg, message.chat.id))
-       
-        file = await acc.download_media(
-            msg,
-            file_name=f"{temp_dir}/",
-            progress=progress,
-            progress_args=[message, "down"]
-        )
+        file = await download(acc, msg, refetch=lambda: acc.get_messages(chat_target, msgid),
+                              progress=progress, progress_args=(message, "down", token), token=token)
        
         if os.path.exists(f'{message.id}downstatus.txt'): os.remove(f'{message.id}downstatus.txt')
     except Exception as e:
-        if batch_temp.IS_BATCH.get(message.from_user.id) or "Cancelled" in str(e):
-            if os.path.exists(temp_dir): shutil.rmtree(temp_dir)
-            return await smsg.edit("❌ **Task Cancelled**")
-        return await smsg.delete()
+        status_tasks[0].cancel()
+        if os.path.exists(f'{message.id}downstatus.txt'): os.remove(f'{message.id}downstatus.txt')
+        if token.cancelled:
+            await smsg.edit("❌ **Task Cancelled**")
+            return None
+        logger.error(f"Download of {msgid} failed: {reason_of(e)}")
+        ERRORS.inc(stage="download", reason=reason_of(e))
+        if is_resumable(msg):
+            await smsg.edit("<b>⚠️ Download Interrupted</b>\n<i>Send the link again to resume from where it stopped.</i>", parse_mode=enums.ParseMode.HTML)
+            return None
+        await smsg.delete()
+        return None
+    sent = None
     try:
-        asyncio.create_task(upstatus(client, f'{message.id}upstatus.txt', smsg, message.chat.id))
-       
-        ph_path = None
-        thumb_id = await db.get_thumbnail(message.from_user.id)
-       
-        if thumb_id:
-            try:
-                ph_path = await client.download_media(thumb_id, file_name=f"{temp_dir}/custom_thumb.jpg")
-            except Exception as e:
-                logger.error(f"Failed to download custom thumb: {e}")
-        if not ph_path:
-            try:
-                if msg_type == "Video" and msg.video.thumbs:
-                    ph_path = await acc.download_media(msg.video.thumbs[0].file_id, file_name=f"{temp_dir}/thumb.jpg")
-                elif msg_type == "Document" and msg.document.thumbs:
-                    ph_path = await acc.download_media(msg.document.thumbs[0].file_id, file_name=f"{temp_dir}/thumb.jpg")
-            except:
-                pass
-        custom_caption = await db.get_caption(message.from_user.id)
-        if custom_caption:
-            final_caption = custom_caption.format(filename=file.split("/")[-1], size=humanbytes(file_size))
-        else:
-            final_caption = script.CAPTION.format(file_name=file.split("/")[-1])
-            if msg.caption:
-                final_caption += f"\n\n{msg.caption}"
-        if msg_type == "Document":
-            await client.send_document(message.chat.id, file, thumb=ph_path, caption=final_caption, progress=progress, progress_args=[message, "up"])
-        elif msg_type == "Video":
-            await client.send_video(message.chat.id, file, duration=msg.video.duration, width=msg.video.width, height=msg.video.height, thumb=ph_path, caption=final_caption, progress=progress, progress_args=[message, "up"])
-        elif msg_type == "Audio":
-            await client.send_audio(message.chat.id, file, thumb=ph_path, caption=final_caption, progress=progress, progress_args=[message, "up"])
-        elif msg_type == "Photo":
-            await client.send_photo(message.chat.id, file, caption=final_caption)
+        status_tasks.append(asyncio.create_task(upstatus(client, f'{message.id}upstatus.txt', smsg, message.chat.id)))
+        ph_path = await fetch_thumb(client, acc, msg, thumb_id, temp_dir)
+        sent = await upload(client, message.chat.id, msg, file, caption=caption, thumb=ph_path,
+                            progress=progress, progress_args=(message, "up", token), token=token)
+        # One upload, then server-side copies to every dump chat
+        await fan_out(client, sent, destinations, token)
        
+    except Cancelled:
+        await smsg.edit("❌ **Task Cancelled**")
+        smsg = None
     except Exception as e:
+         ERRORS.inc(stage="upload", reason=reason_of(e))
          await smsg.edit(f"Upload Failed: {e}")
+    for task in status_tasks:
+        task.cancel()
     if os.path.exists(f'{message.id}upstatus.txt'): os.remove(f'{message.id}upstatus.txt')
     if os.path.exists(temp_dir): shutil.rmtree(temp_dir)
-    await client.delete_messages(message.chat.id, [smsg.id])
+    release(msg)
+    if smsg:
+        await client.delete_messages(message.chat.id, [smsg.id])
+    return sent
+
 @Client.on_callback_query()
 async def button_callbacks(client: Client, callback_query: CallbackQuery):
     data = callback_query.data
@@ -541,15 +650,7 @@ async def button_callbacks(client: Client, callback_query: CallbackQuery):
         )
     elif data == "start_btn":
         bot = await client.get_me()
-        apis = ["https://api.waifu.pics/sfw/waifu", "https://nekos.life/api/v2/img/waifu"]
-        api_url = random.choice(apis)
-        try:
-            response = requests.get(api_url)
-            response.raise_for_status()
-            photo_url = response.json()["url"]
-        except Exception as e:
-            logger.error(f"Failed to fetch image from API: {e}")
-            photo_url = "https://i.postimg.cc/cC7txyhz/15.png"
+        photo_url = await fetch_start_photo("https://i.postimg.cc/cC7txyhz/15.png")
         buttons = [
             [
                 InlineKeyboardButton("💎 Buy Premium", callback_data="buy_premium"),
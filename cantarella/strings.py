@@ -14,6 +14,9 @@ HELP_TXT = """<b>🚀 Welcome to cantarella Save Restricted Bot - Complete Guide
 • Simply <b>send any Telegram post link</b> (public or private).
 • For <b>batch saving</b>: Send a link like <code>https://t.me/channel/100-110</code> (from message ID 100 to 110).
 • The bot will save all files/media in the range.
+• Paste several links or ranges in one message to save them all in one go.
+• Add filters after a range to save only what matches, e.g. <code>type:video min:50MB after:2024-01-01 before:2024-06-30 q:lecture #notes</code> (needs /login).
+• In /batch, add <code>bundle</code> (or <code>bundle:tar</code>) after the link to receive the files as a few archives instead of one message each.
 
 <b>3. Features</b>
 • Custom captions with {filename} & {size} placeholders
@@ -32,12 +35,17 @@ HELP_TXT = """<b>🚀 Welcome to cantarella Save Restricted Bot - Complete Guide
 
 <blockquote><b>/login</b> — Login with session string (for restricted channels)</blockquote>
 <blockquote><b>/logout</b> — Logout current session</blockquote>
-<blockquote><b>/cancel</b> — Cancel ongoing batch save</blockquote>
+<blockquote><b>/cancel</b> — Cancel ongoing batch save (or <code>/cancel &lt;id&gt;</code> for one task)</blockquote>
+<blockquote><b>/jobs</b> — List your running tasks</blockquote>
+<blockquote><b>/sync &lt;chat&gt;</b> — Deliver only the posts of a chat you have not received yet</blockquote>
+<blockquote><b>/watch &lt;chat&gt;</b> — Forward new posts of a chat as they appear (premium)</blockquote>
+<blockquote><b>/unwatch &lt;chat&gt;</b> — Stop watching a chat</blockquote>
 
 <blockquote><b>/myplan</b> — View your plan status & quota</blockquote>
 <blockquote><b>/premium</b> — Premium plans & benefits</blockquote>
 
 <blockquote><b>/setchat &lt;chat_id&gt;</b> — Set dump chat (auto-forward saved files)</blockquote>
+<blockquote><b>/setchat add &lt;chat_id&gt;</b> — Add another dump chat</blockquote>
 <blockquote><b>/setchat clear</b> — Remove dump chat</blockquote>
 
 <blockquote><b>/set_caption &lt;text&gt;</b> — Set custom caption (use {filename} & {size})</blockquote>
@@ -69,6 +77,9 @@ COMMANDS_TXT = """<b>📜 All Available Commands</b>
 /login  — Connect account
 /logout — Disconnect account
 /cancel — Stop current task
+/sync — Get new posts of a chat
+/watch — Forward new posts live
+/unwatch — Stop watching a chat
 </blockquote>
 
 <b>💎 Plan & Quota</b>
@@ -80,6 +91,7 @@ COMMANDS_TXT = """<b>📜 All Available Commands</b>
 <b>📤 Dump Chat</b>
 <blockquote>
 /setchat &lt;chat_id&gt; — Set forward destination
+/setchat add &lt;chat_id&gt; — Add another destination
 /setchat clear — Remove dump chat
 </blockquote>
 
@@ -0,0 +1,217 @@
+from collections import Counter
+from pyrogram import Client, filters, enums
+from pyrogram.types import Message
+from config import SYNC_MAX_MESSAGES, FREE_LIMIT_SIZE
+from database.db import db
+from cantarella.links import parse_chat
+from cantarella.batch import get_user_client, deliver_message
+from cantarella.transfer import codec_of
+from cantarella.retry import DEFAULT_POLICY, PERMANENT, classify, reason_of, format_breakdown
+from cantarella.jobs import JOBS, Cancelled
+from cantarella.peers import PEERS
+from cantarella.access import CHAT_ACCESS
+from logger import LOGGER
+
+logger = LOGGER(__name__)
+
+# get_messages accepts up to 200 ids per call
+FETCH_CHUNK = 100
+# Ids that failed transiently are retried by the next runs, up to this many
+MAX_RETRY_IDS = 200
+# Share of a run that retries may take, so new posts always make progress
+RETRY_SHARE = 0.5
+# Progress is saved this often, so a crash or /cancel loses little
+CHECKPOINT_EVERY = 20
+
+USAGE = (
+    '<b>🔁 Sync a Channel</b>\n\n'
+    '<code>/sync &lt;chat link | @username | -100id&gt;</code>\n'
+    '<i>Delivers only posts you have not received yet. The first run starts at the linked post '
+    f'(e.g. <code>t.me/c/123/50</code>) or with the latest {SYNC_MAX_MESSAGES}.</i>\n\n'
+    '<code>/sync</code> — list synced chats\n'
+    '<code>/sync reset &lt;chat&gt;</code> — forget what was delivered'
+)
+
+
+async def _latest_id(uc, chat_id):
+    async for msg in uc.get_chat_history(chat_id, limit=1):
+        return msg.id
+    return 0
+
+
+async def _find_state(uid, ref):
+    """Stored sync state matching a chat reference, without resolving it."""
+    for state in await db.get_syncs(uid):
+        if ref.kind == 'private' and state['chat'] == ref.target:
+            return state
+        if ref.kind == 'public' and (state.get('username') or '').lower() == ref.chat.lower():
+            return state
+    return None
+
+
+async def list_syncs(message):
+    states = await db.get_syncs(message.from_user.id)
+    if not states:
+        return await message.reply(USAGE, parse_mode=enums.ParseMode.HTML)
+    lines = [
+        f"• <b>{state.get('title') or state['chat']}</b> (<code>{state['chat']}</code>) — up to #{state.get('last_id', 0)}"
+        + (f", {len(state['retry'])} to retry" if state.get('retry') else '')
+        for state in states
+    ]
+    await message.reply('<b>🔁 Synced Chats</b>\n\n' + '\n'.join(lines), parse_mode=enums.ParseMode.HTML)
+
+
+@Client.on_message(filters.private & filters.command('sync'))
+async def sync_cmd(client: Client, message: Message):
+    uid = message.from_user.id
+    args = message.command[1:]
+    if not args:
+        return await list_syncs(message)
+    if args[0].lower() == 'reset':
+        ref = parse_chat(args[1]) if len(args) > 1 else None
+        state = await _find_state(uid, ref) if ref else None
+        if not state:
+            return await message.reply('<b>ℹ️ That chat is not synced.</b>', parse_mode=enums.ParseMode.HTML)
+        await db.delete_sync(uid, state['chat'])
+        return await message.reply('<b>✅ Sync state cleared.</b> The next /sync starts over.', parse_mode=enums.ParseMode.HTML)
+
+    ref = parse_chat(args[0])
+    if not ref:
+        return await message.reply(USAGE, parse_mode=enums.ParseMode.HTML)
+    if JOBS.for_user(uid, 'sync'):
+        return await message.reply('<b>⚠️ A Sync is Already Running.</b>\n<i>Wait for it or use /cancel.</i>', parse_mode=enums.ParseMode.HTML)
+    if await db.check_limit(uid):
+        return await message.reply('Daily limit reached (10 files/24h). Upgrade to premium.')
+    uc = await get_user_client(uid)
+    if not uc:
+        return await message.reply('Login required to sync a chat. Use /login first.')
+
+    status = await message.reply('Checking for new posts...')
+    job = JOBS.start(uid, 'sync', args[0])
+    try:
+        await run_sync(client, uc, message, ref, status, job)
+    finally:
+        JOBS.finish(job)
+        try:
+            await uc.stop()
+        except Exception:
+            pass
+
+
+async def run_sync(bot, uc, message, ref, status, job):
+    uid = message.from_user.id
+    token = job.token
+    if CHAT_ACCESS.inaccessible(uid, ref.target):
+        return await status.edit('This chat is not accessible from your account.')
+    try:
+        chat = await DEFAULT_POLICY.run(lambda: uc.get_chat(ref.target), token=token)
+        await PEERS.remember(uc, ref.target)
+        latest = await DEFAULT_POLICY.run(lambda: _latest_id(uc, chat.id), token=token)
+    except Cancelled:
+        return await status.edit('Sync cancelled.')
+    except Exception as e:
+        await PEERS.check(uc, ref.target, e)
+        CHAT_ACCESS.user_failed(uid, ref.target, e)
+        return await status.edit(f'Cannot read this chat: {reason_of(e)}')
+
+    state = await db.get_sync(uid, chat.id) or {}
+    last_id = state.get('last_id')
+    if last_id is None:
+        last_id = ref.start - 1 if ref.start else max(0, latest - SYNC_MAX_MESSAGES)
+    retry = sorted(set(state.get('retry') or []))
+    ids = (retry[:int(SYNC_MAX_MESSAGES * RETRY_SHARE)] + list(range(last_id + 1, latest + 1)))[:SYNC_MAX_MESSAGES]
+
+    delivered = await db.get_delivered(uid, chat.id)
+    # Free users get the same per-file size cap and daily quota as /save
+    premium = bool(await db.check_premium(uid))
+    caption = await db.get_caption(uid)
+    destinations = await db.get_dump_chats(uid)
+    done = set()
+    failed_ids = []
+    failures = Counter()
+    sent = skipped = failed = 0
+
+    async def checkpoint():
+        high = max([last_id] + [i for i in done if i > last_id])
+        pending = [i for i in retry if i not in done] + failed_ids
+        await db.save_sync(uid, chat.id, title=chat.title, username=chat.username,
+                           last_id=high, retry=pending[-MAX_RETRY_IDS:])
+        return high
+
+    cancelled = limited = False
+    try:
+        for offset in range(0, len(ids), FETCH_CHUNK):
+            chunk = ids[offset:offset + FETCH_CHUNK]
+            # One request per chunk instead of one per message
+            msgs = await DEFAULT_POLICY.run(lambda: uc.get_messages(chat.id, chunk), token=token)
+            by_id = {m.id: m for m in msgs if m and not getattr(m, 'empty', False)}
+            for mid in chunk:
+                job.set_pending(len(ids) - len(done))
+                msg = by_id.get(mid)
+                codec = codec_of(msg) if msg else None
+                key = codec.key(msg) if codec else None
+                if msg is None or getattr(msg, 'service', None) or (not msg.text and not codec):
+                    # Deleted ids, service messages (pins, joins), polls, contacts: nothing to deliver
+                    pass
+                elif key and key in delivered:
+                    # Reposts and files already delivered by an earlier run
+                    skipped += 1
+                elif codec and not premium and codec.size(msg) > FREE_LIMIT_SIZE:
+                    failed += 1
+                    failures['over the free plan size limit'] += 1
+                else:
+                    try:
+                        await deliver_message(
+                            bot, message.chat.id, msg, caption=caption, extra_dests=destinations, source=uc,
+                            refetch=lambda mid=mid: uc.get_messages(chat.id, mid), token=token
+                        )
+                    except Cancelled:
+                        raise
+                    except Exception as e:
+                        if token.cancelled:
+                            raise Cancelled()
+                        failed += 1
+                        failures[reason_of(e)] += 1
+                        # A permanent failure would fail the same way on every later run
+                        if classify(e) != PERMANENT:
+                            failed_ids.append(mid)
+                        logger.warning(f'Sync of {chat.id}/{mid} failed: {reason_of(e)}', extra={'user_id': uid, 'job_id': job.id})
+                    else:
+                        sent += 1
+                        await db.add_traffic(uid)
+                        if key:
+                            delivered.add(key)
+                            await db.add_delivered(uid, chat.id, key)
+                        if not premium and await db.check_limit(uid):
+                            done.add(mid)
+                            limited = True
+                            break
+                    await token.sleep(2)
+                done.add(mid)
+                if len(done) % CHECKPOINT_EVERY == 0:
+                    await checkpoint()
+                    try:
+                        await status.edit(f'Syncing: {len(done)}/{len(ids)} | Sent: {sent} | Skipped: {skipped} | Failed: {failed}')
+                    except Exception:
+                        pass
+            if limited:
+                break
+    except Cancelled:
+        cancelled = True
+    except Exception as e:
+        # Progress so far is kept; the next run resumes after the last finished message
+        failures[reason_of(e)] += 1
+        logger.error(f'Sync of {chat.id} stopped: {reason_of(e)}', extra={'user_id': uid, 'job_id': job.id})
+    high = await checkpoint()
+
+    report = f"{'Sync cancelled' if cancelled else 'Sync done'}: {chat.title or chat.id}\n" \
+             f"Sent: {sent} | Already delivered: {skipped} | Failed: {failed}"
+    if not ids:
+        report = f'Already up to date: {chat.title or chat.id} (#{latest})'
+    if failures:
+        report += '\n\nFailure reasons:\n' + format_breakdown(failures)
+    if limited:
+        report += '\n\nDaily limit reached (10 files/24h). Upgrade to premium, or send /sync again after the reset to continue.'
+    elif high < latest and not cancelled:
+        report += f'\n\n{latest - high} more post(s) to go. Send /sync again to continue.'
+    await status.edit(report)
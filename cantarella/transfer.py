@@ -0,0 +1,276 @@
+import io
+import os
+import shutil
+from dataclasses import dataclass
+from config import PARALLEL_DOWNLOAD_MIN_SIZE, PARALLEL_UPLOAD, PARALLEL_UPLOAD_MIN_SIZE
+from cantarella.downloader import parallel_download, partial_dir, media_file_name, fits_in_memory
+from cantarella.uploader import send_big_media
+from cantarella.retry import DEFAULT_POLICY
+from cantarella.jobs import CancelToken, guard
+from cantarella.flight import DOWNLOADS, UPLOADS
+from cantarella.filecache import MEDIA_CACHE
+from cantarella.delivery import fan_out
+from metrics import STAGE_SECONDS, BYTES_TRANSFERRED
+from logger import LOGGER
+
+logger = LOGGER(__name__)
+
+
+@dataclass(frozen=True)
+class Codec:
+    """How one media type is measured, downloaded and sent again through the bot."""
+    # Message attribute holding the media; the bot sends it with send_<kind>
+    kind: str
+    # Media attributes passed through to send_<kind> unchanged
+    meta: tuple = ()
+    caption: bool = True
+    thumb: bool = False
+    # Can be uploaded as parallel saveBigFilePart streams
+    big: bool = False
+    # False: re-sent by file_id, nothing is downloaded
+    reupload: bool = True
+
+    def media(self, msg):
+        return getattr(msg, self.kind)
+
+    def size(self, msg):
+        return getattr(self.media(msg), "file_size", None) or 0
+
+    def key(self, msg):
+        return self.media(msg).file_unique_id
+
+
+CODECS = {}
+
+
+def register(codec):
+    CODECS[codec.kind] = codec
+    return codec
+
+
+register(Codec("document", meta=("file_name",), thumb=True, big=True))
+register(Codec("video", meta=("duration", "width", "height"), thumb=True, big=True))
+register(Codec("audio", meta=("duration", "title", "performer"), thumb=True, big=True))
+register(Codec("animation"))
+register(Codec("voice", meta=("duration",)))
+register(Codec("video_note", meta=("duration", "length"), caption=False))
+register(Codec("photo"))
+register(Codec("sticker", caption=False, reupload=False))
+
+
+def codec_of(msg):
+    for kind, codec in CODECS.items():
+        if getattr(msg, kind, None):
+            return codec
+    return None
+
+
+def is_resumable(msg):
+    """Large files download in parallel parts that survive a failed attempt."""
+    return codec_of(msg).size(msg) >= PARALLEL_DOWNLOAD_MIN_SIZE
+
+
+def _copy_buffer(buffer):
+    copy = io.BytesIO(buffer.getvalue())
+    copy.name = buffer.name
+    return copy
+
+
+async def download(client, msg, refetch=None, progress=None, progress_args=(), token=None):
+    """
+    Download the media of `msg` through `client`, the account that fetched
+    it. Returns a path, or a named BytesIO for small files. Concurrent
+    calls for the same file share one download and recently sent files come
+    from the disk cache. Each successful call must be paired with release().
+    refetch() returns a fresh copy of msg when its file reference expires.
+    """
+    token = token or CancelToken()
+    if progress is None:
+        progress, progress_args = guard, (token,)
+    codec = codec_of(msg)
+    key = codec.key(msg)
+    size = codec.size(msg)
+    # Downloads land in a per-file directory shared by concurrent requests;
+    # large ones survive failures there so a retry resumes
+    part_dir = partial_dir(msg)
+    resumable = size >= PARALLEL_DOWNLOAD_MIN_SIZE
+    # Photos and small files never touch the disk
+    in_memory = not resumable and fits_in_memory(msg)
+    current = msg
+
+    async def refresh():
+        # New message object carries a fresh file reference
+        nonlocal current
+        current = await refetch()
+
+    async def fetch():
+        if resumable:
+            return await parallel_download(client, current, part_dir, size, progress=progress, progress_args=progress_args, token=token)
+        return await client.download_media(
+            current,
+            file_name=os.path.join(part_dir, media_file_name(current)),
+            in_memory=in_memory,
+            progress=progress,
+            progress_args=progress_args
+        )
+
+    async def shared():
+        # Sent recently: read it from disk instead of Telegram
+        cached = MEDIA_CACHE.get(key)
+        if cached:
+            return cached
+        with STAGE_SECONDS.time(stage="download"):
+            file = await DEFAULT_POLICY.run(fetch, refresh=refresh if refetch else None, token=token)
+        # Pyrogram returns None instead of raising when a progress callback stops it
+        token.raise_if_cancelled()
+        BYTES_TRANSFERRED.inc(size, direction="down")
+        if in_memory:
+            return file
+        return await MEDIA_CACHE.admit(key, file)
+
+    # Keeps a cached copy of the source on disk until release()
+    MEDIA_CACHE.pin(key)
+    try:
+        file = await DOWNLOADS.acquire(key, shared, token)
+    except BaseException:
+        MEDIA_CACHE.unpin(key)
+        # Parts of a resumable download are kept for the next attempt, and
+        # another request may still be downloading into the same directory
+        if (token.cancelled or not resumable) and not DOWNLOADS.holders(key):
+            shutil.rmtree(part_dir, ignore_errors=True)
+        raise
+    if not isinstance(file, str):
+        # Every request sharing an in-memory download reads its own cursor
+        file = _copy_buffer(file)
+    return file
+
+
+def release(msg):
+    """Hand back a download; what the cache did not keep goes with the last holder."""
+    key = codec_of(msg).key(msg)
+    MEDIA_CACHE.unpin(key)
+    DOWNLOADS.release(key, partial_dir(msg))
+
+
+async def fetch_thumb(client, source, msg, thumb_id, directory):
+    """Path of the user's custom thumbnail if set, else of the source's own, or None."""
+    if thumb_id:
+        try:
+            return await client.download_media(thumb_id, file_name=f"{directory}/custom_thumb.jpg")
+        except Exception as e:
+            logger.error(f"Failed to download custom thumb: {e}")
+    codec = codec_of(msg)
+    thumbs = getattr(codec.media(msg), "thumbs", None) if codec.thumb else None
+    if thumbs:
+        try:
+            return await source.download_media(thumbs[0].file_id, file_name=f"{directory}/thumb.jpg")
+        except Exception:
+            pass
+    return None
+
+
+async def upload(client, chat_id, msg, file, caption=None, thumb=None, progress=None, progress_args=(), token=None):
+    """Send `file` as the same kind of media as `msg`, with the source's metadata."""
+    token = token or CancelToken()
+    if progress is None:
+        progress, progress_args = guard, (token,)
+    codec = codec_of(msg)
+    media = codec.media(msg)
+    meta = {name: getattr(media, name, None) for name in codec.meta}
+    size = codec.size(msg)
+
+    async def send():
+        if isinstance(file, io.BytesIO):
+            file.seek(0)
+        if PARALLEL_UPLOAD and codec.big and isinstance(file, str) and size >= PARALLEL_UPLOAD_MIN_SIZE:
+            return await send_big_media(client, chat_id, file, codec.kind, caption=caption or "", thumb=thumb, meta=meta,
+                                        progress=progress, progress_args=progress_args, token=token)
+        kwargs = dict(meta)
+        if codec.caption:
+            kwargs["caption"] = caption
+        if codec.thumb and thumb:
+            kwargs["thumb"] = thumb
+        return await getattr(client, f"send_{codec.kind}")(chat_id, file, progress=progress, progress_args=progress_args, **kwargs)
+
+    with STAGE_SECONDS.time(stage="upload"):
+        sent = await DEFAULT_POLICY.run(send, token=token)
+    token.raise_if_cancelled()
+    BYTES_TRANSFERRED.inc(size, direction="up")
+    return sent
+
+
+async def upload_document(client, chat_id, path, caption=None, progress=None, progress_args=(), token=None):
+    """Send a local file that has no source message, such as a bundle volume, as a document."""
+    token = token or CancelToken()
+    if progress is None:
+        progress, progress_args = guard, (token,)
+    size = os.path.getsize(path)
+
+    async def send():
+        if PARALLEL_UPLOAD and size >= PARALLEL_UPLOAD_MIN_SIZE:
+            return await send_big_media(client, chat_id, path, "document", caption=caption or "",
+                                        progress=progress, progress_args=progress_args, token=token)
+        return await client.send_document(chat_id, path, caption=caption, progress=progress, progress_args=progress_args)
+
+    with STAGE_SECONDS.time(stage="upload"):
+        sent = await DEFAULT_POLICY.run(send, token=token)
+    token.raise_if_cancelled()
+    BYTES_TRANSFERRED.inc(size, direction="up")
+    return sent
+
+
+async def send_cached(client, chat_id, msg, caption=None, token=None):
+    """
+    Re-send the bot's earlier upload of the same file, if there is one.
+    Returns (sent, leader); without a sent message the caller uploads and,
+    if leader is True, must pass the result to finish_upload().
+    """
+    codec = codec_of(msg)
+    key = codec.key(msg)
+    file_id, leader = await UPLOADS.acquire(key, token)
+    if file_id:
+        try:
+            kwargs = {"caption": caption} if codec.caption else {}
+            return await client.send_cached_media(chat_id, file_id, **kwargs), False
+        except Exception as e:
+            logger.warning(f"Re-sending the cached upload of {key} failed: {e}")
+    return None, leader
+
+
+def finish_upload(msg, sent):
+    """Publish the leader's upload (or its failure) to requests waiting in send_cached()."""
+    file_id = None
+    if sent:
+        codec = codec_of(sent)
+        file_id = codec.media(sent).file_id if codec else None
+    UPLOADS.release(codec_of(msg).key(msg), file_id)
+
+
+async def transfer(client, source, msg, chat_id, caption=None, thumb=None, destinations=(), refetch=None,
+                   progress=None, down_args=(), up_args=(), token=None):
+    """
+    Copy the media of `msg`, fetched by `source`, to chat_id through the bot
+    and on to `destinations` with server-side copies. Returns the sent message.
+    A custom thumbnail is part of the upload, so only transfers without one
+    reuse the bot's earlier upload of the same file.
+    """
+    token = token or CancelToken()
+    codec = codec_of(msg)
+    if not codec.reupload:
+        sent = await DEFAULT_POLICY.run(
+            lambda: getattr(client, f"send_{codec.kind}")(chat_id, codec.media(msg).file_id), token=token)
+        await fan_out(client, sent, destinations, token)
+        return sent
+    sent, leader = (None, False) if thumb else await send_cached(client, chat_id, msg, caption, token)
+    if not sent:
+        try:
+            file = await download(source, msg, refetch, progress, down_args, token)
+            try:
+                sent = await upload(client, chat_id, msg, file, caption, thumb, progress, up_args, token)
+            finally:
+                release(msg)
+        finally:
+            if leader:
+                finish_upload(msg, sent)
+    await fan_out(client, sent, destinations, token)
+    return sent
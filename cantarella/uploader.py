@@ -0,0 +1,180 @@
+import os
+import asyncio
+import mimetypes
+from dataclasses import dataclass, field
+from pyrogram import raw, types, utils, enums
+from pyrogram.session import Session
+from config import PARALLEL_UPLOAD_SESSIONS
+from cantarella.jobs import Cancelled
+from cantarella.retry import classify, RETRYABLE, FLOOD
+from logger import LOGGER
+
+logger = LOGGER(__name__)
+
+# Largest part size Telegram accepts for saveBigFilePart
+PART_SIZE = 512 * 1024
+PART_RETRIES = 4
+UPLOAD_ATTEMPTS = 3
+
+
+@dataclass
+class UploadState:
+    """Parts already accepted by Telegram, kept so a retry resumes instead of restarting."""
+    path: str
+    size: int
+    file_id: int
+    total_parts: int
+    done: set = field(default_factory=set)
+
+
+class UploadIncomplete(Exception):
+    def __init__(self, state, error):
+        super().__init__(f"{len(state.done)}/{state.total_parts} parts uploaded: {error}")
+        self.state = state
+
+
+class MediaNotSent(Exception):
+    """SendMedia returned no new message; retrying could post the file twice."""
+
+
+def _read_part(fd, index):
+    return os.pread(fd, PART_SIZE, index * PART_SIZE)
+
+
+async def upload_big_file(client, path, state=None, sessions=PARALLEL_UPLOAD_SESSIONS, progress=None, progress_args=(), token=None):
+    """
+    Upload `path` over several media sessions with saveBigFilePart.
+    Returns an InputFileBig; raises UploadIncomplete carrying the state to resume from.
+    """
+    if state is None:
+        size = os.path.getsize(path)
+        state = UploadState(path, size, client.rnd_id(), -(-size // PART_SIZE))
+    queue = asyncio.Queue()
+    for index in range(state.total_parts):
+        if index not in state.done:
+            queue.put_nowait(index)
+
+    fd = os.open(path, os.O_RDONLY)
+    pool = []
+
+    async def worker(session):
+        while not queue.empty():
+            index = queue.get_nowait()
+            if token:
+                token.raise_if_cancelled()
+            data = await asyncio.to_thread(_read_part, fd, index)
+            for attempt in range(PART_RETRIES):
+                try:
+                    await session.invoke(raw.functions.upload.SaveBigFilePart(
+                        file_id=state.file_id,
+                        file_part=index,
+                        file_total_parts=state.total_parts,
+                        bytes=data
+                    ))
+                    break
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    kind = classify(e)
+                    if kind not in (RETRYABLE, FLOOD) or attempt == PART_RETRIES - 1:
+                        raise
+                    logger.warning(f"Upload part {index} failed ({e}), retrying")
+                    delay = e.value if kind == FLOOD else 2 ** attempt
+                    await (token.sleep(delay) if token else asyncio.sleep(delay))
+            state.done.add(index)
+            if progress:
+                progress(min(len(state.done) * PART_SIZE, state.size), state.size, *progress_args)
+
+    try:
+        for _ in range(max(1, min(sessions, queue.qsize()))):
+            session = Session(
+                client,
+                await client.storage.dc_id(),
+                await client.storage.auth_key(),
+                await client.storage.test_mode(),
+                is_media=True
+            )
+            await session.start()
+            pool.append(session)
+        tasks = [asyncio.create_task(worker(session)) for session in pool]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+    except (asyncio.CancelledError, Cancelled):
+        raise
+    except Exception as e:
+        raise UploadIncomplete(state, e) from e
+    finally:
+        os.close(fd)
+        for session in pool:
+            try:
+                await session.stop()
+            except Exception:
+                pass
+
+    return raw.types.InputFileBig(id=state.file_id, parts=state.total_parts, name=os.path.basename(path))
+
+
+async def upload_with_resume(client, path, progress=None, progress_args=(), token=None):
+    state = None
+    for attempt in range(UPLOAD_ATTEMPTS):
+        try:
+            return await upload_big_file(client, path, state=state, progress=progress, progress_args=progress_args, token=token)
+        except UploadIncomplete as e:
+            # A part that failed for good fails the same way on resume
+            if attempt == UPLOAD_ATTEMPTS - 1 or classify(e.__cause__) not in (RETRYABLE, FLOOD):
+                raise
+            state = e.state
+            logger.warning(f"Resuming upload of {path}: {e}")
+            await (token.sleep(3) if token else asyncio.sleep(3))
+
+
+def _attributes(kind, path, meta):
+    attributes = [raw.types.DocumentAttributeFilename(file_name=os.path.basename(path))]
+    if kind == "video":
+        attributes.append(raw.types.DocumentAttributeVideo(
+            duration=meta.get("duration") or 0,
+            w=meta.get("width") or 0,
+            h=meta.get("height") or 0,
+            supports_streaming=True
+        ))
+    elif kind == "audio":
+        attributes.append(raw.types.DocumentAttributeAudio(
+            duration=meta.get("duration") or 0,
+            title=meta.get("title"),
+            performer=meta.get("performer")
+        ))
+    return attributes
+
+
+async def send_big_media(client, chat_id, path, kind, caption="", thumb=None, meta=None,
+                         parse_mode=enums.ParseMode.HTML, progress=None, progress_args=(), token=None):
+    """
+    Parallel-upload `path` and send it as a document, video or audio.
+    Mirrors what send_document/send_video/send_audio do after save_file.
+    """
+    meta = meta or {}
+    file = await upload_with_resume(client, path, progress=progress, progress_args=progress_args, token=token)
+    media = raw.types.InputMediaUploadedDocument(
+        mime_type=mimetypes.guess_type(path)[0] or "application/octet-stream",
+        file=file,
+        thumb=await client.save_file(thumb) if thumb else None,
+        attributes=_attributes(kind, path, meta),
+        force_file=kind == "document" or None
+    )
+    r = await client.invoke(raw.functions.messages.SendMedia(
+        peer=await client.resolve_peer(chat_id),
+        media=media,
+        random_id=client.rnd_id(),
+        **await utils.parse_text_entities(client, caption, parse_mode, None)
+    ))
+    users = {u.id: u for u in r.users}
+    chats = {c.id: c for c in r.chats}
+    for update in r.updates:
+        if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+            return await types.Message._parse(client, update.message, users, chats)
+    raise MediaNotSent(f"No message came back for {os.path.basename(path)}")
@@ -0,0 +1,299 @@
+import asyncio
+import datetime
+from dataclasses import dataclass
+from typing import Optional
+from pyrogram import Client, filters, enums
+from pyrogram.handlers import MessageHandler
+from pyrogram.types import Message
+from config import ADMINS, WATCH_LIMIT, WATCH_QUEUE_SIZE
+from database.db import db
+from cantarella.links import parse_chat
+from cantarella.clients import POOL
+from cantarella.batch import send_message_to_user
+from cantarella.transfer import codec_of
+from cantarella.retry import DEFAULT_POLICY, reason_of
+from cantarella.jobs import CancelToken, Cancelled
+from cantarella.peers import PEERS
+from metrics import ERRORS, WATCH_BACKLOG
+from logger import LOGGER
+
+logger = LOGGER(__name__)
+
+# get_messages accepts up to 200 ids per call
+FETCH_CHUNK = 100
+# Pause between deliveries, like /batch
+PACING = 1
+
+
+async def entitled(user):
+    """Watching is for admins and premium users whose plan has not run out."""
+    if user in ADMINS:
+        return True
+    expiry = await db.check_premium(user)
+    if not expiry:
+        return False
+    return not isinstance(expiry, datetime.datetime) or expiry > datetime.datetime.now()
+
+
+@dataclass
+class Watch:
+    user: int
+    chat: int
+    # None: the user's own chat plus their dump chats
+    dest: Optional[int] = None
+    title: Optional[str] = None
+    username: Optional[str] = None
+
+
+class UserWatches:
+    """
+    Every watch of one user, multiplexed over the user's pooled client: one
+    update handler, one bounded queue and one delivery worker. Posts that
+    arrive while the queue is full are only remembered by id and fetched
+    later in batches, so a burst costs a few get_messages calls instead of
+    unbounded memory.
+    """
+
+    def __init__(self, bot, user, client):
+        self.bot = bot
+        self.user = user
+        self.client = client
+        self.watches = {}
+        self.queue = asyncio.Queue(maxsize=WATCH_QUEUE_SIZE)
+        self.deferred = {}
+        self.token = CancelToken()
+        self.expiry = None
+        self.handler = MessageHandler(self.on_message)
+        client.add_handler(self.handler)
+        self.worker = asyncio.create_task(self.run())
+
+    @property
+    def backlog(self):
+        return self.queue.qsize() + sum(len(ids) for ids in self.deferred.values())
+
+    async def on_message(self, client, message):
+        if not message.chat or message.chat.id not in self.watches:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.deferred.setdefault(message.chat.id, set()).add(message.id)
+        WATCHES.publish()
+
+    async def run(self):
+        while not self.token.cancelled:
+            try:
+                if self.queue.empty() and self.deferred:
+                    chat_id, ids = self.deferred.popitem()
+                    WATCHES.publish()
+                    await self.catch_up(chat_id, sorted(ids))
+                    continue
+                message = await self.queue.get()
+                WATCHES.publish()
+                await self.deliver(message)
+            except (Cancelled, asyncio.CancelledError):
+                return
+            except Exception as e:
+                logger.error(f"Watch worker of {self.user}: {reason_of(e)}", extra={'user_id': self.user})
+
+    async def catch_up(self, chat_id, ids):
+        for offset in range(0, len(ids), FETCH_CHUNK):
+            chunk = ids[offset:offset + FETCH_CHUNK]
+            msgs = await DEFAULT_POLICY.run(lambda: self.client.get_messages(chat_id, chunk), token=self.token)
+            for message in msgs:
+                if message and not getattr(message, 'empty', False):
+                    await self.deliver(message)
+
+    async def deliver(self, message):
+        watch = self.watches.get(message.chat.id)
+        if watch is None or getattr(message, 'service', None):
+            return
+        if not message.text and not codec_of(message):
+            return
+        if self.token.cancelled:
+            return
+        if not await entitled(self.user):
+            # The plan ended while watching; stopping runs in its own task since it cancels this worker
+            self.token.cancel()
+            self.expiry = asyncio.create_task(WATCHES.expire(self.bot, self.user))
+            return
+        dest = watch.dest or self.user
+        extra_dests = [] if watch.dest else await db.get_dump_chats(self.user)
+        ok, reason = await send_message_to_user(
+            self.bot, dest, message, caption=await db.get_caption(self.user), extra_dests=extra_dests,
+            source=self.client, refetch=lambda: self.client.get_messages(message.chat.id, message.id), token=self.token
+        )
+        if ok:
+            codec = codec_of(message)
+            if codec:
+                # Shared with /sync, so a later sync of this chat skips what was pushed here
+                await db.add_delivered(self.user, watch.chat, codec.key(message))
+        elif reason != 'cancelled':
+            ERRORS.inc(stage="watch", reason=reason)
+            logger.warning(f"Watch delivery of {watch.chat}/{message.id} failed: {reason}", extra={'user_id': self.user})
+        await self.token.sleep(PACING)
+
+    async def close(self):
+        self.token.cancel()
+        self.worker.cancel()
+        await asyncio.gather(self.worker, return_exceptions=True)
+        try:
+            self.client.remove_handler(self.handler)
+        except Exception:
+            pass
+
+
+class WatchManager:
+    """Active watches per user; registrations are persisted and re-armed on startup."""
+
+    def __init__(self):
+        self._users = {}
+        self._lock = asyncio.Lock()
+
+    def publish(self):
+        WATCH_BACKLOG.set(sum(group.backlog for group in self._users.values()))
+
+    def for_user(self, user):
+        group = self._users.get(user)
+        return list(group.watches.values()) if group else []
+
+    async def add(self, bot, watch):
+        """Start delivering new posts of watch.chat; False if the user has no session."""
+        async with self._lock:
+            group = self._users.get(watch.user)
+            if group is None:
+                client = await POOL.acquire(watch.user)
+                if client is None:
+                    return False
+                group = self._users[watch.user] = UserWatches(bot, watch.user, client)
+            group.watches[watch.chat] = watch
+            return True
+
+    async def remove(self, user, chat):
+        async with self._lock:
+            group = self._users.get(user)
+            if group is None or group.watches.pop(chat, None) is None:
+                return False
+            if group.watches:
+                return True
+        await self.stop_user(user)
+        return True
+
+    async def stop_user(self, user):
+        group = self._users.pop(user, None)
+        if group:
+            await group.close()
+            await POOL.release(user)
+            self.publish()
+
+    async def expire(self, bot, user):
+        """Drop every watch of a user who is no longer premium, and tell them."""
+        await self.stop_user(user)
+        await db.delete_watch(user)
+        try:
+            await bot.send_message(
+                user, '<b>👁 Your watches have stopped.</b>\n<i>Watching chats is a premium feature and your plan has ended.</i>',
+                parse_mode=enums.ParseMode.HTML
+            )
+        except Exception:
+            pass
+
+    async def restore(self, bot):
+        """
+        Re-arm every persisted watch. Users whose session is gone are skipped;
+        users who are no longer premium lose their watches.
+        """
+        restored = 0
+        allowed = {}
+        for doc in await db.get_watches():
+            watch = Watch(doc['user'], doc['chat'], doc.get('dest'), doc.get('title'), doc.get('username'))
+            if watch.user not in allowed:
+                allowed[watch.user] = await entitled(watch.user)
+                if not allowed[watch.user]:
+                    await self.expire(bot, watch.user)
+            if not allowed[watch.user]:
+                continue
+            try:
+                if await self.add(bot, watch):
+                    restored += 1
+            except Exception as e:
+                logger.warning(f"Restoring watch {watch.user}/{watch.chat} failed: {e}")
+        if restored:
+            logger.info(f"Restored {restored} watch(es)")
+
+    async def stop_all(self):
+        for user in list(self._users):
+            await self.stop_user(user)
+
+
+WATCHES = WatchManager()
+
+USAGE = (
+    '<b>👁 Watch a Chat</b>\n\n'
+    '<code>/watch &lt;chat link | @username | -100id&gt; [destination chat id]</code>\n'
+    '<i>New posts are forwarded as they appear, to you and your dump chats or to the given chat.</i>\n\n'
+    '<code>/watch</code> — list watched chats\n'
+    '<code>/unwatch &lt;chat&gt;</code> — stop watching'
+)
+
+
+def _find(user, ref):
+    for watch in WATCHES.for_user(user):
+        if ref.kind == 'private' and watch.chat == ref.target:
+            return watch
+        if ref.kind == 'public' and (watch.username or '').lower() == ref.chat.lower():
+            return watch
+    return None
+
+
+@Client.on_message(filters.private & filters.command('watch'))
+async def watch_cmd(client: Client, message: Message):
+    uid = message.from_user.id
+    args = message.command[1:]
+    if not args:
+        watches = WATCHES.for_user(uid)
+        if not watches:
+            return await message.reply(USAGE, parse_mode=enums.ParseMode.HTML)
+        lines = [f"• <b>{w.title or w.chat}</b> (<code>{w.chat}</code>) → <code>{w.dest or 'you'}</code>" for w in watches]
+        return await message.reply('<b>👁 Watched Chats</b>\n\n' + '\n'.join(lines), parse_mode=enums.ParseMode.HTML)
+
+    ref = parse_chat(args[0])
+    dest = args[1] if len(args) > 1 else None
+    if not ref or (dest is not None and not dest.lstrip('-').isdigit()):
+        return await message.reply(USAGE, parse_mode=enums.ParseMode.HTML)
+    if not await entitled(uid):
+        return await message.reply('<b>💎 Watching chats is a premium feature.</b>', parse_mode=enums.ParseMode.HTML)
+    if len(WATCHES.for_user(uid)) >= WATCH_LIMIT and not _find(uid, ref):
+        return await message.reply(f'<b>⚠️ You can watch up to {WATCH_LIMIT} chats.</b> Use /unwatch first.', parse_mode=enums.ParseMode.HTML)
+
+    acc = await POOL.acquire(uid)
+    if acc is None:
+        return await message.reply('Login required to watch a chat. Use /login first.')
+    try:
+        chat = await DEFAULT_POLICY.run(lambda: acc.get_chat(ref.target))
+        await PEERS.remember(acc, ref.target)
+        watch = Watch(uid, chat.id, int(dest) if dest else None, chat.title, chat.username)
+        added = await WATCHES.add(client, watch)
+        if added:
+            await db.save_watch(uid, chat.id, dest=watch.dest, title=watch.title, username=watch.username)
+    except Exception as e:
+        await PEERS.check(acc, ref.target, e)
+        return await message.reply(f'Cannot read this chat: {reason_of(e)}')
+    finally:
+        # WATCHES holds its own reference while the watch is active
+        await POOL.release(uid)
+    if not added:
+        return await message.reply('Could not start watching: your session is not available. Use /login again.')
+    await message.reply(f'<b>👁 Watching {watch.title or watch.chat}.</b>\n<i>New posts will be forwarded as they appear.</i>', parse_mode=enums.ParseMode.HTML)
+
+
+@Client.on_message(filters.private & filters.command('unwatch'))
+async def unwatch_cmd(client: Client, message: Message):
+    uid = message.from_user.id
+    ref = parse_chat(message.command[1]) if len(message.command) > 1 else None
+    watch = _find(uid, ref) if ref else None
+    if not watch:
+        return await message.reply('<b>ℹ️ That chat is not watched.</b>', parse_mode=enums.ParseMode.HTML)
+    await WATCHES.remove(uid, watch.chat)
+    await db.delete_watch(uid, watch.chat)
+    await message.reply('<b>✅ Stopped watching.</b>', parse_mode=enums.ParseMode.HTML)
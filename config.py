@@ -34,6 +34,66 @@ ADMINS = [int(admin) for admin in os.environ.get("ADMINS", "").split(",") if adm
 DB_URI = os.environ.get("DB_URI", "")
 DB_NAME = os.environ.get("DB_NAME", "SaveRestricted2")
 
+# Key used to encrypt user session strings at rest (Fernet key or any passphrase)
+SESSION_SECRET = os.environ.get("SESSION_SECRET", "")
+
+# Decrypted sessions kept in memory so saves skip the DB round trip
+SESSION_CACHE_SIZE = int(os.environ.get("SESSION_CACHE_SIZE", "512"))
+SESSION_CACHE_TTL = int(os.environ.get("SESSION_CACHE_TTL", "1800"))
+
+
+# ==============================
+# Login Flow
+# ==============================
+
+# Seconds a pending /login may sit idle before its client is disconnected
+LOGIN_TIMEOUT = int(os.environ.get("LOGIN_TIMEOUT", "300"))
+# Seconds allowed for a single connect / send_code / sign_in call
+LOGIN_RPC_TIMEOUT = int(os.environ.get("LOGIN_RPC_TIMEOUT", "30"))
+# Maximum number of logins that may be in progress at the same time
+MAX_PENDING_LOGINS = int(os.environ.get("MAX_PENDING_LOGINS", "20"))
+
+
+# ==============================
+# Transfers
+# ==============================
+
+# Largest file a free user may save, in bytes; premium users have no limit
+FREE_LIMIT_SIZE = int(os.environ.get("FREE_LIMIT_SIZE", str(2 * 1024 * 1024 * 1024)))
+# Files up to this size are downloaded into memory and uploaded from there, never touching the disk
+IN_MEMORY_MAX_SIZE = int(os.environ.get("IN_MEMORY_MAX_SIZE", str(10 * 1024 * 1024)))
+# Files at least this big are downloaded in parallel parts
+PARALLEL_DOWNLOAD_MIN_SIZE = int(os.environ.get("PARALLEL_DOWNLOAD_MIN_SIZE", str(20 * 1024 * 1024)))
+# Number of parts fetched at the same time
+PARALLEL_DOWNLOAD_WORKERS = int(os.environ.get("PARALLEL_DOWNLOAD_WORKERS", "4"))
+# Size of one part in MiB (Telegram serves files in 1 MiB chunks)
+PARALLEL_PART_SIZE_MB = int(os.environ.get("PARALLEL_PART_SIZE_MB", "16"))
+
+# Disk budget for finished source files kept for repeat requests, in MiB (0 disables it)
+MEDIA_CACHE_MB = int(os.environ.get("MEDIA_CACHE_MB", "2048"))
+# Largest archive volume a bundled /batch uploads, in MiB (Telegram accepts bot uploads up to 2 GiB)
+BUNDLE_VOLUME_MB = int(os.environ.get("BUNDLE_VOLUME_MB", "2000"))
+
+# Resolved chats are persisted per account so new clients skip ResolveUsername (seconds)
+PEER_CACHE_TTL = int(os.environ.get("PEER_CACHE_TTL", str(7 * 24 * 60 * 60)))
+# Most recently used peers loaded into each new client
+PEER_CACHE_LIMIT = int(os.environ.get("PEER_CACHE_LIMIT", "500"))
+
+# Most messages one /sync run delivers; the next run continues from there
+SYNC_MAX_MESSAGES = int(os.environ.get("SYNC_MAX_MESSAGES", "200"))
+
+# Chats one user may watch at the same time
+WATCH_LIMIT = int(os.environ.get("WATCH_LIMIT", "10"))
+# New posts queued per user before further ones are fetched later in batches
+WATCH_QUEUE_SIZE = int(os.environ.get("WATCH_QUEUE_SIZE", "100"))
+
+# Upload big files as concurrent saveBigFilePart streams through the bot
+PARALLEL_UPLOAD = os.environ.get("PARALLEL_UPLOAD", "True").lower() == "true"
+# Telegram only accepts big-file parts for files over 10 MB
+PARALLEL_UPLOAD_MIN_SIZE = int(os.environ.get("PARALLEL_UPLOAD_MIN_SIZE", str(20 * 1024 * 1024)))
+# Number of media sessions used for one upload
+PARALLEL_UPLOAD_SESSIONS = int(os.environ.get("PARALLEL_UPLOAD_SESSIONS", "4"))
+
 
 # ==============================
 # Logging Configuration
@@ -42,6 +102,27 @@ DB_NAME = os.environ.get("DB_NAME", "SaveRestricted2")
 # Replace with your Telegram log channel ID (example: -1001234567890)
 LOG_CHANNEL = int(os.environ.get("LOG_CHANNEL", "0"))
 
+# Write console logs as JSON lines too (logs.txt is always JSON)
+LOG_JSON = os.environ.get("LOG_JSON", "False").lower() == "true"
+# Records waiting to be written; when full, new records are dropped instead of blocking the bot
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+
+
+# ==============================
+# Startup
+# ==============================
+
+# Log how long each plugin module and each startup step takes
+PROFILE_STARTUP = os.environ.get("PROFILE_STARTUP", "False").lower() == "true"
+
+
+# ==============================
+# Event Loop Watchdog
+# ==============================
+
+# Sample the loop's stack when a single callback blocks it longer than this (seconds); 0 disables the watchdog
+LOOP_LAG_THRESHOLD = float(os.environ.get("LOOP_LAG_THRESHOLD", "0.5"))
+
 
 # ==============================
 # Error Handling
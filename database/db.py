@@ -1,14 +1,72 @@
-import motor.motor_asyncio
 import datetime
-from config import DB_NAME, DB_URI
+from config import DB_NAME, DB_URI, SESSION_SECRET, SESSION_CACHE_SIZE, SESSION_CACHE_TTL
+from database.vault import SessionVault
 from logger import LOGGER
+from metrics import DB_SECONDS, CACHE_EVENTS
 logger = LOGGER(__name__)
+_MISSING = object()
+class _TimedCollection:
+    """Wraps a Motor collection so every awaited operation lands in bot_db_seconds."""
+    TIMED = {'find_one', 'insert_one', 'update_one', 'update_many', 'delete_one', 'delete_many', 'count_documents', 'create_index'}
+    def __init__(self, col):
+        self._col = col
+    def __getattr__(self, name):
+        attr = getattr(self._col, name)
+        if name not in self.TIMED:
+            return attr
+        async def timed(*args, **kwargs):
+            with DB_SECONDS.time(op=name):
+                return await attr(*args, **kwargs)
+        return timed
 class Database:
    
     def __init__(self, uri, database_name):
-        self._client = motor.motor_asyncio.AsyncIOMotorClient(uri)
-        self.db = self._client[database_name]
-        self.col = self.db.users
+        self._uri = uri
+        self._name = database_name
+        self.reset()
+        self.vault = SessionVault(SESSION_SECRET, SESSION_CACHE_SIZE, SESSION_CACHE_TTL)
+    def reset(self, client=None):
+        """Use `client` (or a new connection on next use) and drop every collection bound to the old one."""
+        self._client = client
+        self._col = None
+        self._peer_col = None
+        self._sync_col = None
+        self._ledger_col = None
+        self._watch_col = None
+    @property
+    def db(self):
+        # Motor (and pymongo under it) is imported and connected on first use, not at import time
+        if self._client is None:
+            import motor.motor_asyncio
+            self._client = motor.motor_asyncio.AsyncIOMotorClient(self._uri)
+        return self._client[self._name]
+    @property
+    def col(self):
+        if self._col is None:
+            self._col = _TimedCollection(self.db.users)
+        return self._col
+    @property
+    def peer_col(self):
+        if self._peer_col is None:
+            self._peer_col = _TimedCollection(self.db.peers)
+        return self._peer_col
+    @property
+    def sync_col(self):
+        if self._sync_col is None:
+            self._sync_col = _TimedCollection(self.db.sync)
+        return self._sync_col
+    @property
+    def ledger_col(self):
+        if self._ledger_col is None:
+            self._ledger_col = _TimedCollection(self.db.ledger)
+        return self._ledger_col
+    @property
+    def watch_col(self):
+        if self._watch_col is None:
+            self._watch_col = _TimedCollection(self.db.watches)
+        return self._watch_col
+    async def ping(self):
+        await self.db.command('ping')
     def new_user(self, id, name):
         return dict(
             id = id,
@@ -34,12 +92,26 @@ class Database:
         return self.col.find({})
     async def delete_user(self, user_id):
         await self.col.delete_many({'id': int(user_id)})
+        self.vault.cache.pop(int(user_id))
         logger.info(f"User deleted from DB: {user_id}")
     async def set_session(self, id, session):
-        await self.col.update_one({'id': int(id)}, {'$set': {'session': session}})
+        await self.col.update_one({'id': int(id)}, {'$set': {'session': self.vault.encrypt(session)}})
+        # Drop the cached copy so /logout and re-login take effect immediately
+        self.vault.cache.pop(int(id))
     async def get_session(self, id):
-        user = await self.col.find_one({'id': int(id)})
-        return user.get('session')
+        cached = self.vault.cache.get(int(id), _MISSING)
+        if cached is not _MISSING:
+            CACHE_EVENTS.inc(cache="session", result="hit")
+            return cached
+        CACHE_EVENTS.inc(cache="session", result="miss")
+        user = await self.col.find_one({'id': int(id)}, {'session': 1})
+        stored = user.get('session') if user else None
+        session = self.vault.decrypt(stored)
+        # Lazily encrypt sessions saved before the vault existed
+        if self.vault.needs_upgrade(stored):
+            await self.col.update_one({'id': int(id)}, {'$set': {'session': self.vault.encrypt(stored)}})
+        self.vault.cache.set(int(id), session)
+        return session
     # Caption Support
     async def set_caption(self, id, caption):
         await self.col.update_one({'id': int(id)}, {'$set': {'caption': caption}})
@@ -92,11 +164,27 @@ class Database:
         user = await self.col.find_one({'id': int(id)})
         return user.get('is_banned', False)
     # Dump Chat Support
+    # A user may have several destinations; 'dump_chat' is kept for older records
     async def set_dump_chat(self, id, chat_id):
-        await self.col.update_one({'id': int(id)}, {'$set': {'dump_chat': int(chat_id)}})
+        chats = [int(chat_id)] if chat_id is not None else []
+        await self.col.update_one({'id': int(id)}, {'$set': {'dump_chats': chats, 'dump_chat': chats[0] if chats else None}})
+    async def add_dump_chat(self, id, chat_id):
+        await self.col.update_one({'id': int(id)}, {'$addToSet': {'dump_chats': int(chat_id)}})
+    async def remove_dump_chat(self, id, chat_id):
+        await self.col.update_one({'id': int(id)}, {'$pull': {'dump_chats': int(chat_id)}})
+        await self.col.update_one({'id': int(id), 'dump_chat': int(chat_id)}, {'$set': {'dump_chat': None}})
+    async def get_dump_chats(self, id):
+        user = await self.col.find_one({'id': int(id)}, {'dump_chats': 1, 'dump_chat': 1})
+        if not user:
+            return []
+        chats = list(user.get('dump_chats') or [])
+        legacy = user.get('dump_chat')
+        if legacy and legacy not in chats:
+            chats.insert(0, legacy)
+        return chats
     async def get_dump_chat(self, id):
-        user = await self.col.find_one({'id': int(id)})
-        return user.get('dump_chat', None)
+        chats = await self.get_dump_chats(id)
+        return chats[0] if chats else None
     # Delete/Replace Words Support
     async def set_delete_words(self, id, words):
         await self.col.update_one({'id': int(id)}, {'$addToSet': {'delete_words': {'$each': words}}})
@@ -119,6 +207,55 @@ class Database:
         for w in words:
             current_repl.pop(w, None)
         await self.col.update_one({'id': int(id)}, {'$set': {'replace_words': current_repl}})
+    # Peer Cache Support
+    # access_hash values are per account, so every peer is stored under the client that resolved it
+    async def ensure_peer_indexes(self):
+        await self.peer_col.create_index([('owner', 1), ('key', 1)], unique=True)
+        await self.peer_col.create_index([('owner', 1), ('updated', -1)])
+    async def get_peers(self, owner, since, limit):
+        cursor = self.peer_col.find({'owner': owner, 'updated': {'$gte': since}})
+        return await cursor.sort('updated', -1).to_list(length=limit)
+    async def save_peer(self, owner, key, peer):
+        await self.peer_col.update_one({'owner': owner, 'key': key}, {'$set': peer}, upsert=True)
+    async def delete_peer(self, owner, key):
+        await self.peer_col.delete_many({'owner': owner, '$or': [{'key': key}, {'peer_id': key}]})
+    # Sync Support
+    # One state document per user and source chat, plus a ledger of the files already delivered
+    async def ensure_sync_indexes(self):
+        await self.sync_col.create_index([('user', 1), ('chat', 1)], unique=True)
+        await self.ledger_col.create_index([('user', 1), ('chat', 1), ('file', 1)], unique=True)
+    async def get_sync(self, user, chat):
+        return await self.sync_col.find_one({'user': int(user), 'chat': int(chat)})
+    async def get_syncs(self, user):
+        return await self.sync_col.find({'user': int(user)}).sort('updated', -1).to_list(length=50)
+    async def save_sync(self, user, chat, **fields):
+        fields['updated'] = datetime.datetime.now()
+        await self.sync_col.update_one({'user': int(user), 'chat': int(chat)}, {'$set': fields}, upsert=True)
+    async def delete_sync(self, user, chat):
+        await self.sync_col.delete_many({'user': int(user), 'chat': int(chat)})
+        await self.ledger_col.delete_many({'user': int(user), 'chat': int(chat)})
+    async def get_delivered(self, user, chat):
+        cursor = self.ledger_col.find({'user': int(user), 'chat': int(chat)}, {'file': 1})
+        return {doc['file'] for doc in await cursor.to_list(length=None)}
+    async def add_delivered(self, user, chat, file):
+        await self.ledger_col.update_one(
+            {'user': int(user), 'chat': int(chat), 'file': file},
+            {'$set': {'at': datetime.datetime.now()}},
+            upsert=True
+        )
+    # Watch Support
+    # Registrations survive restarts; Bot start re-arms every one of them
+    async def save_watch(self, user, chat, **fields):
+        fields['created'] = datetime.datetime.now()
+        await self.watch_col.update_one({'user': int(user), 'chat': int(chat)}, {'$set': fields}, upsert=True)
+    async def delete_watch(self, user, chat=None):
+        query = {'user': int(user)}
+        if chat is not None:
+            query['chat'] = int(chat)
+        await self.watch_col.delete_many(query)
+    async def get_watches(self, user=None):
+        query = {'user': int(user)} if user is not None else {}
+        return await self.watch_col.find(query).to_list(length=None)
     # --------------------------------------------------------
     # NEW FEATURES: Daily Limits (Free User Restriction)
     # --------------------------------------------------------
@@ -151,9 +288,9 @@ class Database:
             return True # Blocked
        
         return False # Allowed
-    async def add_traffic(self, id):
+    async def add_traffic(self, id, count=1):
         """
-        Increments usage count.
+        Increments usage count by `count` saves.
         If it's the first save of the cycle, sets the 24h timer.
         """
         user = await self.col.find_one({'id': int(id)})
@@ -168,12 +305,12 @@ class Database:
             new_reset_time = now + datetime.timedelta(hours=24)
             await self.col.update_one(
                 {'id': int(id)},
-                {'$set': {'daily_usage': 1, 'limit_reset_time': new_reset_time}}
+                {'$set': {'daily_usage': count, 'limit_reset_time': new_reset_time}}
             )
         else:
             # Just increment
             await self.col.update_one(
                 {'id': int(id)},
-                {'$inc': {'daily_usage': 1}}
+                {'$inc': {'daily_usage': count}}
             )
 db = Database(DB_URI, DB_NAME)
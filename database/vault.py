@@ -0,0 +1,53 @@
+import base64
+import hashlib
+from cryptography.fernet import Fernet, InvalidToken
+from database.cache import TTLCache
+from logger import LOGGER
+
+logger = LOGGER(__name__)
+
+# Marks values written by the vault so legacy plaintext sessions stay readable
+PREFIX = "enc1:"
+
+
+class SessionVault:
+    """
+    Encrypts Pyrogram session strings at rest and keeps decrypted copies
+    in a bounded TTL cache, so the save hot path skips Mongo and Fernet.
+    """
+
+    def __init__(self, secret, cache_size=512, cache_ttl=1800):
+        self._fernet = Fernet(self._derive_key(secret)) if secret else None
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        if not self._fernet:
+            logger.warning("SESSION_SECRET is not set, session strings are stored in plaintext.")
+
+    @staticmethod
+    def _derive_key(secret):
+        # Accept a ready Fernet key or any passphrase
+        try:
+            if len(base64.urlsafe_b64decode(secret.encode())) == 32:
+                return secret.encode()
+        except Exception:
+            pass
+        return base64.urlsafe_b64encode(hashlib.sha256(secret.encode()).digest())
+
+    def encrypt(self, session):
+        if session is None or not self._fernet:
+            return session
+        return PREFIX + self._fernet.encrypt(session.encode()).decode()
+
+    def decrypt(self, stored):
+        if not stored or not stored.startswith(PREFIX):
+            return stored
+        if not self._fernet:
+            logger.error("Encrypted session found but SESSION_SECRET is not set.")
+            return None
+        try:
+            return self._fernet.decrypt(stored[len(PREFIX):].encode()).decode()
+        except InvalidToken:
+            logger.error("Failed to decrypt session: SESSION_SECRET changed?")
+            return None
+
+    def needs_upgrade(self, stored):
+        return bool(stored) and self._fernet is not None and not stored.startswith(PREFIX)
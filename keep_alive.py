@@ -2,30 +2,88 @@
 ========================================================
 Modified & maintained by: Dhanpal Sharma
 GitHub: https://github.com/LastPerson07
-Purpose: Keep-alive HTTP server for Render / Heroku
+Purpose: Keep-alive / health HTTP server for Render / Heroku
 ========================================================
 """
 
 import os
-import threading
-from flask import Flask, Response
+import time
+import asyncio
+from aiohttp import web
+import metrics
+from logger import LOGGER
 
-app = Flask(__name__)
+logger = LOGGER(__name__)
 
-@app.route("/", methods=["GET"])
-def health():
-    return Response("OK", status=200)
+# A job that has not moved a single chunk for this long counts as stalled
+STALL_SECONDS = int(os.environ.get("HEALTH_STALL_SECONDS", "600"))
+# Mongo is pinged at most this often; probes in between reuse the result
+MONGO_CHECK_INTERVAL = 10
 
-def _run():
+_state = {"bot": None, "ready": False, "mongo": (0.0, False)}
+
+
+def mark_ready():
+    """Called once startup (Telegram login, DB check, commands) has finished."""
+    _state["ready"] = True
+
+
+async def _mongo_ok():
+    checked_at, ok = _state["mongo"]
+    if time.monotonic() - checked_at < MONGO_CHECK_INTERVAL:
+        return ok
+    from database.db import db
+    try:
+        await asyncio.wait_for(db.ping(), 3)
+        ok = True
+    except Exception as e:
+        logger.warning(f"Health check: MongoDB unreachable: {e}")
+        ok = False
+    _state["mongo"] = (time.monotonic(), ok)
+    return ok
+
+
+def _stalled_jobs():
+    from cantarella.jobs import JOBS
+    now = time.monotonic()
+    return [job.id for job in JOBS.all() if now - job.token.last_activity > STALL_SECONDS]
+
+
+async def index(request):
+    return web.Response(text="OK")
+
+
+async def healthz(request):
+    bot = _state["bot"]
+    checks = {
+        "telegram": bool(bot and bot.is_connected),
+        "mongo": await _mongo_ok(),
+        "stalled_jobs": _stalled_jobs(),
+    }
+    healthy = checks["telegram"] and checks["mongo"] and not checks["stalled_jobs"]
+    return web.json_response(checks, status=200 if healthy else 503)
+
+
+async def readyz(request):
+    if _state["ready"]:
+        return web.Response(text="ready")
+    return web.Response(text="starting", status=503)
+
+
+async def prometheus_metrics(request):
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+
+async def keep_alive(bot=None):
+    """Start the health server on the running event loop and return its runner."""
+    _state["bot"] = bot
+    app = web.Application()
+    app.router.add_get("/", index)
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/readyz", readyz)
+    app.router.add_get("/metrics", prometheus_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
     port = int(os.environ.get("PORT", 8080))
-    app.run(
-        host="0.0.0.0",
-        port=port,
-        debug=False,
-        use_reloader=False
-    )
-
-def keep_alive():
-    t = threading.Thread(target=_run)
-    t.daemon = True
-    t.start()
+    await web.TCPSite(runner, "0.0.0.0", port).start()
+    return runner
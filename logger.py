@@ -5,8 +5,14 @@ Developed by: LastPerson07 × cantarella
 Telegram: @cantarellabots | @THEUPDATEDGUYS
 """
 
+import json
+import queue
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import threading
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from config import LOG_JSON, LOG_QUEUE_SIZE
+from metrics import LOGS_DROPPED
 
 
 # ==========================================
@@ -19,19 +25,97 @@ SHORT_LOG_FORMAT = "[%(asctime)s - %(levelname)s] - %(name)s - %(message)s"
 # Detailed format (useful for debugging)
 FULL_LOG_FORMAT = "%(asctime)s - [%(levelname)s] - %(name)s - %(message)s (%(filename)s:%(lineno)d)"
 
+# Structured fields handlers may attach with extra={...}
+CONTEXT_FIELDS = ("user_id", "job_id", "stage", "duration")
 
-# Configure logging system
-logging.basicConfig(
-    level=logging.INFO,
-    format=SHORT_LOG_FORMAT,
-    handlers=[
-        # Rotate logs: maximum 5MB per file, keep last 10 backups
-        RotatingFileHandler("logs.txt", maxBytes=5 * 1024 * 1024, backupCount=10),
 
-        # Output logs to console
-        logging.StreamHandler()
-    ]
-)
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, carrying any CONTEXT_FIELDS set on the record."""
+
+    def format(self, record):
+        data = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for name in CONTEXT_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                data[name] = round(value, 4) if isinstance(value, float) else value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """
+    Keeps one in N records for high-frequency events logged with
+    extra={"sample": N}. Counting is per call site, so every noisy line
+    is thinned independently. Warnings and errors are never sampled.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        every = getattr(record, "sample", None)
+        if not every or every <= 1 or record.levelno >= logging.WARNING:
+            return True
+        site = (record.pathname, record.lineno)
+        with self._lock:
+            seen = self._seen.get(site, 0)
+            self._seen[site] = seen + 1
+        return seen % every == 0
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Hands records to the writer thread; drops (and counts) them when the queue is full."""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOGS_DROPPED.inc(level=record.levelname)
+
+    def prepare(self, record):
+        # Keep the record object (and its extra fields) for the JSON formatter;
+        # only resolve the message now, while the arguments are still current
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def _setup():
+    # Rotate logs: maximum 5MB per file, keep last 10 backups
+    file_handler = RotatingFileHandler("logs.txt", maxBytes=5 * 1024 * 1024, backupCount=10)
+    file_handler.setFormatter(JsonFormatter())
+
+    # Output logs to console
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(JsonFormatter() if LOG_JSON else logging.Formatter(SHORT_LOG_FORMAT))
+
+    # The event loop only enqueues; disk and console writes happen on the listener thread
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(SampleFilter())
+
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    # Flush whatever is still queued when the process exits
+    atexit.register(listener.stop)
+    return listener
+
+
+LISTENER = _setup()
 
 
 # Reduce noisy logs from external libraries
@@ -0,0 +1,149 @@
+"""
+Metrics Registry
+
+Lightweight in-process counters, gauges and histograms rendered in the
+Prometheus text format by the keep-alive server.
+"""
+
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+# Seconds; covers a fast DB read up to a multi-minute transfer
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_lock = threading.Lock()
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    # The exposition format's escapes for label values
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=None):
+    items = list(key) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.type = "counter"
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def render(self):
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    def __init__(self, name, help):
+        super().__init__(name, help)
+        self.type = "gauge"
+
+    def set(self, value, **labels):
+        with _lock:
+            self._values[_label_key(labels)] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.type = "histogram"
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with _lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = []
+        for key, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_format_labels(key, {'le': bound})} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, {'le': '+Inf'})} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+REGISTRY = []
+
+
+def _register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+def render():
+    """Return every registered metric in Prometheus exposition format."""
+    out = []
+    with _lock:
+        for metric in REGISTRY:
+            out.append(f"# HELP {metric.name} {metric.help}")
+            out.append(f"# TYPE {metric.name} {metric.type}")
+            out.extend(metric.render())
+    return "\n".join(out) + "\n"
+
+
+# ==========================================
+# Bot Metrics
+# ==========================================
+
+STAGE_SECONDS = _register(Histogram("bot_stage_seconds", "Time spent per transfer stage (fetch, download, upload, deliver, process_one, broadcast)."))
+DB_SECONDS = _register(Histogram("bot_db_seconds", "MongoDB operation latency."))
+RPC_SECONDS = _register(Histogram("bot_telegram_rpc_seconds", "Telegram RPC latency by method."))
+
+BYTES_TRANSFERRED = _register(Counter("bot_bytes_transferred_total", "Bytes downloaded or uploaded."))
+FLOOD_WAIT_SECONDS = _register(Counter("bot_flood_wait_seconds_total", "Seconds Telegram asked us to wait."))
+CACHE_EVENTS = _register(Counter("bot_cache_events_total", "Cache hits and misses by cache name."))
+ERRORS = _register(Counter("bot_errors_total", "Failures by stage and reason."))
+LOGS_DROPPED = _register(Counter("bot_logs_dropped_total", "Log records dropped because the log queue was full."))
+
+# Loop lag is normally sub-millisecond; anything past 100ms is a blocking call
+LOOP_LAG_SECONDS = _register(Histogram("bot_loop_lag_seconds", "How late the event loop ran the watchdog heartbeat.",
+                                       buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)))
+LOOP_LAG_QUANTILES = _register(Gauge("bot_loop_lag_quantile_seconds", "Event loop lag percentiles over the last few minutes."))
+LOOP_STALLS = _register(Counter("bot_loop_stalls_total", "Times the event loop was blocked past LOOP_LAG_THRESHOLD."))
+
+ACTIVE_JOBS = _register(Gauge("bot_active_jobs", "Save, single and batch jobs currently running."))
+MEDIA_CACHE_BYTES = _register(Gauge("bot_media_cache_bytes", "Bytes of source media kept in the local file cache."))
+WATCH_BACKLOG = _register(Gauge("bot_watch_backlog", "Watched posts waiting to be delivered, queued or deferred."))
+QUEUE_DEPTH = _register(Gauge("bot_queue_depth", "Messages waiting to be processed by running jobs."))